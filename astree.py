@@ -1,4 +1,6 @@
-from symbol_table import TypeVal, Symbol, Value, FunctionVal, Scope, DeclaratorVal, AssignmentVal
+import operator
+from symbol_table import TypeVal, Symbol, Value, ElementVal, FunctionVal, Scope, DeclaratorVal, AssignmentVal, new_array
+from symbol_table import INT_TYPE, FLOAT_TYPE
 from environment import *
 
 
@@ -7,7 +9,8 @@ class AstNode:
     Basic class for a node of abstract syntax tree.
     """
     def __init__(self):
-        self.exec_visited = False
+        self.exec_order = None  # children in the order to push into execution stack
+        self.static_type = None  # type of expression, annotated by the type checker
 
     def children(self):
         return list()
@@ -35,12 +38,22 @@ class AstNode:
     def endline(self):
         return self.linespan[1]
 
+    def sorted_children(self):
+        """
+        Children sorted in the order they are pushed into the execution stack
+        - the last child to be pushed is the first in code.
+        """
+        return tuple(sorted(self.children(), reverse=True))
+
     def add_child_executes(self, exec_stack):
         """
         Add children ast nodes into execution stack.
         """
-        for child in sorted(self.children(), reverse=True):
-            exec_stack.append(child)
+        if self.exec_order is None:
+            # the order has not been computed after parsing
+            profile_counts['child_sorts'] += 1
+            self.exec_order = self.sorted_children()
+        exec_stack.extend(self.exec_order)
 
     def show(self, depth=0):
         print('{}{}'.format('----' * depth, self))
@@ -62,12 +75,27 @@ class Id(AstNode):
     def __init__(self, id_name):
         super().__init__()
         self.id_name = id_name
+        self.level = None  # nesting level of the scope declaring the variable - see resolver.py
+        self.slot = None  # slot of the variable in the scope
+        self.declares = False  # name of a declarator - binds a new variable each time it is executed
 
     def name(self):
         return self.id_name
 
     def execute(self, env):
-        env.push_val(Symbol(name=self.id_name, astnode=self))
+        symbol = None
+        if self.declares:
+            symbol = Symbol(name=self.id_name, astnode=self)  # may shadow a variable of an outer scope
+            if env.watches:
+                symbol.watch = env.watches.get((id(self), self.id_name))
+        elif self.slot is not None:
+            symbol = env.scope.display[self.level][self.slot]
+        if symbol is None:
+            # names not resolved into slots (such as declarators) are looked up by name
+            symbol = env.scope.getsymbol(self.id_name)
+            if symbol is None:
+                symbol = Symbol(name=self.id_name, astnode=self)
+        env.push_val(symbol)
         env.pop_exec()  # pop self
         return True, env
 
@@ -83,9 +111,10 @@ class Constant(AstNode):
         super().__init__()
         self.value = value
         self.const_type = 'int' if isinstance(value, int) else 'float'
+        self.const_val = Value(TypeVal(self.const_type), value)  # values are never modified in place
 
     def execute(self, env):
-        env.push_val(Value(TypeVal(self.const_type), self.value))
+        env.push_val(self.const_val)
         env.pop_exec()
         return True, env
 
@@ -101,9 +130,10 @@ class Op(AstNode):
     def __init__(self, op):
         super().__init__()
         self.op = op
+        self.op_val = Value(TypeVal('op'), op)
 
     def execute(self, env):
-        env.push_val(Value(TypeVal('op'), self.op))
+        env.push_val(self.op_val)
         env.pop_exec()
         return True, env
 
@@ -118,9 +148,10 @@ class String(AstNode):
     def __init__(self, string):
         super().__init__()
         self.string = string
+        self.string_val = Value(TypeVal('string'), string)
 
     def execute(self, env):
-        env.push_val(Value(TypeVal('string'), self.string))
+        env.push_val(self.string_val)
         env.pop_exec()
         return True, env
 
@@ -170,26 +201,32 @@ class UnaryExpr(AstNode):
             return False, env
 
         exec_done = False
-        if not self.exec_visited:
+        if not env.is_visited(self):
             env.push_exec(self.operand)
-            self.exec_visited = True
+            env.visit(self)
         else:
             operand = env.pop_val()
-            operand_val = env.scope.getvalue(operand.name)
-
             inc = 1 if self.op_name == '++' else -1
+            if isinstance(operand, Symbol):
+                operand_val = operand.value
+                if operand_val.val is None:
+                    raise CRuntimeErr('Variable {} not initialized!'.format(operand.name), env)
+                if not self.is_postfix:
+                    operand.set_value(Value(vtype=operand_val.vtype, val=operand_val.val + inc), env.currline)
+                    operand_val = operand.value
+                    env.record_write(operand)
+            else:  # array element
+                operand_val = Value(operand.vtype, operand.val)
+                if not self.is_postfix:
+                    operand.store(operand.val + inc)
+                    operand_val = Value(operand.vtype, operand.val)
+                    env.record_write(operand)
             if self.is_postfix:
-                # postpone update
-                env.book_update({
-                    'exec_target': env.scope.set_value,
-                    'arg': (operand.name, Value(vtype=operand_val.vtype, val=operand_val.val + inc), env.currline),
-                })
-            else:
-                env.scope.set_value(operand.name, operand + inc, env.currline)
+                env.book_update(operand, inc, env.currline)  # postpone update until the sequence point
 
             env.push_val(operand_val)  # indicate that the operation has been made successfuly
             exec_done = True
-            self.exec_visited = False
+            env.leave(self)
             env.pop_exec()
         return exec_done, env
 
@@ -205,6 +242,7 @@ class FunctionCall(AstNode):
         super().__init__()
         self.func_name = func_name  # string literal
         self.argument_list = argument_list
+        self.native = None  # python callable, if a builtin function is called - see cbuiltins.py
 
     def children(self):
         ch_nodes = []
@@ -221,103 +259,120 @@ class FunctionCall(AstNode):
 
         funcname = self.func_name.name()
 
-        # handle printf - a hack!
-        if funcname == 'printf':
-            if not self.exec_visited:
-                env.push_exec(self.argument_list)
-                self.exec_visited = True
-                return False, env
-            else:
-                if env.currline >= self.endline():  # call has been made!
-                    args = env.pop_val()
-                    string_lit = args[0].val
-                    if len(args) == 1:
-                        print(string_lit)
-                    else:
-                        if '%d' in string_lit:
-                            string_lit = string_lit.replace('%d', str(int(args[1].val)))
-                        else:
-                            string_lit = string_lit.replace('%f', str(float(args[1].val)))
-                        print(string_lit)
-                env.push_val('Printf')
-                env.pop_exec()  # function call done
-                self.exec_visited = False
-                return True, env
-
-        # handle any other funcitons
-        if not self.exec_visited:
+        if self.native is not None:  # builtin function
+            if not env.is_visited(self):
+                env.visit(self)
+                if len(self.argument_list) != 0:
+                    env.push_exec(self.argument_list)
+                    return False, env
+            if env.currline < self.endline():
+                return False, env  # arguments on the following lines
+            return self.call_native(env)
+
+        # the function body has been executed (or returned) in the activation made by this call
+        activation = env.activation
+        if activation.call_node is self and len(env.exec_stack) == activation.stack_base:
+            return self.finish_call(env)
+
+        # handle any other funcitons - the functions have been registered when the program was loaded
+        if not env.is_visited(self):
+            env.visit(self)
             if len(self.argument_list) != 0:
                 env.push_exec(self.argument_list)
-            # defer the execution until register is done - register first
-            fundef_node = env.scope.getsymbol(funcname).astnode
-            env.push_exec(fundef_node)
-            env.scope.return_lineno = env.currline  # return after defining!
-            env.currline = fundef_node.startline()
-            self.exec_visited = True
-            self.wait_return = False
-        else:
-            if env.currline >= self.startline():  # call has been made! - huge assumption that call is one-liner
-                if not self.wait_return:
-                    # function has not been executed and returned
-                    if env.scope.getvalue(funcname) is None:
-                        env.scope.show()
-                        raise CRuntimeErr('No function named {} defined.'.format(funcname), env)
-
-                    funcval = env.scope.getvalue(funcname)
-                    args = []
-                    if len(self.argument_list) > 0:
-                        args = env.pop_val()
-                    # args = self.argument_list.evaluate()
-                    params = funcval.params
-                    if len(args) != len(params):
-                        if not (len(params) == 1 and params[0][0].typename == 'void'):
-                            # exception for single void case
-                            raise CRuntimeErr('Argument number mismatch', env)
-
-                    func_scope = Scope({})  # set arguments
-                    func_scope.parent_scope = env.scope.root_scope()  # root scope is the parent
-                    func_scope.return_lineno = self.endline()
-                    func_scope.return_scope = env.scope
-                    func_scope.return_type = funcval.rtype
-
-                    # type check the arguments with prameter declarations
-                    # args are Values and params are (DeclaratorVal, TypeVal)s
-                    for arg, param in zip(args, params):
-                        param_type, param_dec = param
-                        if not arg.vtype.castable(param_type):
-                            raise CRuntimeErr('Argument type mismatch {}, {}'.format(arg, param), env)
-                        arg.cast(param_type)
-
-                        # bind argument values to their symbols
-                        argsymbol = param_dec.getsymbol()
-                        func_scope.add_symbol(
-                                symbol_name=argsymbol.name,
-                                symbol_info=argsymbol)
-                        func_scope.set_value(argsymbol.name, arg, env.currline)
-
-                    # start executing body
-                    body_ast = env.scope.getsymbol(funcname).value.body
-                    env.push_exec(body_ast)
-                    env.scope = func_scope
-                    env.currline = body_ast.startline()
-                    env.call_stack.append(funcval)
-                    self.wait_return = True
-                else:  # execution has been done and returned
-                    self.wait_return = False
-                    exec_done = True
-                    retval = env.scope.get_return_val()
+                return False, env
+        if env.currline >= self.startline():  # call has been made! - huge assumption that call is one-liner
+            self.start_call(env)
+        return exec_done, env
 
-                    if retval is not None:  # there may not be any return value
-                        if not retval.vtype.castable(env.scope.return_type):
-                            raise CRuntimeErr('Wrong return type! {} {}'.format(retval, env.scope.return_type), env)
-                    env.push_val(retval)  # store the return value
+    def start_call(self, env):
+        """
+        Binds the evaluated arguments into a new function scope and starts executing the body.
+        """
+        func_symbol = env.root_scope.getsymbol(self.func_name.name())
+        if func_symbol is None:
+            raise CRuntimeErr('No function named {} defined.'.format(self.func_name.name()), env)
+        funcval = func_symbol.value
+        args = []
+        if len(self.argument_list) > 0:
+            args = env.pop_val()
+        params = funcval.params
+        checked = self.static_type is not None  # arguments have been type checked
+        if not checked and len(args) != len(params):
+            raise CRuntimeErr('Argument number mismatch', env)
+
+        func_scope = Scope({}, func_symbol.astnode.nslots)  # set arguments
+        func_scope.parent_scope = env.root_scope  # root scope is the parent
+        func_scope.return_lineno = self.endline()
+        func_scope.return_scope = env.scope
+        func_scope.return_type = funcval.rtype
+
+        # type check the arguments with prameter declarations
+        # args are Values and params are (TypeVal, name)s
+        for slot, (arg, param) in enumerate(zip(args, params)):
+            param_type, param_name = param
+            if not checked and not arg.vtype.castable(param_type):
+                raise CRuntimeErr('Argument type mismatch {}, {}'.format(arg, param), env)
+            if param_type.sum_arr_ptr() == 0:
+                arg = arg.casted(param_type)
+            # arrays are passed by reference - the elements are neither copied nor casted
+
+            # bind argument values to new symbols of this call
+            argsymbol = Symbol(name=param_name, astnode=func_symbol.astnode)
+            if env.watches:
+                argsymbol.watch = env.watches.get((id(func_symbol.astnode), param_name))
+            func_scope.add_symbol(
+                    symbol_name=argsymbol.name,
+                    symbol_info=argsymbol)
+            func_scope.slots[slot] = argsymbol  # parameters take the first slots
+            argsymbol.set_value(arg, env.currline)
+            env.record_write(argsymbol)
+        env.sequence_point()  # the arguments are done before the call
+
+        # start executing body in a new activation
+        body_ast = funcval.body
+        env.push_activation(Activation(
+                call_node=self,
+                funcval=funcval,
+                func_scope=func_scope,
+                stack_base=len(env.exec_stack),
+                value_base=len(env.value_stack)))
+        env.push_exec(body_ast)
+        env.scope = func_scope
+        env.currline = body_ast.startline()
+
+    def call_native(self, env):
+        args = env.pop_val() if len(self.argument_list) > 0 else []
+        vals = [arg.val for arg in args]
+        if None in vals:
+            raise CRuntimeErr('Variable not initialized!', env)
+        env.sequence_point()  # the arguments are done before the call
+        result = self.native(env.out, *vals)
+        env.push_val(None if result is None else Value(self.static_type, result))
+        env.pop_exec()  # function call done
+        env.leave(self)
+        return True, env
 
-                    env.currline = env.scope.return_lineno
-                    env.scope = env.scope.return_scope  # reset to new scope
-                    env.pop_exec()  # function call done
-                    env.call_stack.pop()
-                    self.exec_visited = False
-        return exec_done, env
+    def finish_call(self, env):
+        """
+        Returns to the caller after the function body is done.
+        """
+        activation = env.pop_activation()
+        func_scope = activation.func_scope
+        retval = func_scope.get_return_val()
+
+        if retval is not None and func_scope.return_type.typename != 'void':  # there may not be any return value
+            if self.static_type is None and not retval.vtype.castable(func_scope.return_type):
+                raise CRuntimeErr('Wrong return type! {} {}'.format(retval, func_scope.return_type), env)
+            retval = retval.casted(func_scope.return_type)
+        elif retval is None:
+            retval = Value(func_scope.return_type)  # not initialized - an error once it is used
+        env.push_val(retval)  # store the return value
+
+        env.currline = func_scope.return_lineno
+        env.scope = func_scope.return_scope  # reset to new scope
+        env.pop_exec()  # function call done
+        env.leave(self)
+        return True, env
 
 
 class ArgList(AstNode, list):
@@ -335,22 +390,22 @@ class ArgList(AstNode, list):
         Evaluates a list of assignment expressions.
         """
         exec_done = False
-        if not self.exec_visited:
+        if not env.is_visited(self):
             self.add_child_executes(env.exec_stack)
-            self.exec_visited = True
+            env.visit(self)
         else:
             if env.currline >= self.endline():
                 arglist = []
                 for _ in range(len(self)):
                     argval = env.pop_val()
                     if isinstance(argval, Symbol):
-                        argval = env.scope.getvalue(argval.name)
+                        argval = argval.value
                     arglist.append(argval)
                 arglist.reverse()
 
                 env.push_val(arglist)
                 exec_done = True
-                self.exec_visited = False
+                env.leave(self)
                 env.pop_exec()
         return exec_done, env
 
@@ -380,32 +435,35 @@ class ArrayReference(AstNode):
             return False, env
 
         exec_done = False
-        if not self.exec_visited:
+        if not env.is_visited(self):
             self.add_child_executes(env.exec_stack)
-            self.exec_visited = True
+            env.visit(self)
         else:
             if env.currline >= self.endline():
                 idx_val = env.pop_val()[0]
                 name_val = env.pop_val()
 
-            arr_val = env.scope.getvalue(name_val.name)
+            arr_val = name_val.value
             if isinstance(idx_val, Symbol):
-                idx_val = env.scope.getvalue(idx_val.name)  # get value from variable
+                idx_val = idx_val.value  # get value from variable
 
             # check if it is an array
             if arr_val.vtype.array == 0:
-                raise CRuntimeErr('Name {} not array!'.format(arr_name), env)
+                raise CRuntimeErr('Name {} not array!'.format(self.name), env)
 
             idx = idx_val.val
+            if idx is None:
+                raise CRuntimeErr('Variable not initialized!', env)
             if len(arr_val.val) <= idx:
                 raise CRuntimeErr('Index error - array length {}, idx {}'.format(len(arr_val.val), idx), env)
 
-            array_access_val = arr_val.val[idx]  # retrieve the actual value
+            # element value refers to the array storage, so that it can be assigned to
+            array_access_val = ElementVal(TypeVal(arr_val.vtype.typename), arr_val.val, idx)
 
             env.push_val(array_access_val)
             env.pop_exec()
             exec_done = True
-            self.exec_visited = False
+            env.leave(self)
         return exec_done, env
 
     def children(self):
@@ -442,26 +500,82 @@ class TypeCast(AstNode):
             return False, env
 
         exec_done = False
-        if not self.exec_visited:
+        if not env.is_visited(self):
             self.add_child_executes(env.exec_stack)
-            self.exec_visited = True
+            env.visit(self)
         else:
             value = env.pop_val()
             if isinstance(value, Symbol):
-                value = env.scope.getvalue(value.name)
+                value = value.value
             cast_type = env.pop_val()  # TypeVal
 
-            if not value.vtype.castable(cast_type):
+            if self.static_type is None and not value.vtype.castable(cast_type):
                 raise CRuntimeErr('Type cannot be casted {}, {}'.format(value, cast_type), env)
 
-            value.cast(cast_type)
-            env.push_val(value)
+            env.push_val(value.casted(cast_type))
             env.pop_exec()
             exec_done = True
-            self.exec_visited = False
+            env.leave(self)
         return exec_done, env
 
 
+def typed_result(fn, rtype):
+    return lambda a, b: Value(rtype, fn(a, b))
+
+
+def converted_result(fn, rtype, convert):
+    return lambda a, b: Value(rtype, convert(fn(a, b)))
+
+
+def truth_result(fn):
+    return lambda a, b: Value(INT_TYPE, 1 if fn(a, b) else 0)
+
+
+def build_binop_handlers():
+    """
+    Builds the dispatch table of binary operators:
+    operator -> {(type of left operand, type of right operand): handler}.
+    Handlers take the raw operand values and return the result Value.
+    Only int and float operands have handlers - any other pair of types is not castable.
+    """
+    numeric = (INT_TYPE, FLOAT_TYPE)
+    handlers = {}
+    for op, fn in (('+', operator.add), ('-', operator.sub), ('*', operator.mul)):
+        handlers[op] = {(ltype, rtype): typed_result(fn, INT_TYPE if ltype is rtype is INT_TYPE else FLOAT_TYPE)
+                        for ltype in numeric for rtype in numeric}
+    handlers['/'] = {(ltype, rtype): typed_result(operator.truediv, FLOAT_TYPE)
+                     for ltype in numeric for rtype in numeric}
+    handlers['%'] = {(ltype, rtype): converted_result(operator.mod, INT_TYPE, int)
+                     for ltype in numeric for rtype in numeric}
+    handlers['%'][(INT_TYPE, INT_TYPE)] = typed_result(operator.mod, INT_TYPE)
+
+    truth_ops = (
+        ('<', operator.lt), ('>', operator.gt), ('<=', operator.le), ('>=', operator.ge),
+        ('==', operator.eq), ('!=', operator.ne),
+        ('&&', lambda a, b: a and b), ('||', lambda a, b: a or b),
+    )
+    for op, fn in truth_ops:
+        handlers[op] = {(ltype, rtype): truth_result(fn) for ltype in numeric for rtype in numeric}
+    return handlers
+
+
+binop_handlers = build_binop_handlers()
+
+
+def has_postfix(node):
+    """
+    Whether the expression has postfix increments or decrements, ex) i++ * 2
+    """
+    nodes = [node]
+    while len(nodes) > 0:
+        node = nodes.pop()
+        if isinstance(node, UnaryExpr) and node.is_postfix:
+            return True
+        if isinstance(node, AstNode):
+            nodes.extend(node.children())
+    return False
+
+
 class BinaryOp(AstNode):
     """
     Binary operation.
@@ -471,6 +585,12 @@ class BinaryOp(AstNode):
         self.op = op
         self.arg1 = arg1
         self.arg2 = arg2
+        # the operator is resolved into its handlers once, when parsed
+        self.op_name = op.op if isinstance(op, Op) else op
+        self.handlers = binop_handlers.get(self.op_name)
+        self.handler = None  # handler of the operand types, if known before execution
+        # the right operand runs after a sequence point if the left one decides the result or has postfix updates
+        self.phased = self.op_name in ('&&', '||') or has_postfix(arg1)
 
     def children(self):
         children_nodes = []
@@ -482,28 +602,56 @@ class BinaryOp(AstNode):
             children_nodes.append(self.arg2)
         return children_nodes
 
+    def sorted_children(self):
+        # the operator node needs not be executed
+        return tuple(sorted([self.arg1, self.arg2], reverse=True))
+
     def execute(self, env):
         if env.currline < self.startline() or env.currline > self.endline():
             # execution line number not reached yet
             return False, env
 
         exec_done = False
-        if not self.exec_visited:
-            self.add_child_executes(env.exec_stack)
-            self.exec_visited = True
+        if not env.is_visited(self):
+            if self.phased:
+                # the right operand is scheduled after the left one is known
+                env.push_exec(self.arg1)
+                env.visit(self, 'left')
+            else:
+                self.add_child_executes(env.exec_stack)
+                env.visit(self)
+        elif env.node_state(self) == 'left':
+            arg1_val = env.pop_val()
+            if isinstance(arg1_val, Symbol):
+                arg1_val = arg1_val.value
+            if arg1_val.val is None:
+                raise CRuntimeErr('Variable {} not initialized!'.format(self.arg1), env)
+            env.sequence_point()  # the updates of the left operand are seen by the right one
+
+            if self.op_name not in ('&&', '||'):
+                env.push_val(arg1_val)
+                env.push_exec(self.arg2)
+                env.visit(self, 'right')
+            elif bool(arg1_val.val) == (self.op_name == '||'):
+                # the left operand decides the result
+                env.push_val(Value(INT_TYPE, 1 if arg1_val.val else 0))
+                env.pop_exec()
+                exec_done = True
+                env.leave(self)
+            else:
+                env.push_val(arg1_val)
+                env.push_exec(self.arg2)
+                env.visit(self, 'right')
         else:
             # retrieve the operands
-            op_val = env.pop_val()
             arg2_val = env.pop_val()
             arg1_val = env.pop_val()
 
-
             # get the values
             if isinstance(arg1_val, Symbol):
-                arg1_val = env.scope.getvalue(arg1_val.name)
+                arg1_val = arg1_val.value
             if isinstance(arg2_val, Symbol):
-                arg2_val = env.scope.getvalue(arg2_val.name)
-            op_type = op_val.val
+                arg2_val = arg2_val.value
 
             # check if both operands are proper
             if arg1_val.val is None:
@@ -512,81 +660,20 @@ class BinaryOp(AstNode):
                 raise CRuntimeErr('Variable {} not initialized!'.format(self.arg2), env)
 
             # DO THE MATH
-            if op_type == '*':
-                res = arg1_val.val * arg2_val.val
-                if not arg1_val.vtype.castable(arg2_val.vtype):
-                    raise CRuntimeErr('Type not castable {} and {}'.format(arg1_val.vtype, arg2_val.vtype))
-
-                if arg1_val.vtype.typename == 'int' and arg2_val.vtype.typename == 'int':
-                    vtype = TypeVal('int')
-                else:
-                    vtype = TypeVal('float')
-            elif op_type == '+':
-                res = arg1_val.val + arg2_val.val
-                if not arg1_val.vtype.castable(arg2_val.vtype):
-                    raise CRuntimeErr('Type not castable {} and {}'.format(arg1_val.vtype, arg2_val.vtype))
-                if arg1_val.vtype.typename == 'int' and arg2_val.vtype.typename == 'int':
-                    vtype = TypeVal('int')
-                else:
-                    vtype = TypeVal('float')
-            elif op_type == '-':
-                res = arg1_val.val - arg2_val.val
-                if not arg1_val.vtype.castable(arg2_val.vtype):
-                    raise CRuntimeErr('Type not castable {} and {}'.format(arg1_val.vtype, arg2_val.vtype))
-                if arg1_val.vtype.typename == 'int' and arg2_val.vtype.typename == 'int':
-                    vtype = TypeVal('int')
-                else:
-                    vtype = TypeVal('float')
-            elif op_type == '%':
-                res = arg1_val.val % arg2_val.val
-                vtype = TypeVal('int')
-            elif op_type == '/':
-                res = arg1_val.val / arg2_val.val
-                vtype = TypeVal('float')
-            elif op_type == '&&':
-                res = 1 if arg1_val.val and arg2_val.val else 0
-                if not arg1_val.vtype.castable(arg2_val.vtype):
-                    raise CRuntimeErr('Type not castable {} and {}'.format(arg1_val.vtype, arg2_val.vtype))
-                vtype = TypeVal('int')
-            elif op_type == '||':
-                res = 1 if arg1_val.val or arg2_val.val else 0
-                if not arg1_val.vtype.castable(arg2_val.vtype):
-                    raise CRuntimeErr('Type not castable {} and {}'.format(arg1_val.vtype, arg2_val.vtype))
-                vtype = TypeVal('int')
-            elif op_type == '<':
-                res = 1 if arg1_val.val < arg2_val.val else 0
-                if not arg1_val.vtype.castable(arg2_val.vtype):
-                    raise CRuntimeErr('Type not castable {} and {}'.format(arg1_val.vtype, arg2_val.vtype))
-                vtype = TypeVal('int')
-            elif op_type == '>':
-                res = 1 if arg1_val.val > arg2_val.val else 0
-                if not arg1_val.vtype.castable(arg2_val.vtype):
-                    raise CRuntimeErr('Type not castable {} and {}'.format(arg1_val.vtype, arg2_val.vtype))
-                vtype = TypeVal('int')
-            elif op_type == '>=':
-                res = 1 if arg1_val.val >= arg2_val.val else 0
-                if not arg1_val.vtype.castable(arg2_val.vtype):
-                    raise CRuntimeErr('Type not castable {} and {}'.format(arg1_val.vtype, arg2_val.vtype))
-                vtype = TypeVal('int')
-            elif op_type == '<=':
-                res = 1 if arg1_val.val <= arg2_val.val else 0
-                if not arg1_val.vtype.castable(arg2_val.vtype):
-                    raise CRuntimeErr('Type not castable {} and {}'.format(arg1_val.vtype, arg2_val.vtype))
-                vtype = TypeVal('int')
-            elif op_type == '==':
-                res = 1 if arg1_val.val == arg2_val.val else 0
-                if not arg1_val.vtype.castable(arg2_val.vtype):
-                    raise CRuntimeErr('Type not castable {} and {}'.format(arg1_val.vtype, arg2_val.vtype))
-                vtype = TypeVal('int')
-            else:
-                raise CRuntimeErr('Invalid binary operator {}'.format(op_val), env)
-
-            res_value = Value(vtype, res)
-            res_value.cast(vtype)
-            env.push_val(res_value)
+            handler = self.handler
+            if handler is None:  # operand types are checked at runtime
+                if self.handlers is None:
+                    raise CRuntimeErr('Invalid binary operator {}'.format(self.op_name), env)
+                handler = self.handlers.get((arg1_val.vtype, arg2_val.vtype))
+                if handler is None:
+                    raise CRuntimeErr('Type not castable {} and {}'.format(arg1_val.vtype, arg2_val.vtype), env)
+            try:
+                env.push_val(handler(arg1_val.val, arg2_val.val))
+            except ZeroDivisionError:
+                raise CRuntimeErr('Division by zero', env)
             env.pop_exec()
             exec_done = True
-            self.exec_visited = False
+            env.leave(self)
         return exec_done, env
 
 
@@ -616,28 +703,36 @@ class Assignment(AstNode):
             return False, env
 
         exec_done = False
-        if not self.exec_visited:
+        if not env.is_visited(self):
             self.add_child_executes(env.exec_stack)
-            self.exec_visited = True
+            env.visit(self)
         else:
             val = env.pop_val()
             lval = env.pop_val()
+            if isinstance(val, Symbol):
+                val = val.value  # ex) a = b
             assert isinstance(val, Value)
 
             if isinstance(lval, Symbol):
-                if env.scope.getsymbol(lval.name) is None:
-                    raise CRuntimeErr('Name {} does not exist!'.format(sym.name), env)
+                if lval.value is None:  # declared symbols always hold a value
+                    raise CRuntimeErr('Name {} does not exist!'.format(lval.name), env)
                 # assign value to the name
-                env.scope.set_value(lval.name, val, env.currline)
+                lval.set_value(val, env.currline)
+                env.record_write(lval)
+            elif isinstance(lval, ElementVal):
+                # array access - write into the array storage
+                if val.val is None:
+                    raise CRuntimeErr('Variable not initialized!', env)
+                lval.store(val.val)
+                env.record_write(lval)
             elif isinstance(lval, Value):
-                # array access, for instance
                 lval.val = val.val
                 lval.cast(lval.vtype)
 
             env.push_val('AssignmentRet')  # indicate that assignment has been done properly
             env.pop_exec()
             exec_done = True
-            self.exec_visited = False
+            env.leave(self)
         return exec_done, env
 
 
@@ -666,9 +761,19 @@ class Expression(AstNode, list):
             return False, env
 
         exec_done = False
-        if not self.exec_visited:
-            self.add_child_executes(env.exec_stack)
-            self.exec_visited = True
+        state = env.node_state(self)
+        if state is None:
+            if len(self) > 1:
+                # comma operator - the operands run one by one, with a sequence point after each
+                env.push_exec(self[0])
+                env.visit(self, 1)
+            else:
+                self.add_child_executes(env.exec_stack)
+                env.visit(self)
+        elif state is not True and state < len(self):
+            env.sequence_point()
+            env.push_exec(self[state])
+            env.visit(self, state + 1)
         else:
             asmt_vals = []
             for _ in range(len(self)):
@@ -681,7 +786,7 @@ class Expression(AstNode, list):
             env.push_val(asmt_vals)
             env.pop_exec()
             exec_done = True
-            self.exec_visited = False
+            env.leave(self)
         return exec_done, env
 
 
@@ -695,6 +800,7 @@ class Declaration(AstNode):
         super().__init__()
         self.declaration_spec = declaration_spec
         self.init_dec_list = init_dec_list
+        self.slots = {}  # declared name -> slot in the scope
 
     def children(self):
         ch_nodes = []
@@ -710,9 +816,9 @@ class Declaration(AstNode):
             return False, env
 
         exec_done = False
-        if not self.exec_visited:
+        if not env.is_visited(self):
             self.add_child_executes(env.exec_stack)
-            self.exec_visited = True
+            env.visit(self)
         else:
             if env.currline >= self.endline():
                 init_dec_vals = env.pop_val()  # list of init declaration list
@@ -726,32 +832,39 @@ class Declaration(AstNode):
                         decval, init_val = decval
                     symbol = decval.getsymbol()
                     pointer = decval.pointer_val
-                    vtype = TypeVal(typename=type_val.typename)
                     # pointers can be separately declared
                     # ex) int *x, y z -> x is a pointer, y, z are not
-                    vtype.ptr = pointer if pointer is not None else 0
+                    vtype = TypeVal(
+                            typename=type_val.typename,
+                            ptr=pointer if pointer is not None else 0,
+                            array=1 if decval.dec_type == 'array' else 0)
 
                     # if initializing variable already exists, there is no need to create a new value object
                     value = Value(vtype=vtype)
                     if init_val is not None:
-                        value = init_val
+                        if isinstance(init_val, Symbol):
+                            init_val = init_val.value  # ex) int a = b
+                        value = init_val.casted(vtype)
 
                     # handle array declarations - ex) int mark[4];
                     if decval.dec_type == 'array':
-                        vtype.array = 1
                         value.arr_size = decval.arr_size_val.val  # array size
-                        value.val = [Value(TypeVal(vtype.typename)) for _ in range(value.arr_size)]  # default array init
+                        value.val = new_array(vtype.typename, value.arr_size)  # zero-initialized array
 
-                    if env.scope.getsymbol(symbol.name) is None:
-                        env.scope.add_symbol(symbol.name, symbol)
-                        env.scope.set_value(symbol.name, value, env.currline)
-                    else:
+                    bound = env.scope.symbol_table.get(symbol.name)
+                    if bound is not None and bound.astnode is not symbol.astnode:
                         raise CRuntimeErr('Symbol "{}" already bound in this scope'.format(symbol.name), env)
+                    # a declaration executed again by a loop binds the variable anew
+                    env.scope.symbol_table[symbol.name] = symbol
+                    env.scope.slots[self.slots[symbol.name]] = symbol
+                    symbol.set_value(value, env.currline)
+                    env.record_write(symbol)
 
+                env.sequence_point()
                 env.push_val('DeclarationRet')
                 env.pop_exec()
                 exec_done = True
-                self.exec_visited = False
+                env.leave(self)
         return exec_done, env
 
 
@@ -768,15 +881,15 @@ class DeclarationSpecifiers(AstNode, list):
             return False, env
 
         exec_done = False
-        if not self.exec_visited:
+        if not env.is_visited(self):
             self.add_child_executes(env.exec_stack)
-            self.exec_visited = True
+            env.visit(self)
         else:
             dec_spec = env.pop_val()
             env.push_val(dec_spec)
             env.pop_exec()
             exec_done = True
-            self.exec_visited = False
+            env.leave(self)
         return exec_done, env
 
     def children(self):
@@ -827,9 +940,9 @@ class Declarator(AstNode):
             return False, env
 
         exec_done = False
-        if not self.exec_visited:
+        if not env.is_visited(self):
             self.add_child_executes(env.exec_stack)
-            self.exec_visited = True
+            env.visit(self)
         else:
             if env.currline >= self.endline():
                 of_val = env.pop_val()
@@ -840,7 +953,7 @@ class Declarator(AstNode):
                 env.push_val(DeclaratorVal('default', of_val, pointer_val))
                 env.pop_exec()
                 exec_done = True
-                self.exec_visited = False
+                env.leave(self)
         return exec_done, env
 
     def children(self):
@@ -873,9 +986,9 @@ class ArrayDeclarator(Declarator):
             return False, env
 
         exec_done = False
-        if not self.exec_visited:
+        if not env.is_visited(self):
             self.add_child_executes(env.exec_stack)
-            self.exec_visited = True
+            env.visit(self)
         else:
             if env.currline >= self.endline():
                 assignment_expr_val = env.pop_val()
@@ -889,7 +1002,7 @@ class ArrayDeclarator(Declarator):
                 env.push_val(dec_val)
                 env.pop_exec()
                 exec_done = True
-                self.exec_visited = False
+                env.leave(self)
         return exec_done, env
 
 
@@ -907,9 +1020,9 @@ class FuncDeclarator(Declarator):
             return False, env
 
         exec_done = False
-        if not self.exec_visited:
+        if not env.is_visited(self):
             self.add_child_executes(env.exec_stack)
-            self.exec_visited = True
+            env.visit(self)
         else:
             if env.currline >= self.endline():
                 # function prameter list
@@ -931,7 +1044,7 @@ class FuncDeclarator(Declarator):
                 env.push_val(dec_val)
                 env.pop_exec()
                 exec_done = True
-                self.exec_visited = False
+                env.leave(self)
         return exec_done, env
 
     def children(self):
@@ -968,9 +1081,9 @@ class InitDeclarator(AstNode):
             return False, env
 
         exec_done = False
-        if not self.exec_visited:
+        if not env.is_visited(self):
             self.add_child_executes(env.exec_stack)
-            self.exec_visited = True
+            env.visit(self)
         else:
             if env.currline >= self.endline():
                 init_val = env.pop_val()
@@ -979,7 +1092,7 @@ class InitDeclarator(AstNode):
                 env.push_val((declarator_val, init_val))  # pair of (Symbol, Value)
                 env.pop_exec()
                 exec_done = True
-                self.exec_visited = False
+                env.leave(self)
         return exec_done, env
 
 
@@ -1003,9 +1116,9 @@ class InitDeclaratorList(AstNode, list):
             return False, env
 
         exec_done = False
-        if not self.exec_visited:
+        if not env.is_visited(self):
             self.add_child_executes(env.exec_stack)
-            self.exec_visited = True
+            env.visit(self)
         else:
             if env.currline >= self.endline():
                 initdec_vallist = []
@@ -1015,7 +1128,7 @@ class InitDeclaratorList(AstNode, list):
                 env.push_val(initdec_vallist)
                 env.pop_exec()
                 exec_done = True
-                self.exec_visited = False
+                env.leave(self)
         return exec_done, env
 
 
@@ -1063,9 +1176,9 @@ class ParameterDeclaration(AstNode):
             return False, env
 
         exec_done = False
-        if not self.exec_visited:
+        if not env.is_visited(self):
             self.add_child_executes(env.exec_stack)
-            self.exec_visited = True
+            env.visit(self)
         else:
             if env.currline >= self.endline():
                 declarator = None
@@ -1073,15 +1186,15 @@ class ParameterDeclaration(AstNode):
                     declarator = env.pop_val()
                 dec_specs = env.pop_val()  # TypeVal
                 if declarator is not None:
-                    if declarator.pointer_val is not None:
-                        dec_specs.ptr = declarator.pointer_val
-                    if declarator.dec_type == 'array':
-                        dec_specs.array = 1
+                    dec_specs = TypeVal(
+                            dec_specs.typename,
+                            ptr=declarator.pointer_val if declarator.pointer_val is not None else dec_specs.ptr,
+                            array=1 if declarator.dec_type == 'array' else dec_specs.array)
 
                 env.push_val((dec_specs, declarator))
                 env.pop_exec()
                 exec_done = True
-                self.exec_visited = False
+                env.leave(self)
         return exec_done, env
 
 
@@ -1119,9 +1232,9 @@ class ParameterList(AstNode, list):
             return False, env
 
         exec_done = False
-        if not self.exec_visited:
+        if not env.is_visited(self):
             self.add_child_executes(env.exec_stack)
-            self.exec_visited = True
+            env.visit(self)
         else:
             if env.currline >= self.endline():
                 param_list = []
@@ -1132,7 +1245,7 @@ class ParameterList(AstNode, list):
                 env.push_val(param_list)
                 env.pop_exec()
                 exec_done = True
-                self.exec_visited = False
+                env.leave(self)
         return exec_done, env
 
     def children(self):
@@ -1149,6 +1262,7 @@ class CompoundStatement(AstNode, list):
     """
     def __init__(self):
         super().__init__()
+        self.return_line = None  # line to continue from after the block, if known before execution
 
     def children(self):
         children_nodes = []
@@ -1163,9 +1277,9 @@ class CompoundStatement(AstNode, list):
             return False, env
 
         exec_done = False
-        if not self.exec_visited:
+        if not env.is_visited(self):
             self.add_child_executes(env.exec_stack)
-            self.exec_visited = True
+            env.visit(self)
         else:
             if env.currline >= self.endline():
                 # compound statment ignores each statements' execution results
@@ -1173,10 +1287,12 @@ class CompoundStatement(AstNode, list):
                     env.pop_val()  # simply pop out all of them
 
                 env.pop_exec()
-                if env.scope.return_lineno is not None:
+                if self.return_line is not None:
+                    env.currline = self.return_line
+                elif env.scope.return_lineno is not None:
                     env.currline = env.scope.return_lineno
                 exec_done = True
-                self.exec_visited = False
+                env.leave(self)
         return exec_done, env
 
 
@@ -1195,6 +1311,7 @@ class SelectionStatement(Statement):
         self.if_cond = if_cond
         self.if_expr = if_expr
         self.else_expr = else_expr
+        self.nslots = 0  # number of variables declared in the block scope - no scope is created if 0
 
     def children(self):
         ch_nodes = []
@@ -1209,52 +1326,59 @@ class SelectionStatement(Statement):
             ch_nodes.append(self.else_expr)
         return ch_nodes
 
+    def exit_scope(self, env):
+        env.currline = self.endline()
+        if self.nslots > 0:
+            env.scope = env.scope.return_scope  # return to parent scope
+
     def execute(self, env):
         if env.currline < self.startline() or env.currline > self.endline():
             # execution line number not reached yet
             return False, env
 
         exec_done = False
-        if not self.exec_visited:
+        if not env.is_visited(self):
             env.push_exec(self.if_cond)
 
-            # create a block scope for the statement
-            block_scope = Scope({})
-            block_scope.parent_scope = env.scope
-            block_scope.return_scope = env.scope
-            block_scope.return_lineno = self.endline()
-            env.scope = block_scope
+            if self.nslots > 0:
+                # create a block scope for the statement
+                profile_counts['block_scopes'] += 1
+                block_scope = Scope({}, self.nslots)
+                block_scope.nest(env.scope)
+                block_scope.return_scope = env.scope
+                block_scope.return_lineno = self.endline()
+                env.scope = block_scope
 
-            self.phase = 'cond_eval'
-            self.exec_visited = True
+            env.visit(self, 'cond_eval')
         else:
             if env.currline >= self.startline() and env.currline <= self.endline():
-                if self.phase == 'cond_eval':
-                    cond_val = env.pop_val()  # evaluate the condition - returned from expression
+                if env.node_state(self) == 'cond_eval':
+                    cond_val = env.pop_val()[0]  # evaluate the condition - returned from expression
+                    if isinstance(cond_val, Symbol):
+                        cond_val = cond_val.value
+                    env.sequence_point()
 
-                    if cond_val[0].val >= 1:  # into if-statement
+                    if cond_val.val:  # into if-statement
                         env.push_exec(self.if_expr)
-                        self.phase = 'done'
+                        env.visit(self, 'done')
                     else:  # into else-statement or continue
                         if self.else_expr is None:
                             exec_done = True
-                            self.exec_visited = False
-                            env.currline = env.scope.return_lineno
-                            env.scope = env.scope.return_scope  # return to parent scope
+                            env.leave(self)
+                            self.exit_scope(env)
                             env.push_val('SelectionRet')
                             env.pop_exec()
                             return exec_done, env
                         else:
                             env.currline = self.else_expr.startline()
                             env.push_exec(self.else_expr)
-                            self.phase = 'done'
+                            env.visit(self, 'done')
                 else:  # 'done'
-                    env.currline = env.scope.return_lineno
-                    env.scope = env.scope.return_scope
+                    self.exit_scope(env)
                     exec_done = True
                     env.push_val('SelectionRet')
                     env.pop_exec()
-                    self.exec_visited = False
+                    env.leave(self)
         return exec_done, env
 
 
@@ -1267,8 +1391,9 @@ class ExpressionStatement(Statement):
         self.expr = expr
 
     def children(self):
-        if self.expr is not None:
-            assert isinstance(self.expr, AstNode)
+        if self.expr is None:  # empty statement ex) for (;;)
+            return []
+        assert isinstance(self.expr, AstNode)
         return [self.expr]
 
     def execute(self, env):
@@ -1277,19 +1402,25 @@ class ExpressionStatement(Statement):
             return False, env
 
         exec_done = False
-        if not self.exec_visited:
+        if self.expr is None:  # empty statement - nothing to evaluate
+            env.push_val('ExpressionStmtRet')
+            env.pop_exec()
+            return True, env
+
+        if not env.is_visited(self):
             self.add_child_executes(env.exec_stack)
-            self.exec_visited = True
+            env.visit(self)
         else:
             if env.currline >= self.endline():
                 ret_val = 'ExpressionStmtRet'
                 if self.expr is not None:
                     ret_val = env.pop_val()
+                    env.sequence_point()
 
                 env.push_val(ret_val)
                 env.pop_exec()
                 exec_done = True
-                self.exec_visited = False
+                env.leave(self)
         return exec_done, env
 
 
@@ -1297,13 +1428,15 @@ class IterationStatement(Statement):
     """
     For- or while-loops.
     """
-    def __init__(self, iter_type, exp1, exp2, exp3, body):
+    def __init__(self, iter_type, exp1=None, exp2=None, exp3=None, body=None):
         super().__init__()
         self.iter_type = iter_type  # 'for' or 'while'
         self.exp1 = exp1  # 1st part of for-condition or while-condition
         self.exp2 = exp2  # 2nd part of for-condition
         self.exp3 = exp3  # 3rd part of for-condition
         self.body = body
+        self.nslots = 0  # number of variables declared in the loop scope - no scope is created if 0
+        self.counter = None  # (level, slot, delta) if the update only increments or decrements a variable
 
     def children(self):
         ch_nodes = []
@@ -1321,81 +1454,106 @@ class IterationStatement(Statement):
             ch_nodes.append(self.body)
         return ch_nodes
 
-    def push_conditions(self, env):
-        if self.iter_type == 'for':
-            env.push_exec(self.exp2)
-        elif self.iter_type == 'while':
-            env.push_exec(self.exp1)  # push the condition and/or update assignment
+    def condition(self):
+        """
+        Condition of the loop - None if omitted, ex) for (;;)
+        """
+        if self.iter_type == 'while':
+            return self.exp1
+        if self.exp2 is None or self.exp2.expr is None:
+            return None
+        return self.exp2
+
+    def next_iteration(self, env):
+        """
+        Schedules the condition, or the body if there is no condition to check.
+        """
+        cond = self.condition()
+        if cond is None:
+            env.push_exec(self.body)
+            env.visit(self, 'body')
+        else:
+            env.push_exec(cond)
+            env.visit(self, 'cond_eval')
+
+    def step_counter(self, env):
+        """
+        Updates the loop counter in place of executing the update expression, ex) i++
+        Returns False if the counter has no value to update yet.
+        """
+        level, slot, delta = self.counter
+        symbol = env.scope.display[level][slot]
+        if symbol is None or symbol.value is None or symbol.value.val is None:
+            return False
+        symbol.increment(delta, env.currline)
+        env.record_write(symbol)
+        return True
+
+    def finish(self, env):
+        env.exit_loop()
+        if self.nslots > 0:
+            env.scope = env.scope.return_scope
+        env.currline = self.endline()  # finish the iteration and proceed
+        env.push_val('IterStatementRet')  # indicate end of statement
+        env.pop_exec()
+        env.leave(self)
+        return True, env
 
     def execute(self, env):
         if env.currline < self.startline() or env.currline > self.endline():
             # execution line number not reached yet
             return False, env
 
-        exec_done = False
-        if not self.exec_visited:
-            # create a new scope before executing anything
-            iter_scope = Scope({})
-            iter_scope.parent_scope = env.scope  # current scope is the parent
-            iter_scope.return_lineno = self.startline()  # return to the first line of this loop
-            iter_scope.return_scope = env.scope
-            env.scope = iter_scope
-            self.exec_visited = True
+        # every call moves the loop to its next phase without waiting for other lines,
+        # so an iteration takes a fixed number of dispatches
+        phase = env.node_state(self)
+        if phase is None:
+            if self.nslots > 0:
+                # create a new scope before executing anything
+                profile_counts['block_scopes'] += 1
+                iter_scope = Scope({}, self.nslots)
+                iter_scope.nest(env.scope)  # current scope is the parent
+                iter_scope.return_lineno = self.startline()  # return to the first line of this loop
+                iter_scope.return_scope = env.scope
+                env.scope = iter_scope
+            env.enter_loop(self)
 
             # add declaration or 'prepare statement' for for-loop
-            if self.iter_type == 'for':
-                if self.exp1 is not None:
-                    env.push_exec(self.exp1)
-                    self.phase = 'preparation'
-                else:
-                    self.phase = 'condition'
-            return False, env
-
-        if env.currline >= self.body.startline():  # at the start of body...
-            if self.phase == 'preparation':
-                env.pop_val()  # discard value for preparation
-                self.push_conditions(env)
-                self.phase = 'cond_eval'
-            elif self.phase == 'condition':
-                # add statement to evaluate the condition
-                self.push_conditions(env)
-                self.phase = 'cond_eval'
-            elif self.phase == 'cond_eval':
-                if self.iter_type == 'for':
-                    # handle for-loop
-                    cond_val = env.pop_val()
-
-                    # determine from the conditional statement
-                    # if the body should be executed
-                    if cond_val is None or cond_val[0].val >= 1:
-                        env.push_exec(self.body)
-                        self.phase = 'body'
-                    else:
-                        env.scope = env.scope.return_scope
-                        env.currline = self.endline()  # finish the iteration and proceed
-
-                        env.push_val('IterStatementRet')  # indicate end of statement
-                        env.pop_exec()
-                        exec_done = True
-                        self.exec_visited = False
-                elif self.iter_type == 'while':
-                    # TODO: implement
-                    pass
-            elif self.phase == 'body':  # after the body has been executed
-                # do the update
-                env.currline = self.startline()  # revert the execution line to top of iter statement
-                if self.exp3 is not None:
-                    env.push_exec(self.exp3)
-                    self.phase = 'update'
-                else:
-                    self.phase = 'condition'
-            elif self.phase == 'update':
-                env.pop_val()
-                env.exec_booked_updates()  # if any value updates are deferred, update the values
-                self.push_conditions(env)
-                self.phase = 'cond_eval'
-                env.currline = self.startline()
-        return exec_done, env
+            if self.iter_type == 'for' and self.exp1 is not None:
+                env.push_exec(self.exp1)
+                env.visit(self, 'preparation')
+            else:
+                self.next_iteration(env)
+        elif phase == 'preparation':
+            env.pop_val()  # discard value for preparation
+            env.sequence_point()
+            self.next_iteration(env)
+        elif phase == 'cond_eval':
+            # determine from the conditional statement if the body should be executed
+            cond_val = env.pop_val()[0]
+            if isinstance(cond_val, Symbol):
+                cond_val = cond_val.value
+            env.sequence_point()
+            if not cond_val.val:
+                return self.finish(env)
+            env.push_exec(self.body)
+            env.visit(self, 'body')
+        elif phase == 'body' or phase == 'continue':  # after the body has been executed
+            env.currline = self.startline()  # revert the execution line to top of iter statement
+            if self.counter is not None and self.step_counter(env):
+                self.next_iteration(env)
+            elif self.exp3 is not None:
+                env.push_exec(self.exp3)
+                env.visit(self, 'update')
+            else:
+                self.next_iteration(env)
+        elif phase == 'update':
+            env.pop_val()
+            env.sequence_point()
+            self.next_iteration(env)
+        else:  # 'break'
+            return self.finish(env)
+        return False, env
 
     def __str__(self):
         return '{}(type={})'.format(super().__str__(), self.iter_type)
@@ -1403,11 +1561,12 @@ class IterationStatement(Statement):
 
 class JumpStatement(Statement):
     """
-    Return statements.
+    Return, break and continue statements.
     """
-    def __init__(self, what=None):
+    def __init__(self, what=None, jump_type='return'):
         super().__init__()
         self.what = what
+        self.jump_type = jump_type  # return, break or continue
 
     def children(self):
         ch_nodes = []
@@ -1420,16 +1579,25 @@ class JumpStatement(Statement):
             # execution line number not reached yet
             return False, env
 
+        if self.jump_type != 'return':
+            # the innermost loop resumes from the jump
+            loop = env.jump_to_loop()
+            env.visit(loop, self.jump_type)
+            return True, env
+
         exec_done = False
-        if not self.exec_visited:  # handle valued return stmt ex) return a;
+        if not env.is_visited(self):  # handle valued return stmt ex) return a;
             if self.what is not None:
                 env.push_exec(self.what)
-                self.exec_visited = True
+                env.visit(self)
                 return False, env
             else:  # handle empty return statement ex) return;
+                if len(env.call_stack) > 0:
+                    env.return_from_call(None)
+                    return True, env
                 env.push_val(None)
                 env.pop_exec()
-                self.exec_visited = False
+                env.leave(self)
                 return True, env
         else:
             if env.currline >= self.endline():
@@ -1437,12 +1605,16 @@ class JumpStatement(Statement):
                 if self.what is not None:
                     ret_val = env.pop_val()[0]
                     if isinstance(ret_val, Symbol):
-                        ret_val = env.scope.getvalue(ret_val.name)
+                        ret_val = ret_val.value
+                    env.sequence_point()
 
+                if len(env.call_stack) > 0:
+                    env.return_from_call(ret_val)  # discard the rest of the function body
+                    return True, env
                 env.scope.return_val = ret_val
                 env.push_val(ret_val)
                 env.pop_exec()
-                self.exec_visited = False
+                env.leave(self)
                 exec_done = True
         return exec_done, env
 
@@ -1471,6 +1643,7 @@ class FunDef(AstNode):
         self.return_type = return_type
         self.name_params = name_params  # function declarator = declarator(function name) + parameterlist(params)
         self.body = body  # compund statement
+        self.nslots = 0  # number of parameters and variables of the function scope
 
     def name(self):
         """
@@ -1489,41 +1662,43 @@ class FunDef(AstNode):
             children_nodes.append(self.body)
         return children_nodes
 
-    def add_child_executes(self, exec_stack):
-        # do not append body into the execution stack during definition!
-        exec_stack.append(self.name_params)
-        exec_stack.append(self.return_type)
-
-    def execute(self, env: ExecutionEnvironment):
+    def function_val(self):
         """
-        Execute a function definition.
-        Unlike most other interpreters, the functions are defined as soon as it is called
-        (to avoid premature syntax errors).
-        So it is done executed as soon as the body section starts.
+        FunctionVal of this definition, registered when the program is loaded.
+        Parameters are (TypeVal, name) pairs, bound to the first slots of the function scope in order.
         """
-        exec_done = False
-        if not self.exec_visited:
-            self.add_child_executes(env.exec_stack)
-            self.exec_visited = True
-        else:
-            fun_dec_val = env.pop_val()
-
-            params = fun_dec_val.param_typelist_val  # list of (TypeVal, Symbol)
-            funname = fun_dec_val.getsymbol()  # name of the function
-            pointer = fun_dec_val.pointer_val
-            rtype = env.pop_val()  # typeval
-
-            # register the symbol in the scope if it does not exist
-            funname.astnode = self
-            if env.scope.getsymbol(funname.name) is None:
-                env.scope.add_symbol(funname.name, funname)
-            if env.scope.getvalue(funname.name) is None:
-                env.scope.set_value(
-                        funname.name,
-                        FunctionVal(rtype, params, self.body),
-                        self.startline())
-            env.pop_exec()
-            self.exec_visited = False
-            env.currline = env.scope.return_lineno
-            exec_done = True
-        return exec_done, env
+        _, rptr, _ = unpack_declarator(self.name_params)
+        rtype = TypeVal(spec_typename(self.return_type), ptr=rptr)
+        params = []
+        param_list = self.name_params.param_type_list
+        for param in (param_list if param_list is not None else []):
+            if param.declarator is None:  # ex) int main(void)
+                continue
+            name, ptr, arr_size = unpack_declarator(param.declarator)
+            params.append((TypeVal(spec_typename(param.dec_specs), ptr=ptr, array=0 if arr_size is None else 1), name))
+        return FunctionVal(rtype, params, self.body)
+
+
+def unpack_declarator(dec):
+    """
+    Retrieves (name, pointer order, array size node) from a declarator.
+    Array size node is None if the declarator does not declare an array.
+    """
+    ptr = 0
+    arr_size = None
+    while isinstance(dec, Declarator):
+        if dec.pointer is not None:
+            ptr += dec.pointer.order
+        if isinstance(dec, ArrayDeclarator):
+            arr_size = dec.assignment_expr
+        dec = dec.of
+    return dec.name(), ptr, arr_size
+
+
+def spec_typename(dec_specs):
+    """
+    Type name of declaration specifiers (or a single type specifier).
+    """
+    if isinstance(dec_specs, Type):
+        return dec_specs.value
+    return dec_specs[0].value
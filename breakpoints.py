@@ -0,0 +1,226 @@
+from bisect import bisect_left
+from astree import *
+from environment import CRuntimeErr, UninitializedError
+from symbol_table import arith_ops, compare_ops
+from yacc import parse_expression
+
+
+"""
+Breakpoints and watchpoints of the interactive mode.
+
+The statements of the program are indexed by the lines they start at, once after parsing,
+so that breakpoints are placed on lines that execute something. While running, the engines
+only check whether the line reached is in the set of breakpoint lines.
+The condition of a breakpoint is parsed as a mini-C expression and compiled into a closure
+once it is set, and is only evaluated when the line of the breakpoint is reached.
+Watchpoints are checked by the engines when a watched variable is written (see Symbol.set_value).
+"""
+
+
+def line_index(functions):
+    """
+    Statements and declarations of the functions by the line they start at - line -> list of nodes.
+    """
+    index = {}
+    nodes = [func.body for func in functions]
+    while len(nodes) > 0:
+        node = nodes.pop()
+        if node is None:
+            continue
+        if isinstance(node, (Statement, Declaration)):
+            index.setdefault(node.startline(), []).append(node)
+            if isinstance(node, Declaration):
+                continue  # no statements inside
+        nodes.extend(node.children())
+    return index
+
+
+class ConditionError(Exception):
+    pass
+
+
+class ConditionCompiler:
+    """
+    Compiles expressions without side effects into closures taking values(name),
+    which gives the value of the variable visible - a number or the storage of an array.
+    """
+    def compile(self, node):
+        compile_node = getattr(self, 'expr_' + node.__class__.__name__, None)
+        if compile_node is None:
+            raise ConditionError('{} is not allowed in a condition'.format(node.__class__.__name__))
+        return compile_node(node)
+
+    def expr_Expression(self, node):
+        if len(node) != 1:
+            raise ConditionError('a condition is a single expression')
+        return self.compile(node[0])
+
+    def expr_Constant(self, node):
+        value = node.value
+        return lambda values: value
+
+    def expr_Id(self, node):
+        name = node.name()
+        return lambda values: values(name)
+
+    def expr_ArrayReference(self, node):
+        arr = self.compile(node.name)
+        idx = self.compile(node.idx)
+        return lambda values: arr(values)[idx(values)]
+
+    def expr_TypeCast(self, node):
+        value = self.compile(node.cast_expr)
+        cast = {'int': int, 'float': float}.get(spec_typename(node.type_name))
+        if cast is None:
+            raise ConditionError('cannot cast into {}'.format(spec_typename(node.type_name)))
+        return lambda values: cast(value(values))
+
+    def expr_BinaryOp(self, node):
+        op = node.op.op if isinstance(node.op, Op) else node.op
+        left = self.compile(node.arg1)
+        right = self.compile(node.arg2)
+        if op == '&&':
+            return lambda values: 1 if left(values) and right(values) else 0
+        elif op == '||':
+            return lambda values: 1 if left(values) or right(values) else 0
+        elif op in compare_ops:
+            compare = compare_ops[op]
+            return lambda values: 1 if compare(left(values), right(values)) else 0
+        elif op in arith_ops:
+            arith = arith_ops[op]
+            return lambda values: arith(left(values), right(values))
+        raise ConditionError('invalid operator {}'.format(op))
+
+
+def compile_condition(text):
+    """
+    Parses and compiles the condition of a breakpoint. Raises ConditionError if it is not a valid condition.
+    """
+    expr = parse_expression(text)
+    if expr is None:
+        raise ConditionError('syntax error')
+    return ConditionCompiler().compile(expr)
+
+
+class Breakpoints:
+    """
+    Breakpoints set by line or by function, and watchpoints set by variable name,
+    numbered together in the order they are set.
+    """
+    def __init__(self, functions):
+        self.index = line_index(functions)
+        self.statement_lines = sorted(self.index)
+        self.functions = {func.name(): func for func in functions}
+        self.points = {}  # number -> (line, description) - line is None for watchpoints
+        self.lines = set()  # lines of the breakpoints - the engines stop before executing them
+        self.conditions = {}  # number -> compiled condition of the breakpoint
+        self.watches = {}  # number -> Watch of the watched declaration - see symbol_table.py
+        self.hits = []  # numbers of the breakpoints the execution stopped at
+        self.count = 0  # breakpoints set so far
+
+    def statement_line(self, line, endline=None):
+        """
+        First line at or after line that starts a statement, None if there is none (up to endline).
+        """
+        pos = bisect_left(self.statement_lines, line)
+        if pos == len(self.statement_lines):
+            return None
+        found = self.statement_lines[pos]
+        if endline is not None and found > endline:
+            return None
+        return found
+
+    def add(self, line, description, condition=None):
+        compiled = compile_condition(condition) if condition is not None else None
+        self.count += 1
+        if compiled is not None:
+            self.conditions[self.count] = compiled
+            description += ' if {}'.format(condition)
+        self.points[self.count] = (line, description)
+        self.lines.add(line)
+        return self.count
+
+    def add_line(self, line, condition=None):
+        """
+        Sets a breakpoint at the line, or at the first statement after it.
+        Returns the number of the breakpoint, None if no statement follows the line.
+        """
+        found = self.statement_line(line)
+        if found is None:
+            return None
+        return self.add(found, 'line {}'.format(found), condition)
+
+    def add_function(self, name, condition=None):
+        """
+        Sets a breakpoint at the first statement of the function.
+        Returns the number of the breakpoint, None if there is no such function.
+        """
+        func = self.functions.get(name)
+        if func is None:
+            return None
+        found = self.statement_line(func.startline() + 1, func.endline())
+        line = found if found is not None else func.startline()
+        return self.add(line, 'function {}, line {}'.format(name, line), condition)
+
+    def add_watch(self, watch):
+        """
+        Numbers the Watch set by the engine on a declaration. Returns the number of the watchpoint.
+        """
+        self.count += 1
+        watch.number = self.count
+        self.points[self.count] = (None, watch.name)
+        self.watches[self.count] = watch
+        return self.count
+
+    def delete(self, number=None):
+        """
+        Deletes the breakpoint, or all breakpoints if number is None - deleted watchpoints stop recording hits.
+        Returns False if there is no such breakpoint.
+        """
+        if number is None:
+            self.points.clear()
+        elif self.points.pop(number, None) is None:
+            return False
+        self.lines = {line for line, _ in self.points.values() if line is not None}
+        self.conditions = {num: cond for num, cond in self.conditions.items() if num in self.points}
+        for num, watch in self.watches.items():
+            if num not in self.points:
+                watch.active = False
+        self.watches = {num: watch for num, watch in self.watches.items() if num in self.points}
+        return True
+
+    def stops_at(self, line, values):
+        """
+        Whether the execution stops at the line - whether any breakpoint at the line has no condition,
+        or a condition that holds. values(name) gives the value of a variable, as in ConditionCompiler.
+        The errors of the conditions are shown, and do not stop the execution.
+        The numbers of the breakpoints stopped at are kept in hits.
+        """
+        hits = []
+        for number, (bp_line, _) in self.points.items():
+            if bp_line != line:
+                continue
+            condition = self.conditions.get(number)
+            if condition is None:
+                hits.append(number)
+                continue
+            # a condition that cannot be evaluated does not hold
+            try:
+                if condition(values):
+                    hits.append(number)
+            except CRuntimeErr as e:
+                print('Error in the condition of breakpoint {} : {}'.format(number, e.msg))
+            except UninitializedError:
+                print('Error in the condition of breakpoint {} : Variable not initialized!'.format(number))
+            except TypeError:  # such as an array compared with a number
+                print('Error in the condition of breakpoint {} : Invalid operand types'.format(number))
+            except (IndexError, ZeroDivisionError) as e:
+                print('Error in the condition of breakpoint {} : {}'.format(number, e))
+        self.hits = hits
+        return len(hits) > 0
+
+    def show(self):
+        if len(self.points) == 0:
+            print('No breakpoints')
+        for number, (line, description) in sorted(self.points.items()):
+            print('{} {} : {}'.format('Breakpoint' if line is not None else 'Watchpoint', number, description))
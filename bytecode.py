@@ -0,0 +1,543 @@
+from array import array
+from bisect import bisect_right
+from astree import *
+from symbol_table import TypeVal, caster, binary_result_type
+from closures import CompileScope
+from cbuiltins import lookup_builtin
+
+
+"""
+Bytecode compiler for mini-C.
+
+Each function definition is compiled into a CodeObject holding a flat array of
+integer instructions. Every instruction is two integers wide - an opcode and its operand
+(0 if the opcode takes none) - so the program counter is an index into the code array.
+Variables are resolved into fixed frame slots at compile time.
+
+Code compiled for debugging additionally has LINE instructions at the start of
+each statement and TRACE_LOCAL instructions after each write to a variable,
+so that the virtual machine can stop per line and keep value histories.
+"""
+
+
+# opcodes
+(NOP, LINE, LOAD_CONST, LOAD_LOCAL, STORE_LOCAL, TRACE_LOCAL, LOAD_ELEM, STORE_ELEM,
+ INC_LOCAL, DEC_LOCAL, INC_ELEM_POST, INC_ELEM_PRE,
+ ADD, SUB, MUL, DIV, MOD, LT, GT, LE, GE, EQ, NE,
+ TO_INT, TO_FLOAT, NEW_INT_ARRAY, NEW_FLOAT_ARRAY,
+ POP, DUP, JUMP, JUMP_IF_FALSE, CALL, CALL_NATIVE, RETURN, RETURN_NONE, RAISE) = range(36)
+
+opnames = ['NOP', 'LINE', 'LOAD_CONST', 'LOAD_LOCAL', 'STORE_LOCAL', 'TRACE_LOCAL', 'LOAD_ELEM', 'STORE_ELEM',
+           'INC_LOCAL', 'DEC_LOCAL', 'INC_ELEM_POST', 'INC_ELEM_PRE',
+           'ADD', 'SUB', 'MUL', 'DIV', 'MOD', 'LT', 'GT', 'LE', 'GE', 'EQ', 'NE',
+           'TO_INT', 'TO_FLOAT', 'NEW_INT_ARRAY', 'NEW_FLOAT_ARRAY',
+           'POP', 'DUP', 'JUMP', 'JUMP_IF_FALSE', 'CALL', 'CALL_NATIVE', 'RETURN', 'RETURN_NONE', 'RAISE']
+
+binary_opcodes = {
+    '+': ADD, '-': SUB, '*': MUL, '/': DIV, '%': MOD,
+    '<': LT, '>': GT, '<=': LE, '>=': GE, '==': EQ, '!=': NE,
+}
+
+
+class CodeObject:
+    """
+    Compiled code of a single function.
+    """
+    def __init__(self, name, rtype, params, startline):
+        self.name = name
+        self.rtype = rtype  # TypeVal
+        self.params = params  # list of (TypeVal, slot) pairs
+        self.nparams = len(params)
+        self.nslots = len(params) + 1  # slot 0 is reserved
+        self.startline = startline
+        self.code = array('i')
+        self.consts = []
+        # line table - pc of the first instruction generated for a line, and the line number
+        self.line_pcs = array('i')
+        self.line_nums = array('i')
+        # (name, slot, TypeVal, start pc, end pc) of each variable
+        self.varinfo = []
+        self.watched = {}  # slot -> Watch of the variables watched in the interactive mode
+
+    def emit(self, op, arg=0):
+        pc = len(self.code)
+        self.code.append(op)
+        self.code.append(arg)
+        return pc
+
+    def pc(self):
+        return len(self.code)
+
+    def patch(self, pc, arg):
+        self.code[pc + 1] = arg
+
+    def add_const(self, value):
+        for i, const in enumerate(self.consts):
+            if type(const) is type(value) and const == value:
+                return i
+        self.consts.append(value)
+        return len(self.consts) - 1
+
+    def new_slot(self):
+        self.nslots += 1
+        return self.nslots - 1
+
+    def mark_line(self, lineno):
+        if len(self.line_nums) > 0 and self.line_pcs[-1] == self.pc():
+            self.line_nums[-1] = lineno
+        elif len(self.line_nums) == 0 or self.line_nums[-1] != lineno:
+            self.line_pcs.append(self.pc())
+            self.line_nums.append(lineno)
+
+    def line_at(self, pc):
+        """
+        Line number of the instruction at pc, looked up from the line table.
+        """
+        idx = bisect_right(self.line_pcs, pc) - 1
+        if idx < 0:
+            return self.startline
+        return self.line_nums[idx]
+
+    def visible_var(self, name, pc):
+        """
+        Innermost variable named name that is visible at pc - (slot, TypeVal) or None.
+        """
+        found = None
+        for var_name, slot, vtype, start_pc, end_pc in self.varinfo:
+            if var_name == name and start_pc <= pc < end_pc:
+                if found is None or start_pc >= found[0]:
+                    found = (start_pc, slot, vtype)
+        if found is None:
+            return None
+        return found[1], found[2]
+
+    def disassemble(self):
+        lines = []
+        for pc in range(0, len(self.code), 2):
+            op, arg = self.code[pc], self.code[pc + 1]
+            lines.append('{:4d} {:4d} {:16s} {}'.format(self.line_at(pc), pc, opnames[op], arg))
+        return '\n'.join(lines)
+
+
+class Program:
+    """
+    Compiled program - code objects of all functions.
+    """
+    def __init__(self, codes, debug):
+        self.codes = codes
+        self.index = {code.name: i for i, code in enumerate(codes)}
+        self.debug = debug
+
+    def function(self, name):
+        return self.codes[self.index[name]]
+
+
+class BytecodeCompiler:
+    """
+    Compiles function definitions into code objects.
+    """
+    def __init__(self, fundefs, debug=False):
+        self.fundefs = fundefs
+        self.debug = debug
+        self.codes = []
+        self.index = {}
+        self.param_names = {}  # function name -> list of parameter names
+        self.code = None  # CodeObject being compiled
+        self.scope_vars = []  # varinfo entries of the block scopes being compiled
+        self.loops = []  # (break jumps, continue jumps) to patch for the loops being compiled
+
+    def compile_program(self):
+        # register all signatures first so that calls can be bound in any order
+        for fundef in self.fundefs:
+            self.index[fundef.name()] = len(self.codes)
+            self.codes.append(self.compile_signature(fundef))
+        for fundef in self.fundefs:
+            self.compile_function(fundef, self.codes[self.index[fundef.name()]])
+        return Program(self.codes, self.debug)
+
+    def compile_signature(self, fundef):
+        _, rptr, _ = unpack_declarator(fundef.name_params)
+        rtype = TypeVal(spec_typename(fundef.return_type), ptr=rptr)
+        params = []
+        names = []
+        param_list = fundef.name_params.param_type_list
+        for param in (param_list if param_list is not None else []):
+            if param.declarator is None:  # ex) int main(void)
+                continue
+            name, ptr, arr_size = unpack_declarator(param.declarator)
+            param_type = TypeVal(spec_typename(param.dec_specs), ptr=ptr, array=0 if arr_size is None else 1)
+            params.append((param_type, len(params) + 1))
+            names.append(name)
+        self.param_names[fundef.name()] = names
+        return CodeObject(fundef.name(), rtype, params, fundef.startline())
+
+    def compile_function(self, fundef, code):
+        self.code = code
+        scope = CompileScope()
+        for (param_type, slot), name in zip(code.params, self.param_names[code.name]):
+            scope.names[name] = (slot, param_type)
+            code.varinfo.append([name, slot, param_type, 0, 0])
+
+        code.mark_line(fundef.startline())
+        if self.debug:
+            code.emit(LINE, fundef.startline())
+            for _, slot in code.params:
+                code.emit(TRACE_LOCAL, slot)
+        self.compile_stmt(fundef.body, scope)
+        code.mark_line(fundef.endline())
+        if self.debug:
+            code.emit(LINE, fundef.endline())
+        code.emit(RETURN_NONE)
+        for var in code.varinfo:
+            if var[4] == 0:
+                var[4] = code.pc()
+        code.varinfo = [tuple(var) for var in code.varinfo]
+
+    def new_line(self, node):
+        """
+        Marks the start of a statement at the line of node.
+        """
+        lineno = node.startline()
+        self.code.mark_line(lineno)
+        if self.debug:
+            self.code.emit(LINE, lineno)
+
+    def open_scope(self, scope):
+        self.scope_vars.append([])
+        return CompileScope(scope)
+
+    def close_scope(self):
+        for var in self.scope_vars.pop():
+            var[4] = self.code.pc()
+
+    def raise_err(self, msg):
+        self.code.emit(RAISE, self.code.add_const(msg))
+
+    def emit_cast(self, from_type, to_type):
+        cast = caster(from_type, to_type)
+        if cast is int:
+            self.code.emit(TO_INT)
+        elif cast is float:
+            self.code.emit(TO_FLOAT)
+
+    def compile_stmt(self, node, scope):
+        getattr(self, 'stmt_' + node.__class__.__name__)(node, scope)
+
+    def compile_expr(self, node, scope):
+        """
+        Compiles the expression that leaves its value on the stack - returns its TypeVal.
+        """
+        return getattr(self, 'expr_' + node.__class__.__name__)(node, scope)
+
+    def compile_effect(self, node, scope):
+        """
+        Compiles the expression only for its side effects - nothing is left on the stack.
+        """
+        if isinstance(node, Expression):
+            for expr in node:
+                self.compile_effect(expr, scope)
+        elif isinstance(node, Assignment):
+            self.assign(node, scope, keep_value=False)
+        elif isinstance(node, UnaryExpr) and isinstance(node.operand, Id):
+            self.update_local(node, scope, keep_value=False)
+        else:
+            self.compile_expr(node, scope)
+            self.code.emit(POP)
+
+    # statements
+
+    def stmt_CompoundStatement(self, node, scope):
+        block_scope = self.open_scope(scope)
+        for item in node:
+            self.compile_stmt(item, block_scope)
+        self.close_scope()
+
+    def stmt_Declaration(self, node, scope):
+        self.new_line(node)
+        typename = spec_typename(node.declaration_spec)
+        for dec in node.init_dec_list:
+            initializer = None
+            if isinstance(dec, InitDeclarator):
+                initializer = dec.initializer
+                dec = dec.declarator
+            name, ptr, arr_size = unpack_declarator(dec)
+            if name in scope.names:
+                self.raise_err('Symbol "{}" already bound in this scope'.format(name))
+                continue
+
+            vtype = TypeVal(typename, ptr=ptr, array=0 if arr_size is None else 1)
+            slot = self.code.new_slot()
+            if arr_size is not None:
+                self.compile_expr(arr_size, scope)
+                self.code.emit(NEW_INT_ARRAY if typename == 'int' else NEW_FLOAT_ARRAY)
+                self.store_local(slot)
+            elif initializer is not None:
+                self.emit_cast(self.compile_expr(initializer, scope), vtype)
+                self.store_local(slot)
+            scope.names[name] = (slot, vtype)
+
+            # variable is visible after the declaration
+            var = [name, slot, vtype, self.code.pc(), 0]
+            self.code.varinfo.append(var)
+            if len(self.scope_vars) > 0:
+                self.scope_vars[-1].append(var)
+
+    def store_local(self, slot):
+        self.code.emit(STORE_LOCAL, slot)
+        if self.debug:
+            self.code.emit(TRACE_LOCAL, slot)
+
+    def stmt_ExpressionStatement(self, node, scope):
+        if node.expr is not None:
+            self.new_line(node)
+            self.compile_effect(node.expr, scope)
+
+    def stmt_SelectionStatement(self, node, scope):
+        self.new_line(node)
+        self.compile_expr(node.if_cond, scope)
+        jump_else = self.code.emit(JUMP_IF_FALSE)
+        self.compile_stmt(node.if_expr, scope)
+        if node.else_expr is None:
+            self.code.patch(jump_else, self.code.pc())
+        else:
+            jump_end = self.code.emit(JUMP)
+            self.code.patch(jump_else, self.code.pc())
+            self.compile_stmt(node.else_expr, scope)
+            self.code.patch(jump_end, self.code.pc())
+
+    def stmt_IterationStatement(self, node, scope):
+        iter_scope = self.open_scope(scope)
+        if node.iter_type == 'for' and node.exp1 is not None:
+            self.new_line(node)
+            self.compile_stmt(node.exp1, iter_scope)
+
+        # condition
+        loop_start = self.code.pc()
+        self.new_line(node)
+        cond = node.exp1 if node.iter_type == 'while' else None
+        if node.iter_type == 'for' and node.exp2 is not None:
+            cond = node.exp2.expr
+        jump_end = None
+        if cond is not None:
+            self.compile_expr(cond, iter_scope)
+            jump_end = self.code.emit(JUMP_IF_FALSE)
+
+        break_jumps, continue_jumps = [], []
+        self.loops.append((break_jumps, continue_jumps))
+        self.compile_stmt(node.body, iter_scope)
+        self.loops.pop()
+
+        # update
+        for pc in continue_jumps:
+            self.code.patch(pc, self.code.pc())
+        if node.iter_type == 'for' and node.exp3 is not None:
+            self.new_line(node)
+            self.compile_effect(node.exp3, iter_scope)
+        self.code.emit(JUMP, loop_start)
+        if jump_end is not None:
+            break_jumps.append(jump_end)
+        for pc in break_jumps:
+            self.code.patch(pc, self.code.pc())
+        self.close_scope()
+
+    def stmt_JumpStatement(self, node, scope):
+        self.new_line(node)
+        if node.jump_type != 'return':
+            break_jumps, continue_jumps = self.loops[-1]
+            jumps = break_jumps if node.jump_type == 'break' else continue_jumps
+            jumps.append(self.code.emit(JUMP))
+            return
+        if node.what is None:
+            self.code.emit(RETURN_NONE)
+            return
+
+        vtype = self.compile_expr(node.what, scope)
+        if self.code.rtype.typename != 'void':
+            self.emit_cast(vtype, self.code.rtype)
+        self.code.emit(RETURN)
+
+    # expressions
+
+    def expr_Constant(self, node, scope):
+        self.code.emit(LOAD_CONST, self.code.add_const(node.value))
+        return TypeVal(node.const_type)
+
+    def expr_String(self, node, scope):
+        self.code.emit(LOAD_CONST, self.code.add_const(node.string))
+        return TypeVal('string')
+
+    def lookup(self, node, scope):
+        var = scope.lookup(node.name())
+        if var is None:
+            self.raise_err('Name {} does not exist!'.format(node.name()))
+            return None, TypeVal('int')
+        return var
+
+    def expr_Id(self, node, scope):
+        slot, vtype = self.lookup(node, scope)
+        if slot is not None:
+            self.code.emit(LOAD_LOCAL, slot)
+        return vtype
+
+    def expr_Expression(self, node, scope):
+        for expr in node[:-1]:
+            self.compile_effect(expr, scope)
+        return self.compile_expr(node[-1], scope)
+
+    def expr_Assignment(self, node, scope):
+        return self.assign(node, scope, keep_value=True)
+
+    def assign(self, node, scope, keep_value):
+        lvalue = node.lvalue
+        if isinstance(lvalue, Id):
+            slot, vtype = self.lookup(lvalue, scope)
+            if slot is None:
+                return vtype
+            self.emit_cast(self.compile_expr(node.rvalue, scope), vtype)
+            if keep_value:
+                self.code.emit(DUP)
+            self.store_local(slot)
+            return vtype
+        elif isinstance(lvalue, ArrayReference):
+            elem_type = self.array_access(lvalue, scope)
+            self.emit_cast(self.compile_expr(node.rvalue, scope), elem_type)
+            self.code.emit(STORE_ELEM)
+            if keep_value:
+                # reload the stored element
+                self.array_access(lvalue, scope)
+                self.code.emit(LOAD_ELEM)
+            return elem_type
+        self.raise_err('Cannot assign to {}'.format(lvalue))
+        return TypeVal('int')
+
+    def array_access(self, node, scope):
+        """
+        Pushes the array and the index - returns the element type.
+        """
+        arr_type = self.compile_expr(node.name, scope)
+        if arr_type.sum_arr_ptr() == 0:
+            self.raise_err('Name {} not array!'.format(node.name))
+        self.compile_expr(node.idx, scope)
+        return TypeVal(arr_type.typename)
+
+    def expr_ArrayReference(self, node, scope):
+        elem_type = self.array_access(node, scope)
+        self.code.emit(LOAD_ELEM)
+        return elem_type
+
+    def expr_TypeCast(self, node, scope):
+        vtype = self.compile_expr(node.cast_expr, scope)
+        cast_type = TypeVal(spec_typename(node.type_name))
+        if not vtype.castable(cast_type):
+            self.raise_err('Type cannot be casted {}, {}'.format(vtype, cast_type))
+        self.emit_cast(vtype, cast_type)
+        return cast_type
+
+    def expr_UnaryExpr(self, node, scope):
+        if isinstance(node.operand, Id):
+            return self.update_local(node, scope, keep_value=True)
+        elif isinstance(node.operand, ArrayReference):
+            elem_type = self.array_access(node.operand, scope)
+            inc = 1 if node.op_name == '++' else -1
+            self.code.emit(INC_ELEM_POST if node.is_postfix else INC_ELEM_PRE, inc)
+            return elem_type
+        self.raise_err('Cannot apply {} to {}'.format(node.op_name, node.operand))
+        return TypeVal('int')
+
+    def update_local(self, node, scope, keep_value):
+        slot, vtype = self.lookup(node.operand, scope)
+        if slot is None:
+            return vtype
+        update_op = INC_LOCAL if node.op_name == '++' else DEC_LOCAL
+        if keep_value and node.is_postfix:
+            self.code.emit(LOAD_LOCAL, slot)
+        self.code.emit(update_op, slot)
+        if self.debug:
+            self.code.emit(TRACE_LOCAL, slot)
+        if keep_value and not node.is_postfix:
+            self.code.emit(LOAD_LOCAL, slot)
+        return vtype
+
+    def expr_BinaryOp(self, node, scope):
+        op = node.op.op if isinstance(node.op, Op) else node.op
+        if op in ('&&', '||'):
+            return self.compile_logical(node, op, scope)
+        ltype = self.compile_expr(node.arg1, scope)
+        rtype = self.compile_expr(node.arg2, scope)
+        vtype = binary_result_type(op, ltype, rtype)
+        if op not in ('/', '%') and not ltype.castable(rtype):
+            self.raise_err('Type not castable {} and {}'.format(ltype, rtype))
+        elif op not in binary_opcodes:
+            self.raise_err('Invalid binary operator {}'.format(op))
+        else:
+            self.code.emit(binary_opcodes[op])
+            if op == '%' and (ltype.typename != 'int' or rtype.typename != 'int'):
+                self.code.emit(TO_INT)
+        return vtype
+
+    def compile_logical(self, node, op, scope):
+        """
+        Short-circuit && and || - the right operand is skipped once the left one decides the result.
+        """
+        ltype = self.compile_expr(node.arg1, scope)
+        if op == '&&':
+            jump_false = [self.code.emit(JUMP_IF_FALSE)]
+            jump_true = []
+        else:
+            jump_right = self.code.emit(JUMP_IF_FALSE)
+            jump_true = [self.code.emit(JUMP)]
+            jump_false = []
+            self.code.patch(jump_right, self.code.pc())
+        rtype = self.compile_expr(node.arg2, scope)
+        if not ltype.castable(rtype):
+            self.raise_err('Type not castable {} and {}'.format(ltype, rtype))
+        jump_false.append(self.code.emit(JUMP_IF_FALSE))
+
+        # both branches leave the int result on the stack
+        for pc in jump_true:
+            self.code.patch(pc, self.code.pc())
+        self.code.emit(LOAD_CONST, self.code.add_const(1))
+        jump_end = self.code.emit(JUMP)
+        for pc in jump_false:
+            self.code.patch(pc, self.code.pc())
+        self.code.emit(LOAD_CONST, self.code.add_const(0))
+        self.code.patch(jump_end, self.code.pc())
+        return binary_result_type(op, ltype, rtype)
+
+    def expr_FunctionCall(self, node, scope):
+        funcname = node.func_name.name()
+        builtin = lookup_builtin(funcname, self.index)
+        if builtin is not None:
+            arg_types = [self.compile_expr(arg, scope) for arg in node.argument_list]
+            msg = builtin.check(arg_types)
+            if msg is not None:
+                self.raise_err(msg)
+                return builtin.rtype
+            first_arg = node.argument_list[0] if len(node.argument_list) > 0 else None
+            native = builtin.bind(first_arg.string if isinstance(first_arg, String) else None)
+            # the operand is the constant holding the callable and the number of arguments
+            self.code.emit(CALL_NATIVE, self.code.add_const((native, len(arg_types))))
+            return builtin.result_type(arg_types)
+
+        if funcname not in self.index:
+            self.raise_err('No function named {} defined.'.format(funcname))
+            return TypeVal('int')
+        callee = self.codes[self.index[funcname]]
+        if len(node.argument_list) != callee.nparams:
+            self.raise_err('Argument number mismatch')
+            return callee.rtype
+
+        for arg, (param_type, _) in zip(node.argument_list, callee.params):
+            arg_type = self.compile_expr(arg, scope)
+            if not arg_type.castable(param_type):
+                self.raise_err('Argument type mismatch {}, {}'.format(arg_type, param_type))
+            self.emit_cast(arg_type, param_type)
+        self.code.emit(CALL, self.index[funcname])
+        return callee.rtype
+
+
+def compile_program(fundefs, debug=False):
+    """
+    Compiles all function definitions into a Program.
+    """
+    return BytecodeCompiler(fundefs, debug).compile_program()
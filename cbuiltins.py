@@ -0,0 +1,195 @@
+import re
+from array import array
+from symbol_table import TypeVal, INT_TYPE, array_converters
+from environment import CRuntimeErr
+
+
+"""
+Native builtin functions of mini-C.
+
+Each builtin is a python callable with a declared signature, taking the output sink
+of the running program (see output.py) and plain python values (numbers, strings,
+and the arrays of the engines - array.array or list), and returning such a value. Calls are bound to the builtins once, when the program is loaded,
+unless the program defines a function of the same name.
+printf format strings are literals, so they are compiled at the call sites.
+"""
+
+
+STRING_TYPE = TypeVal('string')
+VOID_TYPE = TypeVal('void')
+
+# parameter kinds other than TypeVals
+ARRAY = 'array'  # int or float array
+ELEMENT = 'element'  # result type - element type of the first argument
+
+
+class Builtin:
+    """
+    Builtin function - params are TypeVals or ARRAY, and rtype a TypeVal or ELEMENT.
+    """
+    __slots__ = ('name', 'rtype', 'params', 'func', 'variadic', 'compile')
+
+    def __init__(self, name, rtype, params, func, variadic=False, compile=None):
+        self.name = name
+        self.rtype = rtype
+        self.params = params
+        self.func = func  # callable taking the output sink and the argument values
+        self.variadic = variadic  # whether more number or string arguments may follow the parameters
+        self.compile = compile  # makes a callable specialized for the literal first argument
+
+    def check(self, arg_types):
+        """
+        Type error message of the call, None if the arguments match the parameters.
+        """
+        if len(arg_types) < len(self.params) or (not self.variadic and len(arg_types) != len(self.params)):
+            return 'Argument number mismatch for {}'.format(self.name)
+        for i, arg_type in enumerate(arg_types):
+            param = self.params[i] if i < len(self.params) else None
+            if param is None:  # variadic arguments are numbers or strings, such as the ones of %s
+                ok = arg_type is STRING_TYPE or arg_type.castable(INT_TYPE)
+            elif param is ARRAY:
+                ok = arg_type.sum_arr_ptr() == 1 and arg_type.typename in ('int', 'float')
+            elif param is STRING_TYPE:
+                ok = arg_type is STRING_TYPE
+            else:
+                ok = arg_type.castable(param)
+            if not ok:
+                return 'Argument type mismatch for {}: {}'.format(self.name, arg_type)
+        return None
+
+    def result_type(self, arg_types):
+        if self.rtype is ELEMENT:
+            return TypeVal(arg_types[0].typename)
+        return self.rtype
+
+    def bind(self, first_arg=None):
+        """
+        Callable for a call site - first_arg is the literal first argument, if any.
+        """
+        if self.compile is not None and isinstance(first_arg, str):
+            return self.compile(first_arg)
+        return self.func
+
+
+# printf
+
+escapes = {'n': '\n', 't': '\t', 'r': '\r', '0': '\0', '\\': '\\', '"': '"', "'": "'"}
+escape_regex = re.compile(r'\\(.)')
+conversion_regex = re.compile(r'%[-+ #0]*\d*(?:\.\d+)?([diuxXcfeEgGs%])')
+
+
+def unquote(literal):
+    """
+    Contents of a string literal, with the escape sequences replaced.
+    """
+    if len(literal) >= 2 and literal[0] == '"' and literal[-1] == '"':
+        literal = literal[1:-1]
+    return escape_regex.sub(lambda m: escapes.get(m.group(1), m.group(1)), literal)
+
+
+def string_arg(arg):
+    # string arguments are the literals, as written in the program
+    return unquote(arg) if isinstance(arg, str) else str(arg)
+
+
+def compile_format(literal):
+    """
+    Compiles a printf format string literal.
+    Returns the python format string and the converters of the arguments.
+    """
+    text = unquote(literal)
+    pieces = []
+    converters = []
+    pos = 0
+    for match in conversion_regex.finditer(text):
+        pieces.append(text[pos:match.start()].replace('%', '%%'))  # '%' not starting a conversion
+        pieces.append(match.group(0))
+        conv = match.group(1)
+        if conv in 'diuxXc':
+            converters.append(int)
+        elif conv in 'feEgG':
+            converters.append(float)
+        elif conv == 's':
+            converters.append(string_arg)
+        pos = match.end()
+    pieces.append(text[pos:].replace('%', '%%'))
+    return ''.join(pieces), converters
+
+
+def format_args(converters, args):
+    if len(args) != len(converters):
+        raise CRuntimeErr('printf expects {} arguments, got {}'.format(len(converters), len(args)))
+    return tuple(convert(arg) for convert, arg in zip(converters, args))
+
+
+def compile_printf(literal):
+    fmt, converters = compile_format(literal)
+    if len(converters) == 0:
+        text = fmt % ()  # only %% to replace
+        def printf(out, _, *args):
+            out.write(text)
+    else:
+        def printf(out, _, *args):
+            out.write(fmt % format_args(converters, args))
+    return printf
+
+
+def c_printf(out, literal, *args):
+    compile_printf(literal)(out, literal, *args)
+
+
+# memory
+
+def check_count(arr, n):
+    if n < 0 or n > len(arr):
+        raise CRuntimeErr('Index error - array index out of range')
+
+
+def converter_of(arr):
+    """
+    Converts values into the element type of the array.
+    """
+    if isinstance(arr, array):
+        return array_converters[arr.typecode]
+    return type(arr[0]) if len(arr) > 0 else int
+
+
+def c_memset(out, arr, value, n):
+    check_count(arr, n)
+    block = [converter_of(arr)(value)] * n
+    arr[:n] = array(arr.typecode, block) if isinstance(arr, array) else block
+
+
+def c_memcpy(out, dst, src, n):
+    check_count(dst, n)
+    check_count(src, n)
+    block = src[:n]
+    convert = converter_of(dst)
+    if isinstance(dst, array):
+        if not isinstance(block, array) or block.typecode != dst.typecode:
+            block = array(dst.typecode, map(convert, block))
+    else:
+        block = [convert(val) for val in block]
+    dst[:n] = block
+
+
+def c_sum(out, arr, n):
+    check_count(arr, n)
+    return sum(arr[:n])
+
+
+builtins = {
+    'printf': Builtin('printf', VOID_TYPE, [STRING_TYPE], c_printf, variadic=True, compile=compile_printf),
+    'memset': Builtin('memset', VOID_TYPE, [ARRAY, INT_TYPE, INT_TYPE], c_memset),
+    'memcpy': Builtin('memcpy', VOID_TYPE, [ARRAY, ARRAY, INT_TYPE], c_memcpy),
+    'sum': Builtin('sum', ELEMENT, [ARRAY, INT_TYPE], c_sum),
+}
+
+
+def lookup_builtin(name, functions):
+    """
+    Builtin called by name, None if it is not a builtin or the program defines a function of the name.
+    """
+    if name in functions:
+        return None
+    return builtins.get(name)
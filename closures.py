@@ -0,0 +1,482 @@
+import sys
+from astree import *
+from symbol_table import TypeVal, arith_ops, compare_ops, caster, binary_result_type
+from environment import CRuntimeErr, UninitializedError, UNINIT
+from cbuiltins import lookup_builtin
+
+
+"""
+Closure compiling execution engine.
+
+The body of each function definition is compiled once into nested python closures.
+Expression closures take the frame of the function (a list of variable slots)
+and return the evaluated value directly, while statement closures return
+a control signal (None, RETURN when the function should return,
+or BREAK and CONTINUE for the innermost loop).
+Unlike the ast nodes, closures do not keep track of execution lines,
+so this engine is used for running programs to completion.
+"""
+
+
+RETURN = 'return'  # signal of statement closures for return statements
+BREAK = 'break'  # signals for break and continue statements
+CONTINUE = 'continue'
+RETVAL_SLOT = 0  # frame slot holding the return value of the function
+# each C function call nests a few python calls of closures - the python limit is raised for the run
+RECURSION_LIMIT = 100000
+
+
+def raiser(msg):
+    """
+    Closure that raises a runtime error once it is executed.
+    """
+    def raise_err(f):
+        raise CRuntimeErr(msg)
+    return raise_err
+
+
+class CompiledFunction:
+    """
+    A function definition compiled into closures.
+    """
+    def __init__(self, name, rtype, params):
+        self.name = name
+        self.rtype = rtype  # TypeVal
+        self.params = params  # list of (TypeVal, slot) pairs
+        self.nslots = len(params) + 1
+        self.body = None  # closure of function body
+
+    def new_slot(self):
+        self.nslots += 1
+        return self.nslots - 1
+
+    def invoke(self, args):
+        """
+        Calls the function with already evaluated arguments.
+        """
+        frame = [UNINIT] * self.nslots
+        for (_, slot), arg in zip(self.params, args):
+            frame[slot] = arg
+        self.body(frame)
+        return frame[RETVAL_SLOT]
+
+
+class CompileScope:
+    """
+    Block scope used while compiling - maps variable names to (slot, TypeVal).
+    """
+    def __init__(self, parent=None):
+        self.names = {}
+        self.parent = parent
+
+    def lookup(self, name):
+        scope = self
+        while scope is not None:
+            if name in scope.names:
+                return scope.names[name]
+            scope = scope.parent
+        return None
+
+
+class ClosureCompiler:
+    """
+    Compiles function definitions into CompiledFunction instances.
+    """
+    def __init__(self, fundefs, out):
+        self.fundefs = fundefs
+        self.out = out  # OutputSink the builtins print to
+        self.functions = {}  # function name -> CompiledFunction
+        self.curr_func = None
+
+    def compile_program(self):
+        # register all signatures first so that calls can be bound in any order
+        for fundef in self.fundefs:
+            self.functions[fundef.name()] = self.compile_signature(fundef)
+        for fundef in self.fundefs:
+            func = self.functions[fundef.name()]
+            self.curr_func = func
+            scope = CompileScope()
+            for param_type, slot in func.params:
+                scope.names[func.param_names[slot]] = (slot, param_type)
+            func.body = self.compile_stmt(fundef.body, scope)
+        return self.functions
+
+    def compile_signature(self, fundef):
+        _, rptr, _ = unpack_declarator(fundef.name_params)
+        rtype = TypeVal(spec_typename(fundef.return_type), ptr=rptr)
+        params = []
+        param_names = {}
+        param_list = fundef.name_params.param_type_list
+        for param in (param_list if param_list is not None else []):
+            typename = spec_typename(param.dec_specs)
+            if param.declarator is None:  # ex) int main(void)
+                continue
+            name, ptr, arr_size = unpack_declarator(param.declarator)
+            param_type = TypeVal(typename, ptr=ptr, array=0 if arr_size is None else 1)
+            slot = len(params) + 1
+            params.append((param_type, slot))
+            param_names[slot] = name
+        func = CompiledFunction(fundef.name(), rtype, params)
+        func.param_names = param_names
+        return func
+
+    def compile_stmt(self, node, scope):
+        return getattr(self, 'stmt_' + node.__class__.__name__)(node, scope)
+
+    def compile_expr(self, node, scope):
+        """
+        Returns a pair of (closure, TypeVal) for the expression.
+        """
+        return getattr(self, 'expr_' + node.__class__.__name__)(node, scope)
+
+    # statements
+
+    def stmt_CompoundStatement(self, node, scope):
+        block_scope = CompileScope(scope)
+        stmts = [self.compile_stmt(item, block_scope) for item in node]
+        stmts = [stmt for stmt in stmts if stmt is not None]
+        if len(stmts) == 1:
+            return stmts[0]
+
+        def run_block(f):
+            for stmt in stmts:
+                signal = stmt(f)
+                if signal is not None:
+                    return signal
+        return run_block
+
+    def stmt_Declaration(self, node, scope):
+        typename = spec_typename(node.declaration_spec)
+        inits = []
+        for dec in node.init_dec_list:
+            initializer = None
+            if isinstance(dec, InitDeclarator):
+                initializer = dec.initializer
+                dec = dec.declarator
+            name, ptr, arr_size = unpack_declarator(dec)
+            if name in scope.names:
+                inits.append(raiser('Symbol "{}" already bound in this scope'.format(name)))
+                continue
+
+            vtype = TypeVal(typename, ptr=ptr, array=0 if arr_size is None else 1)
+            slot = self.curr_func.new_slot()
+            scope.names[name] = (slot, vtype)
+            if arr_size is not None:
+                inits.append(self.array_init(slot, vtype, arr_size, scope))
+            elif initializer is not None:
+                inits.append(self.store(slot, vtype, initializer, scope))
+
+        def run_decl(f):
+            for init in inits:
+                init(f)
+        return run_decl if len(inits) > 0 else None
+
+    def array_init(self, slot, vtype, arr_size, scope):
+        size, _ = self.compile_expr(arr_size, scope)
+        default = 0 if vtype.typename == 'int' else 0.0
+
+        def init_array(f):
+            f[slot] = [default] * size(f)
+        return init_array
+
+    def store(self, slot, vtype, rvalue, scope):
+        value, rtype = self.compile_expr(rvalue, scope)
+        cast = caster(rtype, vtype)
+        if cast is None:
+            def assign(f):
+                f[slot] = v = value(f)
+                return v
+        else:
+            def assign(f):
+                f[slot] = v = cast(value(f))
+                return v
+        return assign
+
+    def stmt_ExpressionStatement(self, node, scope):
+        if node.expr is None:
+            return None
+        expr, _ = self.compile_expr(node.expr, scope)
+
+        def run_expr(f):
+            expr(f)
+        return run_expr
+
+    def stmt_SelectionStatement(self, node, scope):
+        cond, _ = self.compile_expr(node.if_cond, scope)
+        if_stmt = self.compile_stmt(node.if_expr, CompileScope(scope))
+        else_stmt = None
+        if node.else_expr is not None:
+            else_stmt = self.compile_stmt(node.else_expr, CompileScope(scope))
+
+        def run_if(f):
+            if cond(f):
+                if if_stmt is not None:
+                    return if_stmt(f)
+            elif else_stmt is not None:
+                return else_stmt(f)
+        return run_if
+
+    def stmt_IterationStatement(self, node, scope):
+        iter_scope = CompileScope(scope)
+        init = None
+        cond = None
+        update = None
+        if node.iter_type == 'for':
+            if node.exp1 is not None:
+                init = self.compile_stmt(node.exp1, iter_scope)
+            if node.exp2 is not None and node.exp2.expr is not None:
+                cond, _ = self.compile_expr(node.exp2.expr, iter_scope)
+            if node.exp3 is not None:
+                update, _ = self.compile_expr(node.exp3, iter_scope)
+        else:
+            cond, _ = self.compile_expr(node.exp1, iter_scope)
+        body = self.compile_stmt(node.body, iter_scope)
+        if body is None:
+            body = lambda f: None
+        if cond is None:
+            cond = lambda f: 1
+
+        def run_loop(f):
+            if init is not None:
+                init(f)
+            while cond(f):
+                signal = body(f)
+                if signal is not None:
+                    if signal is BREAK:
+                        break
+                    elif signal is RETURN:
+                        return signal
+                if update is not None:
+                    update(f)
+        return run_loop
+
+    def stmt_JumpStatement(self, node, scope):
+        if node.jump_type == 'break':
+            return lambda f: BREAK
+        elif node.jump_type == 'continue':
+            return lambda f: CONTINUE
+        if node.what is None:
+            return lambda f: RETURN
+
+        value, vtype = self.compile_expr(node.what, scope)
+        cast = caster(vtype, self.curr_func.rtype)
+        if self.curr_func.rtype.typename == 'void':
+            cast = None
+
+        def run_return(f):
+            v = value(f)
+            f[RETVAL_SLOT] = v if cast is None else cast(v)
+            return RETURN
+        return run_return
+
+    # expressions
+
+    def expr_Constant(self, node, scope):
+        value = node.value
+        return (lambda f: value), TypeVal(node.const_type)
+
+    def expr_String(self, node, scope):
+        string = node.string
+        return (lambda f: string), TypeVal('string')
+
+    def expr_Id(self, node, scope):
+        var = scope.lookup(node.name())
+        if var is None:
+            return raiser('Name {} does not exist!'.format(node.name())), TypeVal('int')
+        slot, vtype = var
+        return (lambda f: f[slot]), vtype
+
+    def expr_Expression(self, node, scope):
+        exprs = [self.compile_expr(expr, scope) for expr in node]
+        if len(exprs) == 1:
+            return exprs[0]
+
+        last_expr, vtype = exprs[-1]
+        first_exprs = [expr for expr, _ in exprs[:-1]]
+
+        def run_exprs(f):
+            for expr in first_exprs:
+                expr(f)
+            return last_expr(f)
+        return run_exprs, vtype
+
+    def expr_Assignment(self, node, scope):
+        lvalue = node.lvalue
+        if isinstance(lvalue, Id):
+            var = scope.lookup(lvalue.name())
+            if var is None:
+                return raiser('Name {} does not exist!'.format(lvalue.name())), TypeVal('int')
+            slot, vtype = var
+            return self.store(slot, vtype, node.rvalue, scope), vtype
+        elif isinstance(lvalue, ArrayReference):
+            arr, idx, elem_type = self.array_access(lvalue, scope)
+            value, rtype = self.compile_expr(node.rvalue, scope)
+            cast = caster(rtype, elem_type)
+            if cast is None:
+                def assign_elem(f):
+                    arr(f)[idx(f)] = v = value(f)
+                    return v
+            else:
+                def assign_elem(f):
+                    arr(f)[idx(f)] = v = cast(value(f))
+                    return v
+            return assign_elem, elem_type
+        return raiser('Cannot assign to {}'.format(lvalue)), TypeVal('int')
+
+    def array_access(self, node, scope):
+        """
+        Returns closures for the array and the index, and the element type.
+        """
+        arr, arr_type = self.compile_expr(node.name, scope)
+        idx, _ = self.compile_expr(node.idx, scope)
+        if arr_type.sum_arr_ptr() == 0:
+            arr = raiser('Name {} not array!'.format(node.name))
+        return arr, idx, TypeVal(arr_type.typename)
+
+    def expr_ArrayReference(self, node, scope):
+        arr, idx, elem_type = self.array_access(node, scope)
+        return (lambda f: arr(f)[idx(f)]), elem_type
+
+    def expr_TypeCast(self, node, scope):
+        value, vtype = self.compile_expr(node.cast_expr, scope)
+        cast_type = TypeVal(spec_typename(node.type_name))
+        if not vtype.castable(cast_type):
+            return raiser('Type cannot be casted {}, {}'.format(vtype, cast_type)), cast_type
+        cast = caster(vtype, cast_type)
+        if cast is None:
+            return value, cast_type
+        return (lambda f: cast(value(f))), cast_type
+
+    def expr_UnaryExpr(self, node, scope):
+        inc = 1 if node.op_name == '++' else -1
+        operand = node.operand
+        if isinstance(operand, Id):
+            var = scope.lookup(operand.name())
+            if var is None:
+                return raiser('Name {} does not exist!'.format(operand.name())), TypeVal('int')
+            slot, vtype = var
+            if node.is_postfix:
+                def post_update(f):
+                    v = f[slot]
+                    f[slot] = v + inc
+                    return v
+                return post_update, vtype
+
+            def pre_update(f):
+                f[slot] = v = f[slot] + inc
+                return v
+            return pre_update, vtype
+        elif isinstance(operand, ArrayReference):
+            arr, idx, elem_type = self.array_access(operand, scope)
+            is_postfix = node.is_postfix
+
+            def update_elem(f):
+                a = arr(f)
+                i = idx(f)
+                v = a[i]
+                a[i] = v + inc
+                return v if is_postfix else v + inc
+            return update_elem, elem_type
+        return raiser('Cannot apply {} to {}'.format(node.op_name, operand)), TypeVal('int')
+
+    def expr_BinaryOp(self, node, scope):
+        op = node.op.op if isinstance(node.op, Op) else node.op
+        left, ltype = self.compile_expr(node.arg1, scope)
+        right, rtype = self.compile_expr(node.arg2, scope)
+        vtype = binary_result_type(op, ltype, rtype)
+        if op not in ('/', '%') and not ltype.castable(rtype):
+            return raiser('Type not castable {} and {}'.format(ltype, rtype)), vtype
+
+        # the right operand is evaluated only if the left one does not decide the result
+        if op == '&&':
+            return (lambda f: 1 if left(f) and right(f) else 0), vtype
+        elif op == '||':
+            return (lambda f: 1 if left(f) or right(f) else 0), vtype
+        elif op in compare_ops:
+            compare = compare_ops[op]
+            return (lambda f: 1 if compare(left(f), right(f)) else 0), vtype
+        elif op not in arith_ops:
+            return raiser('Invalid binary operator {}'.format(op)), vtype
+
+        arith = arith_ops[op]
+        if op == '%' and (ltype.typename != 'int' or rtype.typename != 'int'):
+            return (lambda f: int(arith(left(f), right(f)))), vtype
+        return (lambda f: arith(left(f), right(f))), vtype
+
+    def expr_FunctionCall(self, node, scope):
+        funcname = node.func_name.name()
+        args = [self.compile_expr(arg, scope) for arg in node.argument_list]
+        builtin = lookup_builtin(funcname, self.functions)
+        if builtin is not None:
+            return self.native_call(builtin, node, args)
+
+        func = self.functions.get(funcname)
+        if func is None:
+            return raiser('No function named {} defined.'.format(funcname)), TypeVal('int')
+        if len(args) != len(func.params):
+            return raiser('Argument number mismatch'), func.rtype
+
+        # bind arguments to the parameter slots of callee's frame
+        arg_binds = []
+        for (arg, arg_type), (param_type, slot) in zip(args, func.params):
+            if not arg_type.castable(param_type):
+                return raiser('Argument type mismatch {}, {}'.format(arg_type, param_type)), func.rtype
+            cast = caster(arg_type, param_type)
+            if cast is not None:
+                arg = (lambda arg, cast: lambda f: cast(arg(f)))(arg, cast)
+            arg_binds.append((slot, arg))
+
+        def call(f):
+            frame = [UNINIT] * func.nslots
+            for slot, arg in arg_binds:
+                frame[slot] = arg(f)
+            func.body(frame)
+            return frame[RETVAL_SLOT]
+        return call, func.rtype
+
+    def native_call(self, builtin, node, args):
+        arg_types = [arg_type for _, arg_type in args]
+        msg = builtin.check(arg_types)
+        if msg is not None:
+            return raiser(msg), builtin.rtype
+        first_arg = node.argument_list[0] if len(node.argument_list) > 0 else None
+        native = builtin.bind(first_arg.string if isinstance(first_arg, String) else None)
+        arg_vals = [arg for arg, _ in args]
+        out = self.out
+        if len(arg_vals) == 1:
+            arg = arg_vals[0]
+            return (lambda f: native(out, arg(f))), builtin.result_type(arg_types)
+        return (lambda f: native(out, *[arg(f) for arg in arg_vals])), builtin.result_type(arg_types)
+
+
+def compile_program(fundefs, out):
+    """
+    Compiles all function definitions, printing into the OutputSink out.
+    Returns the mapping of names to CompiledFunctions.
+    """
+    return ClosureCompiler(fundefs, out).compile_program()
+
+
+def run_program(fundefs, out):
+    """
+    Compiles and runs the program by calling main(), printing into the OutputSink out.
+    Returns the exit status of the program.
+    """
+    functions = compile_program(fundefs, out)
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, RECURSION_LIMIT))
+    try:
+        retval = functions['main'].invoke([])
+    except UninitializedError:
+        raise CRuntimeErr('Variable not initialized!')
+    except IndexError:
+        raise CRuntimeErr('Index error - array index out of range')
+    except ZeroDivisionError:
+        raise CRuntimeErr('Division by zero')
+    except RecursionError:
+        raise CRuntimeErr('Stack overflow - function calls nested too deeply')
+    finally:
+        sys.setrecursionlimit(limit)
+    if retval is UNINIT:
+        return 0
+    return int(retval)
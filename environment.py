@@ -1,19 +1,143 @@
+from symbol_table import Symbol, Value
+
+
+# counters of the execution engine internals, printed by the --profile option
+profile_counts = {
+    'child_sorts': 0,  # sorting children of a node in execution order
+    'block_scopes': 0,  # scopes created for selection and iteration statements
+}
+
+
+class Activation:
+    """
+    Activation record of a function call.
+    Keeps the execution states of the ast nodes executed within the call,
+    so that the ast itself is not modified during execution.
+    """
+    def __init__(self, call_node=None, funcval=None, func_scope=None, stack_base=0, value_base=0):
+        self.call_node = call_node  # FunctionCall node that made the call
+        self.funcval = funcval  # FunctionVal being called
+        self.func_scope = func_scope  # scope holding the arguments
+        self.stack_base = stack_base  # size of execution stack when the call was made
+        self.value_base = value_base  # size of value stack when the call was made
+        self.node_states = {}  # id(node) -> state of node being executed
+        self.loops = []  # (loop node, execution stack size, value stack size, scope) of the running loops
+
+    def __repr__(self):
+        return 'Activation({})'.format(self.call_node)
+
+
 class ExecutionEnvironment:
-    def __init__(self, exec_stack, currline, scope, call_stack, value_stack=[]):
+    def __init__(self, exec_stack, currline, scope, call_stack, value_stack=None):
         self.exec_stack = exec_stack
         self.currline = currline
         self.scope = scope
-        self.call_stack = call_stack
-        self.value_stack = value_stack
-        self.booked_updates = []
+        self.root_scope = scope.root_scope()  # scope holding the functions
+        self.call_stack = call_stack  # activation records of function calls
+        self.value_stack = value_stack if value_stack is not None else []
+        self.pending_updates = []  # (symbol or array element, delta, line) of postfix ++ and --
+        self.exit_val = None  # value returned by the outermost function call
+        self.watches = {}  # (id(declaring node), name) -> Watch of the declarations watched in the interactive mode
+        self.recorder = None  # TraceRecorder of the execution, if any - see recorder.py
+        self.out = None  # OutputSink the program prints to - see output.py
+        self.root_activation = Activation()  # for nodes executed outside of any function
+        self.activation = call_stack[-1] if len(call_stack) > 0 else self.root_activation
+
+    def push_activation(self, activation):
+        self.call_stack.append(activation)
+        self.activation = activation
 
-    def book_update(self, update):
-        self.booked_updates.append(update)
+    def pop_activation(self):
+        activation = self.call_stack.pop()
+        self.activation = self.call_stack[-1] if len(self.call_stack) > 0 else self.root_activation
+        return activation
+
+    def is_visited(self, node):
+        return id(node) in self.activation.node_states
+
+    def node_state(self, node):
+        """
+        Execution state of the node in current activation - None if not visited.
+        """
+        return self.activation.node_states.get(id(node))
+
+    def visit(self, node, state=True):
+        self.activation.node_states[id(node)] = state
+
+    def leave(self, node):
+        self.activation.node_states.pop(id(node), None)
+
+    def enter_loop(self, loop):
+        """
+        Records the loop node on top of the execution stack, for break and continue statements.
+        """
+        self.activation.loops.append((loop, len(self.exec_stack), len(self.value_stack), self.scope))
+
+    def exit_loop(self):
+        self.activation.loops.pop()
+
+    def jump_to_loop(self):
+        """
+        Discards the rest of the innermost loop body - the loop node is left on top of the execution stack.
+        Returns the loop node.
+        """
+        loop, stack_base, value_base, scope = self.activation.loops[-1]
+        for node in self.exec_stack[stack_base:]:
+            self.leave(node)
+        del self.exec_stack[stack_base:]
+        del self.value_stack[value_base:]
+        self.scope = scope
+        return loop
 
-    def exec_booked_updates(self):
-        for update in self.booked_updates:
-            update['exec_target'](*update['arg'])
-        self.booked_updates = []  # done
+    def return_from_call(self, ret_val):
+        """
+        Returns from the current function call - the rest of the function body is discarded.
+        """
+        activation = self.activation
+        func_scope = activation.func_scope
+        func_scope.return_val = ret_val
+        if len(self.call_stack) == 1:
+            self.exit_val = ret_val
+        del self.exec_stack[activation.stack_base:]
+        del self.value_stack[activation.value_base:]
+        self.scope = func_scope
+        self.currline = func_scope.return_lineno
+
+    def returning(self):
+        """
+        Whether the current call has returned, and its call node is yet to hand the value to the caller -
+        the line is the one of the caller already, but the scope is still the one of the call.
+        """
+        activation = self.activation
+        return activation.call_node is not None and len(self.exec_stack) == activation.stack_base
+
+    def book_update(self, target, delta, lineno):
+        """
+        Defers a postfix increment or decrement to the next sequence point.
+        """
+        self.pending_updates.append((target, delta, lineno))
+
+    def sequence_point(self):
+        """
+        Applies the pending postfix updates - called at the end of each full expression.
+        """
+        if len(self.pending_updates) == 0:
+            return
+        for target, delta, lineno in self.pending_updates:
+            if isinstance(target, Symbol):
+                value = target.value
+                target.set_value(Value(value.vtype, value.val + delta), lineno)
+            else:  # array element
+                target.store(target.storage[target.idx] + delta)
+            self.record_write(target)
+        self.pending_updates.clear()  # the queue is reused
+
+    def record_write(self, target):
+        """
+        Passes a write of a variable or an array element by the node executing to the trace recorder.
+        """
+        if self.recorder is not None:
+            self.recorder.write(target, self.exec_stack[-1])
 
     def update_currline(self, no):
         self.currline += no
@@ -30,13 +154,42 @@ class ExecutionEnvironment:
     def pop_val(self):
         return self.value_stack.pop()
 
-    def print_valstack(self):
-        stack_val_print = ''
-        for stack_val in self.value_stack:
-            stack_val_print += (stack_val.__repr__() + ' :: ')
-
 
 class CRuntimeErr(Exception):
     def __init__(self, msg, env=None):
         self.msg = msg
         self.env = env
+
+
+class UninitializedError(Exception):
+    """
+    Raised by the operations on UNINIT - the engines report it as a runtime error.
+    """
+    pass
+
+
+class Uninitialized:
+    """
+    Value of the variable slots of the closure and bytecode engines that have not been set,
+    and of the calls that return nothing. It counts as false in conditions, as a missing value does,
+    and any other use of it raises UninitializedError - the engines need no check on each load.
+    """
+    __slots__ = ()
+
+    def fail(self, *args):
+        raise UninitializedError()
+
+    __add__ = __radd__ = __sub__ = __rsub__ = __mul__ = __rmul__ = fail
+    __truediv__ = __rtruediv__ = __mod__ = __rmod__ = __neg__ = fail
+    __lt__ = __le__ = __gt__ = __ge__ = __eq__ = __ne__ = fail
+    __int__ = __float__ = __index__ = __str__ = __format__ = fail
+    __hash__ = None
+
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return 'UNINIT'
+
+
+UNINIT = Uninitialized()
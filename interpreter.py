@@ -2,28 +2,75 @@ import os
 import re
 import sys
 import yacc
+import closures
+import vm
+import output
+import recorder
+from breakpoints import Breakpoints, ConditionError
 import operator
 from astree import *
-from symbol_table import Scope, Symbol
+from symbol_table import Scope, Symbol, ValueHistory, Watch
+from resolver import resolve_names
+from optimizer import optimize_program
+from typechecker import check_types
 import argparse
+from collections import deque
 
 
 class Logger:
     """
-    Logger for this interpreter.
+    Execution log of the stepping engine, shown by the log command.
+    The nodes executed are kept as raw records in a bounded deque, and formatted only when shown.
+    Levels:
+        off : nothing is logged
+        node : the nodes executed, with the depths of the execution and value stacks
+        stack : the contents of both stacks as well - the values are shown as they are when printed
     """
-    def __init__(self):
-        self.log = ''
-        self.reset_log()
+    levels = ('off', 'node', 'stack')
 
-    def reset_log(self):
-        self.log = '--' * 10 + '\n'
+    def __init__(self, level='node', maxlen=1000):
+        self.level = level
+        self.node_types = None  # names of the node classes to log - None logs all
+        self.records = deque(maxlen=maxlen)  # (node, exec stack, value stack) after the node executed
+        self.count = 0  # records added since the last reset, including the ones dropped
+
+    def enabled(self):
+        return self.level != 'off'
+
+    def set_level(self, level):
+        assert level in Logger.levels
+        self.level = level
 
-    def add_log(self, s):
-        self.log += s
+    def set_node_types(self, node_types):
+        self.node_types = set(node_types) if node_types else None
+
+    def reset_log(self):
+        self.records.clear()
+        self.count = 0
+
+    def add_step(self, node, env):
+        """
+        Logs the node just executed in env.
+        """
+        if self.node_types is not None and node.__class__.__name__ not in self.node_types:
+            return
+        if self.level == 'stack':
+            self.records.append((node, tuple(env.exec_stack), tuple(env.value_stack)))
+        else:
+            self.records.append((node, len(env.exec_stack), len(env.value_stack)))
+        self.count += 1
 
     def printlog(self):
-        print(self.log)
+        print('--' * 10)
+        if self.count > len(self.records):
+            print('({} earlier steps are not kept)'.format(self.count - len(self.records)))
+        for node, exec_stack, value_stack in self.records:
+            print('***Executing {} - {}'.format(node, node.linespan))
+            if isinstance(exec_stack, tuple):
+                print('value stack : {}'.format(' :: '.join(repr(val) for val in value_stack)))
+                print('exec stack : {}'.format(list(exec_stack)))
+            else:
+                print('exec stack depth : {}, value stack depth : {}'.format(exec_stack, value_stack))
 
 
 class SemanticError(Exception):
@@ -34,7 +81,7 @@ class SemanticError(Exception):
 def read_file(filepath):
     code_lines = []  # keep track of lines of code
     s = ''
-    with open(input_file, 'r') as f:
+    with open(filepath, 'r') as f:
         for l in f.readlines():
             s += l
             code_lines.append(l)
@@ -42,9 +89,10 @@ def read_file(filepath):
     return s, code_lines
 
 
-def parse_code(parser, program_str):
+def parse_code(parser, program_str, code_lines, fold=True):
     # parsing step
-    ast_root = parser.parse(s, tracking=True)
+    yacc.reset_parser()
+    ast_root = parser.parse(program_str, tracking=True)
     if len(parser.errorlines) > 0:
         for errorline in parser.errorlines:
             print('Parse Error at line :{}\n{}'.format(errorline, code_lines[errorline - 1]))
@@ -52,58 +100,31 @@ def parse_code(parser, program_str):
 
     if parser.main_func is None:
         raise SemanticError('No main function!')
+    if fold:
+        optimize_program(parser.functions)
+    type_errors = check_types(parser.functions)
+    if len(type_errors) > 0:
+        raise SemanticError('Type Error : {}'.format('\nType Error : '.join(type_errors)))
+    yacc.compute_exec_order(ast_root)
+    resolve_names(parser.functions)
     return parser, ast_root
 
 
 
-if __name__ == '__main__':
-    print('Mini C Interpreter by Dansuh')
-    usage_str = """
-    Usage:
-        - next [lineno] : executes code by lineno lines. if lineno is not given, code executes one line.
-        - print [symbol] : prints the value of symbol
-        - trace [symbol] : shows the value history of symbol
-        - log : shows execution log
-        - scope : shows block scope stack and its contents
-        - exit : stops the interpreter
-    """
-    print(usage_str)
-
-    argparser = argparse.ArgumentParser()
-    argparser.add_argument('--cfile', help='c file to run interpreter on', default='test.c')
-    args = argparser.parse_args()
-
-    # find input c file
-    cfile_dir = './'
-    input_file = args.cfile
-    input_file = os.path.join(cfile_dir, input_file)
-    print('Interpreting : {}'.format(input_file))
-
-    # parse the strings
-    try:
-        s, code_lines = read_file(input_file)
-        parser = yacc.parser  # import the parser
-        parser, ast_root = parse_code(parser, s)
-    except Exception as e:
-        print(e)
-        print('Parse Error')
-        sys.exit(0)
-    errorlines =  parser.errorlines  # lines where syntax error occurred
-
-    # regular expression for id
-    id_regex = re.compile('[a-zA-Z_][a-zA-Z_0-9]*')
-    ast_root.show()
-
+def create_environment(parser, code_lines, out, trace_file=None):
+    """
+    Creates the execution environment that starts with the function call of main().
+    The program prints into the OutputSink out, and the execution is recorded into trace_file, if given.
+    """
     # mark the starting line
     curr_lineno = parser.main_func.linespan[0]  # starting line number of main()
 
-    # register function names - interpreter only recognizes the name
-    # and does not have function closure
+    # register the functions - calls find them ready, with their parameters laid out
     root_scope = Scope(symbol_table={})
     for func in parser.functions:
-        root_scope.add_symbol(
-                symbol_name=func.name(),
-                symbol_info=Symbol(name=func.name(), astnode=func))
+        func_symbol = Symbol(name=func.name(), astnode=func)
+        func_symbol.set_value(func.function_val(), func.startline())
+        root_scope.add_symbol(symbol_name=func.name(), symbol_info=func_symbol)
     scope = root_scope  # current evaluation scope
     root_scope.return_lineno = len(code_lines) - 1
 
@@ -115,16 +136,314 @@ if __name__ == '__main__':
     exec_stack = [main_call]
     call_stack = []
     env = ExecutionEnvironment(exec_stack, curr_lineno, scope, call_stack)
+    env.out = out
+    if trace_file is not None:
+        env.recorder = recorder.TraceRecorder(trace_file)
+    return env
+
+
+def exit_status(env):
+    """
+    Exit status of the program - the value returned by main(), or 0 if none.
+    """
+    retval = env.exit_val
+    if isinstance(retval, Value) and retval.val is not None:
+        return int(retval.val)
+    return 0
+
+
+def run_batch(env, code_lines):
+    """
+    Runs the program to completion without prompting for commands.
+    Only the line bookkeeping that the execution itself depends on is done here -
+    no execution logs and no line printing.
+    Returns the exit status of the program.
+    """
+    exec_stack = env.exec_stack
+    endline = len(code_lines)
+    trace = env.recorder
+    ran = None  # node executed last in the line - the node on top of the stack may wait for a later line
+    while len(exec_stack) > 0 and env.currline < endline:
+        currline = env.currline
+        stacklen = len(exec_stack)
+        node = exec_stack[-1]
+        exec_done, env = node.execute(env)
+        if exec_done or len(exec_stack) != stacklen:
+            ran = node
+
+        if currline == env.currline:
+            if exec_done or len(exec_stack) != stacklen:
+                continue  # more nodes to execute in this line
+            env.update_currline(1)  # current line is done
+        if trace is not None:
+            trace.step(ran, currline)
+            ran = None
+    return exit_status(env)
+
+
+class StepSession:
+    """
+    Interactive session stepping through the ast nodes.
+    """
+    def __init__(self, env, code_lines, log_level='node'):
+        self.env = env
+        self.out = env.out
+        self.code_lines = code_lines
+        self.logger = Logger(log_level)
+        self.total_line = 0
+        self.watch_hits = []  # (Watch, old value, new value, line) of the changes of the watched variables
+
+    def currline(self):
+        return self.env.currline
+
+    def is_done(self):
+        return self.env.currline >= len(self.code_lines) or len(self.env.exec_stack) == 0
+
+    def reset_log(self):
+        self.logger.reset_log()
+
+    def step(self):
+        """
+        Executes the current line.
+        Returns True if the line has been done without jumping to another line.
+        """
+        env = self.env
+        exec_stack = env.exec_stack
+        log_step = self.logger.add_step if self.logger.enabled() else None
+        currline = env.currline  # store the current execution line
+        ran = None  # node executed last in the line - the node on top of the stack may wait for a later line
+        while True:
+            stacklen = len(exec_stack)
+            if stacklen == 0:  # indicates end of program
+                break
+
+            # execute one node
+            node = exec_stack[-1]
+            exec_done, env = node.execute(env)
+            if log_step is not None:
+                log_step(node, env)
+            if exec_done or len(exec_stack) != stacklen:
+                ran = node
+
+            # whether or not execution stream for current line is done
+            if (not exec_done and len(exec_stack) == stacklen) or (currline != env.currline):
+                break
+
+        while env.returning():
+            # back into the scope of the caller, in the middle of the line of the call - not run in this line
+            node = exec_stack[-1]
+            exec_done, env = node.execute(env)
+            if log_step is not None:
+                log_step(node, env)
+
+        if env.recorder is not None and stacklen > 0:
+            env.recorder.step(ran, currline)
+
+        # update line number
+        line_done = currline == env.currline
+        if line_done:
+            env.update_currline(1)  # 1 line just for now
+            # keep track of line numbers
+            self.total_line += 1
+        return line_done
+
+    def run_until(self, lines, stops=None):
+        """
+        Executes lines until one of the lines (a set) is reached, or the program ends.
+        stops(line) decides whether to stop at a line reached, and the execution also stops
+        after a line changing a watched variable.
+        """
+        env = self.env
+        step = self.step
+        call_stack = env.call_stack
+        watch_hits = self.watch_hits
+        while not self.is_done():
+            depth = len(call_stack)
+            step()
+            if len(watch_hits) > 0:
+                break
+            if len(call_stack) < depth:
+                continue  # returned into the middle of the line of the call, which was reached already
+            if env.currline in lines and (stops is None or stops(env.currline)):
+                break
+
+    def depth(self):
+        """
+        Number of function calls being executed - main() counts before its call is executed as well.
+        """
+        return max(len(self.env.call_stack), 1)
+
+    def run_out(self, depth, lines, stops=None):
+        """
+        Executes until the calls deeper than depth return, stopping right after the return -
+        in the middle of the line of the call. Breakpoints and watched variables stop the execution
+        as in run_until. The nodes are executed as run_batch does, without the execution log.
+        """
+        env = self.env
+        exec_stack = env.exec_stack
+        call_stack = env.call_stack
+        endline = len(self.code_lines)
+        trace = env.recorder
+        watch_hits = self.watch_hits
+        ran = None  # node executed last in the line, as in run_batch
+        while len(exec_stack) > 0 and env.currline < endline:
+            currline = env.currline
+            stacklen = len(exec_stack)
+            node = exec_stack[-1]
+            exec_done, env = node.execute(env)
+            if exec_done or len(exec_stack) != stacklen:
+                ran = node
+            if len(call_stack) <= depth:
+                break  # back in the frame
+
+            if currline == env.currline:
+                if exec_done or len(exec_stack) != stacklen:
+                    continue  # more nodes to execute in this line
+                env.update_currline(1)  # current line is done
+                self.total_line += 1
+            if trace is not None:
+                trace.step(ran, currline)
+                ran = None
+            if len(watch_hits) > 0:
+                break
+            if env.currline in lines and not env.returning() and (stops is None or stops(env.currline)):
+                break
+
+    def returned_value(self):
+        """
+        Value returned by the call just finished.
+        """
+        env = self.env
+        if len(env.call_stack) == 0:
+            return env.exit_val.printval() if env.exit_val is not None else 'N/A'
+        val = env.value_stack[-1] if len(env.value_stack) > 0 else None
+        return val.printval() if isinstance(val, Value) else 'N/A'
+
+    def watch(self, name):
+        """
+        Watches the declaration of the variable visible - the variables it binds in every call
+        or block executed. Returns the Watch, None if no such variable is visible.
+        """
+        symbol = self.env.scope.getsymbol(name)
+        if symbol is None or isinstance(symbol.value, FunctionVal):
+            return None
+        watch = Watch(name, self.watch_hits)
+        self.env.watches[(id(symbol.astnode), name)] = watch
+        symbol.watch = watch
+        return watch
+
+    def unwatch(self, watch):
+        watch.active = False
+        self.env.watches = {key: other for key, other in self.env.watches.items() if other is not watch}
+
+    def pop_watch_hits(self):
+        hits = list(self.watch_hits)
+        self.watch_hits.clear()
+        return hits
+
+    def valueof(self, name):
+        """
+        Value of the variable visible - a number, the storage of an array, or UNINIT if it is not set.
+        """
+        value = self.env.scope.getvalue(name)
+        if value is None:
+            raise CRuntimeErr('Name {} does not exist!'.format(name), self.env)
+        return UNINIT if value.val is None else value.val
+
+    def getvalue(self, name):
+        val = self.env.scope.getvalue(name)
+        if val is None:
+            return None
+        return val.printval()
+
+    def gethistory(self, name):
+        symbol = self.env.scope.getsymbol(name)
+        if symbol is None:
+            return None
+        if symbol.val_history is None:
+            return ValueHistory()  # never set
+        return symbol.val_history
+
+    def show_scope(self):
+        self.env.scope.show()
+
+    def show_log(self):
+        self.logger.printlog()
+
+    def set_log(self, level=None, node_types=None):
+        if level is not None:
+            self.logger.set_level(level)
+        if node_types is not None:
+            self.logger.set_node_types(node_types)
+
+    def exit_status(self):
+        return exit_status(self.env)
+
+
+def show_watch_hits(session, breakpoints):
+    """
+    Shows the changes of the watched variables since the last call. Returns whether there were any.
+    """
+    hits = session.pop_watch_hits()
+    for watch, old, new, line in hits:
+        print('Watchpoint {} : {} changed from {} to {} at line {}'.format(watch.number, watch.name, old, new, line))
+    return len(hits) > 0
+
+
+def breakpoint_stops(session, breakpoints):
+    """
+    Function deciding whether the session stops at a line reached, by the conditions of the breakpoints.
+    """
+    breakpoints.hits = []
+    return lambda line: breakpoints.stops_at(line, session.valueof)
+
+
+def show_stop(session, breakpoints):
+    """
+    Shows the watchpoints or the breakpoints the session stopped at.
+    """
+    if not show_watch_hits(session, breakpoints) and not session.is_done():
+        for number in breakpoints.hits:
+            print('Breakpoint {} : {}'.format(number, breakpoints.points[number][1]))
+
+
+def step_over(session, breakpoints):
+    """
+    Executes the current line, running the functions it calls through without stopping at their lines -
+    unless a breakpoint or a watchpoint stops the execution in them.
+    """
+    depth = session.depth()
+    stops = breakpoint_stops(session, breakpoints)
+    while True:
+        session.step()
+        if session.is_done() or session.depth() <= depth:
+            return  # the line is done, or the function has returned
+        # entered a function called by the line - run it until it returns in the middle of the line
+        if session.currline() in breakpoints.lines and stops(session.currline()):
+            return
+        session.run_out(depth, breakpoints.lines, stops)
+        if session.is_done() or session.depth() > depth:
+            return  # stopped in the function
+
+
+def run_interactive(session, code_lines, functions):
+    """
+    Runs the program by the commands that user types in.
+    """
+    breakpoints = Breakpoints(functions)
+
+    # regular expression for id
+    id_regex = re.compile('[a-zA-Z_][a-zA-Z_0-9]*')
 
     # evalutaion loop
-    total_line = 0
     numlines = 0
-    logger = Logger()
 
     while True:
         if numlines == 0:
             # get command
-            print('NEXT line ({}): {}'.format(env.currline, code_lines[env.currline - 1]))
+            currline = session.currline()
+            session.out.flush()  # the program output so far comes before the prompt
+            print('NEXT line ({}): {}'.format(currline, code_lines[currline - 1]))
             command = input('Command:')  # next line
 
             # parse and do appropriate action per command
@@ -135,9 +454,9 @@ if __name__ == '__main__':
                 commandlst = command.strip().split()
             cmd = commandlst[0]
 
-            if cmd == 'next':
+            if cmd in ('next', 'step'):
                 if len(commandlst) > 2:
-                    print('Incorrect command usage : try "next [lines]"')
+                    print('Incorrect command usage : try "{} [lines]"'.format(cmd))
                     continue
 
                 try:
@@ -145,9 +464,24 @@ if __name__ == '__main__':
                         numlines = 1
                     else:
                         numlines = int(commandlst[1])
-                    logger.reset_log()
+                    session.reset_log()
                 except:
-                    print('Incorrect command usage : try "next [lines]"')
+                    print('Incorrect command usage : try "{} [lines]"'.format(cmd))
+                    continue
+            elif cmd in ('over', 'finish'):
+                if len(commandlst) > 1:
+                    print('Incorrect command usage : try "{}"'.format(cmd))
+                    continue
+                session.reset_log()
+                depth = session.depth()
+                if cmd == 'over':
+                    step_over(session, breakpoints)
+                else:
+                    session.run_out(depth - 1, breakpoints.lines, breakpoint_stops(session, breakpoints))
+                show_stop(session, breakpoints)
+                if cmd == 'finish' and session.depth() < depth and not session.is_done():
+                    print('Value returned : {}'.format(session.returned_value()))
+                if not session.is_done():
                     continue
             elif cmd == 'print':
                 symbolname = commandlst[1]
@@ -157,76 +491,243 @@ if __name__ == '__main__':
                 if not doesmatch:
                     print('Invalid typing of the variable name')
                 else:
-                    val = env.scope.getvalue(symbolname)
+                    val = session.getvalue(symbolname)
                     if val is None:
                         print('Invisible variable')
                     else:
-                        print(val.printval())
+                        print(val)
                 continue
             elif cmd == 'trace':
+                if len(commandlst) not in (2, 3):
+                    print('Incorrect command usage : try "trace [symbol] [lineno]"')
+                    continue
                 varname = commandlst[1]
                 doesmatch = id_regex.match(varname)
                 if not doesmatch:
                     print('Invalid typing of the variable name')
                     continue
+                try:
+                    lineno = int(commandlst[2]) if len(commandlst) == 3 else None
+                except ValueError:
+                    print('Incorrect command usage : try "trace [symbol] [lineno]"')
+                    continue
 
-                symbol = env.scope.getsymbol(varname)
-                if symbol is None:
+                history = session.gethistory(varname)
+                if history is None:
                     print('Invisible variable')
                 else:
-                    for val, line_num in symbol.val_history:
-                        val_print = val.printval()
-                        print('{} = {} at line {}'.format(symbol.name, val_print, line_num))
+                    if history.dropped() > 0:
+                        print('({} earlier values are not kept)'.format(history.dropped()))
+                    entries = history.entries() if lineno is None else history.at_line(lineno)
+                    for val_print, line_num in entries:
+                        print('{} = {} at line {}'.format(varname, val_print, line_num))
                 continue
             elif cmd == 'scope':
                 # show scope stack of this environment
-                env.scope.show()
+                session.show_scope()
                 continue
             elif cmd == 'log':
-                logger.printlog()  # show log for value stack and execution stack
+                if len(commandlst) == 1:
+                    session.show_log()  # show log for value stack and execution stack
+                elif commandlst[1] == 'level' and len(commandlst) == 3 and commandlst[2] in Logger.levels:
+                    session.set_log(level=commandlst[2])
+                elif commandlst[1] == 'only':
+                    session.set_log(node_types=commandlst[2:])  # no node types logs all
+                else:
+                    print('Incorrect command usage : try "log", "log level [{}]" or "log only [node types]"'.format(
+                        '|'.join(Logger.levels)))
                 continue
+            elif cmd == 'break':
+                if len(commandlst) == 1:
+                    breakpoints.show()
+                    continue
+                if len(commandlst) == 3 or (len(commandlst) > 3 and commandlst[2] != 'if'):
+                    print('Incorrect command usage : try "break [lineno|function] [if condition]"')
+                    continue
+                where = commandlst[1]
+                condition = ' '.join(commandlst[3:]) if len(commandlst) > 3 else None
+                try:
+                    if where.isdigit():
+                        number = breakpoints.add_line(int(where), condition)
+                        if number is None:
+                            print('No statement at or after line {}'.format(where))
+                            continue
+                    else:
+                        number = breakpoints.add_function(where, condition)
+                        if number is None:
+                            print('No function named {}'.format(where))
+                            continue
+                except ConditionError as e:
+                    print('Invalid condition : {}'.format(e))
+                    continue
+                print('Breakpoint {} : {}'.format(number, breakpoints.points[number][1]))
+                continue
+            elif cmd == 'watch':
+                if len(commandlst) != 2 or not id_regex.fullmatch(commandlst[1]):
+                    print('Incorrect command usage : try "watch [symbol]"')
+                    continue
+                watch = session.watch(commandlst[1])
+                if watch is None:
+                    print('Invisible variable {}'.format(commandlst[1]))
+                    continue
+                number = breakpoints.add_watch(watch)
+                print('Watchpoint {} : {}'.format(number, commandlst[1]))
+                continue
+            elif cmd == 'delete':
+                try:
+                    number = int(commandlst[1]) if len(commandlst) == 2 else None
+                except ValueError:
+                    number = -1
+                if len(commandlst) > 2 or number == -1:
+                    print('Incorrect command usage : try "delete [breakpoint number]"')
+                else:
+                    deleted = [watch for num, watch in breakpoints.watches.items() if number in (None, num)]
+                    if not breakpoints.delete(number):
+                        print('No breakpoint number {}'.format(number))
+                    for watch in deleted:
+                        session.unwatch(watch)
+                continue
+            elif cmd == 'continue':
+                session.reset_log()
+                session.run_until(breakpoints.lines, breakpoint_stops(session, breakpoints))
+                show_stop(session, breakpoints)
+                if not session.is_done():
+                    continue
             elif cmd == 'exit':
                 print('Bye')
                 sys.exit(0)
             else:
-                print('Wrong command - use either "next", "print", "trace", "scope" or "log"')
+                print('Wrong command - use either "next", "step", "over", "finish", "continue", "break", "watch", "delete", "print", "trace", "scope" or "log"')
                 continue
 
         # if it reaches this point, the intepreter is proceeding the lines
-        currline = env.currline  # store the current execution line
-        # handle syntax error
-        if env.currline in errorlines:
-            print('Syntax Error at line {} for line {}'.format(env.currline, total_line))
+        if numlines > 0:
+            if session.step():
+                numlines -= 1
+            if show_watch_hits(session, breakpoints):
+                numlines = 0  # a watched variable changed
+
+        # end of program indicator
+        if session.is_done():
+            session.out.flush()
+            print('End of Program')
             break
+    return session.exit_status()
 
-        while True:
-            stacklen = len(exec_stack)
-            if stacklen == 0:  # indicates end of program
-                break
 
-            # execute one node
-            logger.add_log('***Executing {} - {}\n'.format(exec_stack[-1], exec_stack[-1].linespan))
-            exec_done, env = exec_stack[-1].execute(env)
-            # print stack values for debugging
-            logger.add_log('value stack : {}\n'.format(env.print_valstack()))
-            logger.add_log('exec stack : {}\n'.format(env.exec_stack))
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('--cfile', help='c file to run interpreter on', default='test.c')
+    argparser.add_argument('--run', action='store_true',
+            help='run main() to completion without prompts, printing only program output')
+    argparser.add_argument('--engine', choices=['closure', 'vm', 'step'], default=None,
+            help='execution engine : compiled closures (--run only), bytecode vm, '
+                 'or the stepping ast nodes. defaults to closure with --run, step otherwise')
+    argparser.add_argument('--no-fold', action='store_true',
+            help='do not fold and propagate constants before execution')
+    argparser.add_argument('--profile', action='store_true',
+            help='print the counters of the execution engine internals after --run')
+    argparser.add_argument('--max-output', type=int, default=None, metavar='BYTES',
+            help='stop the program with a runtime error once it prints more than BYTES bytes')
+    argparser.add_argument('--history', type=int, default=ValueHistory.limit, metavar='N',
+            help='number of values kept per variable for the trace command (default %(default)s)')
+    argparser.add_argument('--log-level', choices=Logger.levels, default='node',
+            help='what the execution log of the interactive mode keeps (default %(default)s)')
+    argparser.add_argument('--record', metavar='FILE', default=None,
+            help='record the execution trace of the step engine into FILE - see recorder.py')
+    args = argparser.parse_args()
+    # value histories are only shown by the trace command
+    ValueHistory.limit = 0 if args.run else max(args.history, 0)
+    if args.record is not None:
+        if args.engine in ('closure', 'vm'):
+            argparser.error('--record needs the step engine')
+        args.engine = 'step'
+
+    if not args.run:
+        print('Mini C Interpreter by Dansuh')
+        usage_str = """
+        Usage:
+            - next [lineno] : executes code by lineno lines. if lineno is not given, code executes one line.
+            - step [lineno] : same as next - steps into the functions called
+            - over : executes the line, without stopping in the functions it calls
+            - finish : executes until the current function returns
+            - break [lineno|function] [if condition] : sets a breakpoint at the line or the function, or lists the breakpoints
+            - watch [symbol] : stops when the value of the variable visible as symbol changes
+            - delete [number] : deletes the breakpoint or watchpoint, or all of them if number is not given
+            - continue : executes code until a breakpoint is reached
+            - print [symbol] : prints the value of symbol
+            - trace [symbol] [lineno] : shows the value history of symbol, or the values it is set to at lineno
+            - log : shows execution log
+            - log level [off|node|stack] : sets what the execution log keeps
+            - log only [node types] : logs only the nodes of the types, or all nodes if none is given
+            - scope : shows block scope stack and its contents
+            - exit : stops the interpreter
+        """
+        print(usage_str)
 
-            # whether or not execution stream for current line is done
-            if (not exec_done and len(exec_stack) == stacklen) or (currline != env.currline):
-                break
-        # logger.printlog()
+    # find input c file
+    cfile_dir = './'
+    input_file = args.cfile
+    input_file = os.path.join(cfile_dir, input_file)
+    if not args.run:
+        print('Interpreting : {}'.format(input_file))
 
-        # update line number
-        if currline == env.currline:
-            env.update_currline(1)  # 1 line just for now
-            # keep track of line numbers
-            numlines -= 1
-            total_line += 1
+    # parse the strings
+    try:
+        s, code_lines = read_file(input_file)
+        parser = yacc.parser  # import the parser
+        parser, ast_root = parse_code(parser, s, code_lines, fold=not args.no_fold)
+    except SemanticError as e:
+        # the code has been parsed - only the semantic errors are reported
+        print(e, file=sys.stderr if args.run else sys.stdout)
+        sys.exit(1 if args.run else 0)
+    except Exception as e:
+        if args.run:
+            print(e, file=sys.stderr)
+            print('Parse Error', file=sys.stderr)
+            sys.exit(1)
+        print(e)
+        print('Parse Error')
+        sys.exit(0)
 
-        # do booked updates (++, -- used as postfixes)
-        env.exec_booked_updates()
+    if args.run:
+        # block buffered - the output is written out in large chunks, or when the program ends
+        out = output.OutputSink(sys.stdout, buffer_size=1 << 16, limit=args.max_output)
+        try:
+            if args.engine in (None, 'closure'):
+                status = closures.run_program(parser.functions, out)
+            elif args.engine == 'vm':
+                status = vm.run_program(parser.functions, out)
+            else:
+                env = create_environment(parser, code_lines, out, args.record)
+                try:
+                    status = run_batch(env, code_lines)
+                finally:
+                    if env.recorder is not None:
+                        env.recorder.close()
+        except CRuntimeErr as e:
+            out.flush()
+            print('Runtime Error : {}'.format(e.msg), file=sys.stderr)
+            sys.exit(1)
+        finally:
+            out.flush()
+        if args.profile:
+            for name, count in profile_counts.items():
+                print('{} : {}'.format(name, count), file=sys.stderr)
+        sys.exit(status)
 
-        # end of program indicator
-        if env.currline >= len(code_lines) or len(env.exec_stack) == 0:
-            print('End of Program')
-            break
+    ast_root.show()
+    out = output.OutputSink(sys.stdout, line_buffered=True, limit=args.max_output)
+    if args.engine == 'vm':
+        session = vm.VMSession(parser.functions, out)
+    else:
+        session = StepSession(create_environment(parser, code_lines, out, args.record), code_lines, args.log_level)
+    try:
+        run_interactive(session, code_lines, parser.functions)
+    except CRuntimeErr as e:
+        out.flush()
+        print('Runtime Error : {}'.format(e.msg))
+    finally:
+        out.flush()
+        if args.record is not None:
+            session.env.recorder.close()
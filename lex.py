@@ -38,7 +38,7 @@ literals = ['=', '(', ')', '+', '*', '-',
 tokens = tokens + list(reserved.values())
 
 # regular expressions for simple tokens
-t_STRING_LITERAL = r'\".*\"'  # TODO: ??
+t_STRING_LITERAL = r'\"([^"\\\n]|\\.)*\"'  # up to the first unescaped quote, so that a line can hold several
 t_EQUALS = r'=='
 t_NEQUALS = r'\!='
 t_GEQ = r'>='
@@ -0,0 +1,225 @@
+from astree import *
+from environment import profile_counts
+
+
+"""
+Constant folding and propagation pass over the parsed ast.
+
+Binary operations and type casts whose operands are constants are replaced
+by a single Constant node carrying the line span of the replaced subtree,
+so that stepping through the code shows the same lines.
+Local variables written exactly once with a constant - by their declaration,
+or by an assignment statement directly in the function body - have their
+later uses replaced by the constant. The variable itself is still declared
+and assigned, so it can be printed and traced as before.
+"""
+
+
+def count_nodes(node):
+    return 1 + sum(count_nodes(child) for child in node.children())
+
+
+def folded_constant(value, node):
+    """
+    Constant node replacing node, taking over its position in code.
+    """
+    const = Constant(value=value)
+    const.linespan = node.linespan
+    const.lexspan = node.lexspan
+    return const
+
+
+def scalar_typename(dec_specs, declarator):
+    """
+    Type name of a declared variable, or None if it is an array or a pointer.
+    """
+    _, ptr, arr_size = unpack_declarator(declarator)
+    if ptr > 0 or arr_size is not None:
+        return None
+    return spec_typename(dec_specs)
+
+
+class ConstantFolder:
+    """
+    Folds and propagates constants within function definitions.
+    """
+    def __init__(self):
+        self.removed = 0  # number of ast nodes removed by folding
+        self.propagated = 0  # number of variable uses replaced by constants
+
+    def optimize_function(self, fundef):
+        fundef.body = self.fold(fundef.body)
+        # propagation may reveal more constant subtrees, which may in turn be propagated
+        while self.propagate(fundef) > 0:
+            fundef.body = self.fold(fundef.body)
+
+    # folding
+
+    def fold(self, node):
+        """
+        Folds the constant subtrees under node. Returns the node that replaces it.
+        """
+        if isinstance(node, list):
+            for i, child in enumerate(node):
+                if isinstance(child, AstNode):
+                    node[i] = self.fold(child)
+        for attr, child in list(vars(node).items()):
+            if isinstance(child, AstNode):
+                setattr(node, attr, self.fold(child))
+
+        if isinstance(node, BinaryOp):
+            return self.fold_binary(node)
+        elif isinstance(node, TypeCast):
+            return self.fold_cast(node)
+        return node
+
+    def fold_binary(self, node):
+        arg1, arg2 = node.arg1, node.arg2
+        if not isinstance(arg1, Constant) or not isinstance(arg2, Constant) or node.handlers is None:
+            return node
+        handler = node.handlers.get((arg1.const_val.vtype, arg2.const_val.vtype))
+        if handler is None:
+            return node  # type errors are left to be reported at runtime
+        try:
+            value = handler(arg1.value, arg2.value).val
+        except ZeroDivisionError:
+            return node
+        self.removed += count_nodes(node) - 1
+        return folded_constant(value, node)
+
+    def fold_cast(self, node):
+        if not isinstance(node.cast_expr, Constant):
+            return node
+        convert = {'int': int, 'float': float}.get(spec_typename(node.type_name))
+        if convert is None:
+            return node
+        self.removed += count_nodes(node) - 1
+        return folded_constant(convert(node.cast_expr.value), node)
+
+    # propagation
+
+    def propagate(self, fundef):
+        """
+        Replaces the uses of variables holding a single constant. Returns the number of uses replaced.
+        """
+        self.declared = {}  # name -> number of declarations
+        self.typenames = {}  # name -> type name of scalar variables
+        self.writes = {}  # name -> number of writes
+        self.definitions = {}  # name -> Constant written into the variable
+
+        # parameters are written by the caller
+        param_list = fundef.name_params.param_type_list
+        for param in (param_list if param_list is not None else []):
+            if param.declarator is not None:
+                name, _, _ = unpack_declarator(param.declarator)
+                self.declared[name] = 2
+        self.collect(fundef.body, fundef.body)
+
+        constants = {}
+        for name, const in self.definitions.items():
+            if (self.declared.get(name) == 1 and self.writes.get(name) == 1
+                    and self.typenames.get(name) == const.const_type):
+                constants[name] = const
+        if len(constants) == 0:
+            return 0
+
+        propagated = self.propagated
+        self.replace_uses(fundef.body, constants)
+        return self.propagated - propagated
+
+    def add_write(self, name, const=None):
+        self.writes[name] = self.writes.get(name, 0) + 1
+        if const is not None:
+            self.definitions[name] = const
+
+    def collect(self, node, body):
+        """
+        Counts the declarations and writes of variables.
+        """
+        if isinstance(node, Declaration):
+            for dec in (node.init_dec_list if node.init_dec_list is not None else []):
+                initializer = None
+                if isinstance(dec, InitDeclarator):
+                    initializer = dec.initializer
+                    dec = dec.declarator
+                name, _, _ = unpack_declarator(dec)
+                self.declared[name] = self.declared.get(name, 0) + 1
+                typename = scalar_typename(node.declaration_spec, dec)
+                if typename is not None:
+                    self.typenames[name] = typename
+                if initializer is not None:
+                    self.add_write(name, initializer if isinstance(initializer, Constant) else None)
+        elif isinstance(node, Assignment) and isinstance(node.lvalue, Id):
+            const = None
+            # only the assignments executed unconditionally, once, are definitions
+            if isinstance(node.rvalue, Constant) and self.is_body_statement(node, body):
+                const = node.rvalue
+            self.add_write(node.lvalue.name(), const)
+        elif isinstance(node, UnaryExpr) and isinstance(node.operand, Id):
+            self.add_write(node.operand.name())
+
+        for child in node.children():
+            if child is not None:
+                self.collect(child, body)
+
+    def is_body_statement(self, asmt, body):
+        for stmt in body:
+            if isinstance(stmt, ExpressionStatement) and isinstance(stmt.expr, Expression):
+                if len(stmt.expr) == 1 and stmt.expr[0] is asmt:
+                    return True
+        return False
+
+    def replace_uses(self, node, constants):
+        """
+        Replaces the variables read after their definition, under node.
+        """
+        if isinstance(node, list):
+            for i, child in enumerate(node):
+                if isinstance(child, AstNode):
+                    node[i] = self.replace_use(child, constants)
+
+        if isinstance(node, (Assignment, UnaryExpr)):
+            target = node.lvalue if isinstance(node, Assignment) else node.operand
+            if isinstance(target, ArrayReference):
+                target.idx = self.replace_use(target.idx, constants)
+            if isinstance(node, Assignment):
+                node.rvalue = self.replace_use(node.rvalue, constants)
+        elif isinstance(node, ArrayReference):
+            node.idx = self.replace_use(node.idx, constants)
+        elif isinstance(node, FunctionCall):
+            self.replace_uses(node.argument_list, constants)
+        elif isinstance(node, Declaration):
+            for dec in (node.init_dec_list if node.init_dec_list is not None else []):
+                if isinstance(dec, InitDeclarator):
+                    dec.initializer = self.replace_use(dec.initializer, constants)
+                    dec = dec.declarator
+                if isinstance(dec, ArrayDeclarator):
+                    dec.assignment_expr = self.replace_use(dec.assignment_expr, constants)
+        elif not isinstance(node, list):
+            for attr, child in list(vars(node).items()):
+                if isinstance(child, AstNode):
+                    setattr(node, attr, self.replace_use(child, constants))
+
+    def replace_use(self, node, constants):
+        if isinstance(node, Id):
+            const = constants.get(node.name())
+            if const is not None and node.lexspan[0] > const.lexspan[0]:
+                self.propagated += 1
+                return folded_constant(const.value, node)
+            return node
+        if isinstance(node, AstNode):
+            self.replace_uses(node, constants)
+        return node
+
+
+def optimize_program(fundefs):
+    """
+    Folds and propagates the constants in all function definitions.
+    Returns the number of ast nodes removed.
+    """
+    folder = ConstantFolder()
+    for fundef in fundefs:
+        folder.optimize_function(fundef)
+    profile_counts['folded_nodes'] = folder.removed
+    profile_counts['propagated_constants'] = folder.propagated
+    return folder.removed
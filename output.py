@@ -0,0 +1,59 @@
+from environment import CRuntimeErr
+
+
+"""
+Output sink of the interpreted program.
+
+Each run of a program prints into its own sink, which the engine hands to the builtins.
+The sink buffers the text instead of writing to the terminal or pipe on every printf.
+"""
+
+
+class OutputSink:
+    """
+    Buffered program output.
+    stream is the file the output goes to - None keeps all of it in memory (see getvalue).
+    line_buffered flushes at every newline, otherwise the text is flushed once buffer_size
+    characters are pending. limit is the maximum number of bytes the program may print.
+    """
+    def __init__(self, stream=None, line_buffered=False, buffer_size=8192, limit=None):
+        self.stream = stream
+        self.line_buffered = line_buffered
+        self.buffer_size = buffer_size
+        self.limit = limit
+        self.parts = []  # text not flushed yet
+        self.pending = 0  # length of the text not flushed yet
+        self.written = 0  # bytes printed so far
+
+    def write(self, text):
+        if self.limit is not None:
+            size = len(text.encode())
+            if self.written + size > self.limit:
+                self.parts.append(text.encode()[:self.limit - self.written].decode(errors='ignore'))
+                self.written = self.limit
+                self.flush()
+                raise CRuntimeErr('Output limit of {} bytes exceeded'.format(self.limit))
+            self.written += size
+        self.parts.append(text)
+        self.pending += len(text)
+        if self.pending >= self.buffer_size or (self.line_buffered and '\n' in text):
+            self.flush()
+
+    def flush(self):
+        if self.stream is None:
+            # captured text is kept until getvalue, joined so that the parts do not pile up
+            self.parts = [''.join(self.parts)]
+            self.pending = 0
+            return
+        if self.parts:
+            self.stream.write(''.join(self.parts))
+            self.parts = []
+            self.pending = 0
+        self.stream.flush()
+
+    def getvalue(self):
+        """
+        Output captured in memory.
+        """
+        return ''.join(self.parts)
+
@@ -0,0 +1,336 @@
+import sys
+import json
+import struct
+import argparse
+import weakref
+from array import array
+from bisect import bisect_right
+from symbol_table import Symbol, ElementVal
+
+
+"""
+Execution trace recorder of the stepping engine.
+
+A step of the trace is a line executed, as by the 'next' command. The trace is a binary file
+of fixed-size records, one for each step - or one for each variable written in the step,
+along with the node that wrote it. Records are numbered from 0, and record n is found
+at HEADER.size + n * RECORD.size, so the trace can be read from any point.
+
+File layout:
+    header : magic, offset of the footer
+    records : step, line, node, variable, element index, value
+    footer : json of the node table, the variable table, and the index of the steps -
+             (step, record number) at the start of every CHUNK steps
+
+Variable -1 means nothing was written in the step (or an element of an array not bound to a variable),
+and element index -1 that the variable itself was written. Node NO_NODE means that no node was executed
+in the step, as in a line closing a block.
+"""
+
+
+MAGIC = b'MCTRACE1'
+HEADER = struct.Struct('<8sQ')
+RECORD = struct.Struct('<QIIiid')
+WRITE = struct.Struct('<Iiid')  # node, variable, element index and value of a record
+WRITE_OFFSET = 12
+NO_NODE = 0xffffffff
+NO_VAR = -1
+NO_ELEMENT = -1
+EMPTY_RECORD = RECORD.pack(0, 0, 0, NO_VAR, NO_ELEMENT, 0.0)
+CHUNK = 4096  # steps packed and written at once
+
+
+class TraceRecorder:
+    """
+    Writes the trace of the lines executed into a file.
+    Steps only note the node and the line, and are packed a chunk at a time -
+    the columns of step numbers, lines and nodes are copied into the records at once,
+    and only the records of the writes are packed one by one.
+    """
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, 0))  # footer offset is filled in on close
+        self.nsteps = 0  # steps written into the file
+        self.nrecords = 0  # records written into the file
+        self.executed = []  # last nodes executed in the steps not written yet
+        self.lines = []  # lines of the steps not written yet
+        self.writes = []  # (step in chunk, node number, variable, element index, value) of the steps not written yet
+        self.writer = None  # node of the last write
+        self.nodes = {id(None): NO_NODE}  # id(node) -> node number - None for steps executing no node
+        self.node_table = []  # (description, first line, last line)
+        self.variables = {}  # id(declaring node), name -> variable number
+        self.var_table = []  # (name, line of declaration, type name)
+        self.arrays = {}  # id(array storage) -> (weak reference to the storage, variable number)
+        self.index = []  # (step, record number) at the start of each chunk
+
+    def variable(self, symbol):
+        key = (id(symbol.astnode), symbol.name)
+        var = self.variables.get(key)
+        if var is None:
+            var = len(self.var_table)
+            self.variables[key] = var
+            astnode = symbol.astnode
+            line = astnode.startline() if getattr(astnode, 'linespan', None) else 0
+            self.var_table.append((symbol.name, line, symbol.value.vtype.typename))
+        return var
+
+    def node_number(self, node):
+        nodenum = self.nodes.get(id(node))
+        if nodenum is None:
+            nodenum = len(self.node_table)
+            self.nodes[id(node)] = nodenum
+            self.node_table.append((str(node), node.startline(), node.endline()))
+        return nodenum
+
+    def bind_array(self, storage, var):
+        """
+        Makes the elements of storage written later belong to the variable - the variable declaring the array,
+        not the parameters it is passed as.
+        """
+        key = id(storage)
+        owner = self.arrays.get(key)
+        if owner is None or owner[0]() is not storage:
+            arrays = self.arrays
+            self.arrays[key] = (weakref.ref(storage, lambda _: arrays.pop(key, None)), var)
+
+    def write(self, target, node):
+        """
+        Notes a write of the variable or array element by the node into the step being executed.
+        """
+        self.writer = node
+        if isinstance(target, Symbol):
+            value = target.value
+            if value is None or value.val is None:
+                return
+            var = self.variable(target)
+            if value.arr_size is not None or value.vtype.array > 0:
+                self.bind_array(value.val, var)
+            elif isinstance(value.val, (int, float)):
+                self.writes.append((len(self.executed), self.node_number(node), var, NO_ELEMENT, value.val))
+        elif isinstance(target, ElementVal):
+            owner = self.arrays.get(id(target.storage))
+            var = owner[1] if owner is not None and owner[0]() is target.storage else NO_VAR
+            self.writes.append((len(self.executed), self.node_number(node), var, target.idx,
+                                target.storage[target.idx]))
+
+    def step(self, node, line):
+        """
+        Records the step of the line done, with the node executed last in the line (None if no node was)
+        and the writes made in the step.
+        """
+        self.executed.append(node)
+        self.lines.append(line)
+        if len(self.lines) >= CHUNK:
+            self.flush()
+
+    def flush(self):
+        executed = self.executed
+        count = len(executed)
+        if count == 0:
+            return
+        base = self.nsteps
+        steps = array('Q', range(base, base + count))
+        lines = array('I', self.lines)
+        try:
+            nodes = array('I', map(self.nodes.__getitem__, map(id, executed)))
+        except KeyError:  # nodes executed for the first time
+            nodes = array('I', map(self.node_number, executed))
+
+        # records writing nothing, with the columns copied in
+        records = bytearray(EMPTY_RECORD * count)
+        if sys.byteorder != 'little':
+            for column in (steps, lines, nodes):
+                column.byteswap()
+        memoryview(records).cast('Q')[0::RECORD.size // 8] = steps
+        words = memoryview(records).cast('I')
+        words[2::RECORD.size // 4] = lines
+        words[3::RECORD.size // 4] = nodes
+
+        # the first write of a step goes into its record, and the others into records following it
+        extra = []  # (step in chunk, record)
+        last = -1
+        for pos, nodenum, var, idx, val in self.writes:
+            if pos == last:
+                extra.append((pos, RECORD.pack(base + pos, self.lines[pos], nodenum, var, idx, val)))
+            else:
+                WRITE.pack_into(records, pos * RECORD.size + WRITE_OFFSET, nodenum, var, idx, val)
+                last = pos
+        if len(extra) > 0:
+            pieces = []
+            done = 0  # steps before this are in the pieces
+            for pos, record in extra:
+                pieces.append(records[done * RECORD.size:(pos + 1) * RECORD.size])
+                pieces.append(record)
+                done = pos + 1
+            pieces.append(records[done * RECORD.size:])
+            records = b''.join(pieces)
+
+        self.file.write(records)
+        self.index.append((base, self.nrecords))
+        self.nsteps += count
+        self.nrecords += count + len(extra)
+        executed.clear()
+        self.lines.clear()
+        self.writes.clear()
+
+    def close(self):
+        if self.file.closed:
+            return
+        if len(self.writes) > 0 and self.writes[-1][0] == len(self.executed):
+            # the program ended in the middle of a line - the writes make a step at the line of the last writer
+            self.step(self.writer, self.writer.startline())
+        self.flush()
+        footer_offset = self.file.tell()
+        footer = {
+            'nodes': self.node_table,
+            'variables': self.var_table,
+            'steps': self.nsteps,
+            'index': self.index,
+        }
+        self.file.write(json.dumps(footer).encode())
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, footer_offset))
+        self.file.close()
+
+
+class TraceReader:
+    """
+    Reads a trace written by TraceRecorder.
+    Records are tuples of (step, line, node, variable, element index, value).
+    """
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        magic, footer_offset = HEADER.unpack(self.file.read(HEADER.size))
+        if magic != MAGIC or footer_offset == 0:
+            raise ValueError('{} is not a complete execution trace'.format(path))
+        self.nrecords = (footer_offset - HEADER.size) // RECORD.size
+        self.file.seek(footer_offset)
+        footer = json.loads(self.file.read().decode())
+        self.nodes = footer['nodes']
+        self.variables = footer['variables']
+        self.nsteps = footer['steps']
+        self.index_steps = [step for step, _ in footer['index']]
+        self.index = [num for _, num in footer['index']]
+
+    def __len__(self):
+        return self.nrecords
+
+    def close(self):
+        self.file.close()
+
+    def records(self, start=0, stop=None, chunk=4096):
+        """
+        Iterates over the records from record number start up to stop.
+        """
+        stop = self.nrecords if stop is None else min(stop, self.nrecords)
+        self.file.seek(HEADER.size + start * RECORD.size)
+        while start < stop:
+            count = min(chunk, stop - start)
+            yield from RECORD.iter_unpack(self.file.read(count * RECORD.size))
+            start += count
+
+    def record(self, num):
+        if not 0 <= num < self.nrecords:
+            raise IndexError('record {} out of range'.format(num))
+        self.file.seek(HEADER.size + num * RECORD.size)
+        return RECORD.unpack(self.file.read(RECORD.size))
+
+    def seek_step(self, step):
+        """
+        Record number of the first record of the step - the number of records if the step is beyond the trace.
+        """
+        if step >= self.nsteps:
+            return self.nrecords
+        num = self.index[max(bisect_right(self.index_steps, step) - 1, 0)]
+        for record in self.records(num):
+            if record[0] >= step:
+                return num
+            num += 1
+        return num
+
+    def value_of(self, var, val):
+        if self.variables[var][2] == 'int':
+            return int(val)
+        return val
+
+    def name_of(self, var, idx):
+        if var == NO_VAR:
+            return '?[{}]'.format(idx)  # element of an array not bound to a variable
+        name = self.variables[var][0]
+        return name if idx == NO_ELEMENT else '{}[{}]'.format(name, idx)
+
+    def describe(self, record):
+        step, line, node, var, idx, val = record
+        text = 'step {} line {}'.format(step, line)
+        if node != NO_NODE:
+            text += ' : {}'.format(self.nodes[node][0])
+        if var != NO_VAR or idx != NO_ELEMENT:
+            value = self.value_of(var, val) if var != NO_VAR else val
+            text += ' - {} = {}'.format(self.name_of(var, idx), value)
+        return text
+
+    def history(self, name):
+        """
+        Values written to the variables named name - list of (step, line, element index, value).
+        """
+        vars = {var for var, (varname, _, _) in enumerate(self.variables) if varname == name}
+        return [(step, line, idx, self.value_of(var, val))
+                for step, line, _, var, idx, val in self.records() if var in vars]
+
+    def steps_at_line(self, line):
+        """
+        Steps that executed the line.
+        """
+        steps = []
+        for record in self.records():
+            if record[1] == line and (len(steps) == 0 or steps[-1] != record[0]):
+                steps.append(record[0])
+        return steps
+
+    def replay(self, step):
+        """
+        Values of the variables after the step - name -> value, or {element index: value} for arrays.
+        Variables of the same name in different declarations or calls are merged.
+        """
+        state = {}
+        for _, _, _, var, idx, val in self.records(0, self.seek_step(step + 1)):
+            if var == NO_VAR:
+                continue
+            name = self.variables[var][0]
+            if idx == NO_ELEMENT:
+                state[name] = self.value_of(var, val)
+            else:
+                elements = state.get(name)
+                if not isinstance(elements, dict):
+                    elements = state[name] = {}
+                elements[idx] = self.value_of(var, val)
+        return state
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description='query an execution trace recorded by --record')
+    argparser.add_argument('trace', help='trace file')
+    argparser.add_argument('--history', metavar='NAME', help='values written to the variable')
+    argparser.add_argument('--line', type=int, help='steps that executed the line')
+    argparser.add_argument('--at', type=int, metavar='STEP', help='values of the variables after the step')
+    argparser.add_argument('--show', nargs=2, type=int, metavar=('FROM', 'TO'), help='records of the steps')
+    args = argparser.parse_args()
+
+    reader = TraceReader(args.trace)
+    if args.history is not None:
+        for step, line, idx, val in reader.history(args.history):
+            name = args.history if idx == NO_ELEMENT else '{}[{}]'.format(args.history, idx)
+            print('{} = {} at line {} (step {})'.format(name, val, line, step))
+    if args.line is not None:
+        print(reader.steps_at_line(args.line))
+    if args.at is not None:
+        for name, val in sorted(reader.replay(args.at).items()):
+            print('{} = {}'.format(name, val))
+    if args.show is not None:
+        start, stop = reader.seek_step(args.show[0]), reader.seek_step(args.show[1] + 1)
+        for record in reader.records(start, stop):
+            print(reader.describe(record))
+    if args.history is None and args.line is None and args.at is None and args.show is None:
+        print('{} steps, {} records, {} nodes, {} variables'.format(
+            reader.nsteps, len(reader), len(reader.nodes), len(reader.variables)))
+    reader.close()
@@ -0,0 +1,155 @@
+from astree import *
+from cbuiltins import lookup_builtin
+
+
+"""
+Name resolution pass for the ast interpreter.
+
+Every variable used inside a function body is bound to a (level, slot) pair
+before the execution starts. The level is the nesting depth of the scope
+declaring the variable - the function scope is at level 0, and each selection
+or iteration statement opens a new level - and the slot is the index of the
+variable in the fixed-size slot list of that scope.
+Selection and iteration statements declaring no variables open no scope
+(and no level) at all - they run in the scope of the enclosing block.
+At execution time, a scope keeps the slot lists of all enclosing levels
+of the function (Scope.display), so the variable is reached
+with two list indexings instead of walking the chain of symbol tables.
+"""
+
+
+def declares_names(node):
+    """
+    Whether variables are declared in the scope of the statement.
+    Nested selection and iteration statements have their own scopes.
+    """
+    for child in node.children():
+        if isinstance(child, Declaration):
+            return True
+        if isinstance(child, AstNode) and not isinstance(child, (SelectionStatement, IterationStatement)):
+            if declares_names(child):
+                return True
+    return False
+
+
+def loop_counter(update):
+    """
+    (level, slot, delta) of the variable if the loop update is a single ++ or --, ex) for (...; i++)
+    """
+    if isinstance(update, Expression) and len(update) == 1:
+        update = update[0]
+    if not isinstance(update, UnaryExpr) or not isinstance(update.operand, Id) or update.operand.slot is None:
+        return None
+    return update.operand.level, update.operand.slot, 1 if update.op_name == '++' else -1
+
+
+class ResolveScope:
+    """
+    Scope while resolving - maps names declared in the scope into slots.
+    """
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.level = 0 if parent is None else parent.level + 1
+        self.names = {}
+
+    def declare(self, name):
+        if name not in self.names:
+            self.names[name] = len(self.names)
+        return self.names[name]
+
+    def lookup(self, name):
+        """
+        Returns (level, slot) of the variable, or None if not declared.
+        """
+        scope = self
+        while scope is not None:
+            if name in scope.names:
+                return scope.level, scope.names[name]
+            scope = scope.parent
+        return None
+
+    def nslots(self):
+        return len(self.names)
+
+
+class Resolver:
+    """
+    Walks the function definitions in code order, binding the variables to slots.
+    """
+    def __init__(self, functions):
+        self.functions = functions  # names of the functions defined by the program
+        self.block_line = None  # line to continue from after the blocks of the current statement
+
+    def resolve_function(self, fundef):
+        scope = ResolveScope()
+
+        # parameters come first, in the order of declaration
+        param_list = fundef.name_params.param_type_list
+        for param in (param_list if param_list is not None else []):
+            if param.declarator is not None:  # ex) int main(void)
+                name, _, _ = unpack_declarator(param.declarator)
+                scope.declare(name)
+
+        self.resolve(fundef.body, scope)
+        fundef.nslots = scope.nslots()
+
+    def resolve(self, node, scope):
+        if node is None or not isinstance(node, AstNode):
+            return
+
+        if isinstance(node, Id):
+            binding = scope.lookup(node.name())
+            if binding is not None:
+                node.level, node.slot = binding
+        elif isinstance(node, Declaration):
+            self.resolve_declaration(node, scope)
+        elif isinstance(node, (SelectionStatement, IterationStatement)):
+            inner_scope = ResolveScope(scope) if declares_names(node) else scope
+            outer_line = self.block_line
+            # if-statements continue after their end, loops go back to their first line
+            self.block_line = node.endline() if isinstance(node, SelectionStatement) else node.startline()
+            for child in node.children():
+                self.resolve(child, inner_scope)
+            self.block_line = outer_line
+            node.nslots = 0 if inner_scope is scope else inner_scope.nslots()
+            if isinstance(node, IterationStatement):
+                node.counter = loop_counter(node.exp3)
+        elif isinstance(node, CompoundStatement):
+            node.return_line = self.block_line
+            for child in node.children():
+                self.resolve(child, scope)
+        elif isinstance(node, FunctionCall):
+            self.resolve(node.argument_list, scope)  # function names are not variables
+            builtin = lookup_builtin(node.func_name.name(), self.functions)
+            if builtin is not None:
+                args = node.argument_list
+                node.native = builtin.bind(args[0].string if len(args) > 0 and isinstance(args[0], String) else None)
+        else:
+            for child in node.children():
+                self.resolve(child, scope)
+
+    def resolve_declaration(self, node, scope):
+        if node.init_dec_list is None:
+            return
+
+        for dec in node.init_dec_list:
+            if isinstance(dec, InitDeclarator):
+                # the initializer is evaluated before the name is bound
+                self.resolve(dec.initializer, scope)
+                dec = dec.declarator
+            name, _, arr_size = unpack_declarator(dec)
+            self.resolve(arr_size, scope)
+            node.slots[name] = scope.declare(name)
+            while isinstance(dec, Declarator):
+                dec = dec.of
+            dec.declares = True
+
+
+def resolve_names(fundefs):
+    """
+    Resolves the variables of all function definitions into slots,
+    and binds the calls of builtin functions.
+    """
+    resolver = Resolver({fundef.name() for fundef in fundefs})
+    for fundef in fundefs:
+        resolver.resolve_function(fundef)
@@ -1,4 +1,28 @@
+import operator
+from array import array
+from collections import deque
+
+
+# typecodes of array.array storing the elements of C arrays - 8 bytes per element
+array_typecodes = {
+    'int': 'q',
+    'float': 'd',
+}
+array_converters = {
+    'q': int,
+    'd': float,
+}
+
+
+def new_array(typename, size):
+    """
+    Zero-initialized storage for an array of given element type.
+    """
+    return array(array_typecodes[typename], [0]) * size  # repeating allocates exactly, unlike growing from bytes
+
+
 class Value:
+    __slots__ = ('vtype', 'val', 'arr_size', 'address')
     _addr = 0xdeadabff  # gloabl address variable... 난 자괴감이 든다
     def __init__(self, vtype, val=None):
         assert isinstance(vtype, TypeVal)
@@ -31,21 +55,75 @@ class Value:
             return
 
         if self.arr_size is not None:
-            # cast all elements of the array
-            for arr_val in self.val:
-                arr_val.cast(casttype)
+            # cast all elements of the array, only if the element type differs
+            typecode = array_typecodes.get(casttype.typename)
+            if typecode is not None and typecode != self.val.typecode:
+                self.val = array(typecode, map(array_converters[typecode], self.val))
         else:
             if casttype.typename == 'float':
                 self.val = float(self.val)
             elif casttype.typename == 'int':
                 self.val = int(self.val)
 
+    def casted(self, casttype):
+        """
+        Value converted into casttype, leaving this value untouched.
+        Returns itself if no conversion is needed.
+        """
+        if self.val is None or self.arr_size is not None or self.vtype is casttype:
+            return self
+        if casttype.typename == 'float':
+            return Value(casttype, float(self.val))
+        elif casttype.typename == 'int':
+            return Value(casttype, int(self.val))
+        return self
+
+
+class ElementVal(Value):
+    """
+    Value of an array element - keeps the storage and the index to write back into.
+    """
+    __slots__ = ('storage', 'idx')
+
+    def __init__(self, vtype, storage, idx):
+        super().__init__(vtype, storage[idx])
+        self.storage = storage
+        self.idx = idx
+
+    def store(self, val):
+        self.val = array_converters[self.storage.typecode](val)
+        self.storage[self.idx] = self.val
+
+
+class CounterVal(Value):
+    """
+    Value of a loop counter, updated in place by the loop - see Symbol.increment.
+    It is copied when set to a variable, so that only the counter holds it.
+    """
+    __slots__ = ()
+
 
 class TypeVal:
-    def __init__(self, typename: str, ptr=0, array=0):
-        self.typename = typename  # int, float, string, function, void, op
-        self.ptr = ptr  # pointer order
-        self.array = array
+    """
+    Immutable type descriptor.
+    Instances are interned, so there is only one TypeVal for each (typename, ptr, array).
+    """
+    __slots__ = ('typename', 'ptr', 'array')
+    _interned = {}
+
+    def __new__(cls, typename: str, ptr=0, array=0):
+        key = (typename, ptr, array)
+        tval = cls._interned.get(key)
+        if tval is None:
+            tval = super().__new__(cls)
+            object.__setattr__(tval, 'typename', typename)  # int, float, string, function, void, op
+            object.__setattr__(tval, 'ptr', ptr)  # pointer order
+            object.__setattr__(tval, 'array', array)
+            cls._interned[key] = tval
+        return tval
+
+    def __setattr__(self, name, value):
+        raise AttributeError('TypeVal is immutable')
 
     def __str__(self):
         return 'TypeVal({}, ptr {}, arr {})'.format(self.typename, self.ptr, self.array)
@@ -53,9 +131,6 @@ class TypeVal:
     def __repr__(self):
         return self.__str__()
 
-    def __eq__(self, other):
-        pass
-
     def sum_arr_ptr(self):
         return self.ptr + self.array
 
@@ -64,18 +139,211 @@ class TypeVal:
         return (self.typename in numtypes) and (other.typename in numtypes) and (self.sum_arr_ptr() == other.sum_arr_ptr())
 
 
+# frequently used types
+INT_TYPE = TypeVal('int')
+FLOAT_TYPE = TypeVal('float')
+
+
+arith_ops = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '%': operator.mod,
+}
+
+compare_ops = {
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+
+
+def caster(from_type, to_type):
+    """
+    Returns the casting function converting values of from_type to to_type,
+    or None if no conversion is needed.
+    """
+    if to_type.sum_arr_ptr() > 0 or from_type.typename == to_type.typename:
+        return None
+    if to_type.typename == 'int':
+        return int
+    elif to_type.typename == 'float':
+        return float
+    return None
+
+
+def binary_result_type(op, ltype, rtype):
+    """
+    Result type of a binary operation, following the ast nodes -
+    comparisons and logical operations are int, '/' is always float.
+    """
+    if op in compare_ops or op in ('&&', '||'):
+        return INT_TYPE
+    elif op == '/':
+        return FLOAT_TYPE
+    elif op == '%' or (ltype.typename == 'int' and rtype.typename == 'int'):
+        return INT_TYPE
+    return FLOAT_TYPE
+
+
+class ValueHistory:
+    """
+    Values a variable has been set to, with the lines they are set at.
+    Only the last `capacity` entries are kept in a ring buffer, and numbers are kept unboxed
+    in array storage - the history holds no Value, nor the arrays they refer to.
+    The entries are indexed by line.
+    """
+    __slots__ = ('capacity', 'values', 'lines', 'count', 'unset', 'by_line')
+    limit = 1000  # default number of entries kept per variable - 0 keeps no history
+
+    def __init__(self):
+        self.capacity = ValueHistory.limit  # entries kept
+        self.values = None  # array('q'), array('d') or list - chosen by the first value set
+        self.lines = array('I')
+        self.count = 0  # entries added, including the ones dropped
+        self.unset = set()  # numbers of the entries of unset values
+        self.by_line = {}  # line -> numbers of the entries kept, in order
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def dropped(self):
+        return self.count - len(self)
+
+    def add(self, value, lineno):
+        """
+        Adds an entry - value is a number, None if unset, or the printed form of any other value.
+        """
+        limit = self.capacity
+        if limit == 0:
+            return
+        num = self.count
+        self.count = num + 1
+        values = self.values
+        if value is not None and (values is None or len(self.unset) == len(values)):
+            # the storage is chosen by the first value set - the unset entries kept before it are zeros
+            size = 0 if values is None else len(values)
+            if type(value) is float:
+                values = self.values = array('d', [0.0]) * size
+            elif type(value) is int:
+                values = self.values = array('q', [0]) * size
+            else:
+                values = self.values = [0] * size
+        elif values is None:
+            values = self.values = array('q')
+        elif value is not None and type(values) is array and type(value) is not array_converters[values.typecode]:
+            values = self.values = list(values)  # values of other kinds do not fit in the array
+        if value is None:
+            self.unset.add(num)
+            value = 0
+
+        if num < limit:
+            values.append(value)
+            self.lines.append(lineno)
+        else:
+            # overwrite the oldest entry
+            pos = num % limit
+            oldest = self.by_line[self.lines[pos]]
+            oldest.popleft()
+            if len(oldest) == 0:
+                del self.by_line[self.lines[pos]]
+            self.unset.discard(num - limit)
+            values[pos] = value
+            self.lines[pos] = lineno
+
+        by_line = self.by_line.get(lineno)
+        if by_line is None:
+            by_line = self.by_line[lineno] = deque()
+        by_line.append(num)
+
+    def entry(self, num):
+        pos = num % self.capacity
+        return 'N/A' if num in self.unset else self.values[pos], self.lines[pos]
+
+    def entries(self):
+        """
+        (value, line) of the entries kept, oldest first - the values are as printed.
+        """
+        return [self.entry(num) for num in range(self.count - len(self), self.count)]
+
+    def at_line(self, lineno):
+        """
+        (value, line) of the entries kept that were set at the line.
+        """
+        return [self.entry(num) for num in self.by_line.get(lineno, ())]
+
+
+class Watch:
+    """
+    Watchpoint on the variables of a declaration, set by the interactive mode.
+    The changes of the values set to them are appended to hits as (watch, old value, new value, line).
+    """
+    __slots__ = ('number', 'name', 'hits', 'active')
+
+    def __init__(self, name, hits):
+        self.number = None  # number of the watchpoint, given when it is listed
+        self.name = name
+        self.hits = hits
+        self.active = True  # the watch is deleted once False
+
+    def changed(self, old, new, lineno):
+        if self.active and old != new:
+            self.hits.append((self, old, new, lineno))
+
+
 class Symbol:
+    __slots__ = ('name', 'astnode', 'val_history', 'value', 'watch')
+
     def __init__(self, name, astnode):
         self.name = name
         self.astnode = astnode  # corresponding AST node
-        self.val_history = []
+        self.val_history = None  # ValueHistory, made on the first value set
         self.value = None  # Value instance
+        self.watch = None  # Watch of the declaration, if it is watched
 
     def __repr__(self):
         return 'Symbol({}, val {})'.format(self.name, self.value)
 
+    def set_value(self, val: Value, lineno: int):
+        old = self.value
+        if old is not None:
+            val = val.casted(old.vtype)
+        if val.__class__ is CounterVal:
+            val = Value(val.vtype, val.val)  # the counter keeps updating its value in place
+        self.value = val
+        self.note_change('N/A' if old is None else old.printval(), lineno)
+
+    def increment(self, delta, lineno: int):
+        """
+        Adds delta to the number held, as the update of a loop counter.
+        The value is updated in place once it is a CounterVal, instead of making a new value each iteration.
+        """
+        old = self.value
+        printed = old.printval()
+        if old.__class__ is CounterVal:
+            old.val += delta
+        else:
+            self.value = CounterVal(old.vtype, old.val + delta)
+        self.note_change(printed, lineno)
+
+    def note_change(self, old, lineno):
+        # old is the value before the change, as printed
+        if ValueHistory.limit > 0:
+            if self.val_history is None:
+                self.val_history = ValueHistory()
+            printed = self.value.printval()
+            self.val_history.add(None if printed == 'N/A' else printed, lineno)
+        if self.watch is not None:
+            self.watch.changed(old, self.value.printval(), lineno)
+
 
 class FunctionVal(Value):
+    __slots__ = ('rtype', 'params', 'body')
+
     def __init__(self, rtype: TypeVal, params, body):
         super().__init__(TypeVal('function'))
         self.rtype = rtype  # return type - TypeVal instance
@@ -87,8 +355,13 @@ class Scope:
     """
     Scope node for scope tree.
     """
-    def __init__(self, symbol_table: dict):
+    __slots__ = ('symbol_table', 'slots', 'display', 'parent_scope',
+                 'return_type', 'return_scope', 'return_lineno', 'return_val')
+
+    def __init__(self, symbol_table: dict, nslots=0):
         self.symbol_table = symbol_table
+        self.slots = [None] * nslots  # symbols of variables resolved into slots
+        self.display = [self.slots]  # slot lists of the enclosing scopes within the function
         self.parent_scope = None
         self.return_type = None  #  TypeVal instance
         self.return_scope = None
@@ -104,6 +377,13 @@ class Scope:
             scope = scope.parent_scope
         print()
 
+    def nest(self, parent_scope):
+        """
+        Makes this scope a block scope inside parent_scope.
+        """
+        self.parent_scope = parent_scope
+        self.display = parent_scope.display + [self.slots]
+
     def get_return_val(self):
         return self.return_val
 
@@ -122,11 +402,7 @@ class Scope:
             return self.parent_scope.getsymbol(sym_name)
 
     def set_value(self, sym_name: str, val: Value, lineno: int):
-        sym_val = self.getsymbol(sym_name)
-        if sym_val.value is not None:
-            val.cast(sym_val.value.vtype)
-        sym_val.value = val
-        sym_val.val_history.append((val, lineno))
+        self.getsymbol(sym_name).set_value(val, lineno)
 
     def getvalue(self, sym_name):
         symbol = self.getsymbol(sym_name)
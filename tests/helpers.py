@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+
+
+"""
+Helpers of the tests - running programs with interpreter.py as the command line does.
+"""
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENGINES = ('closure', 'vm', 'step')
+
+
+def run_file(path, engine, *options):
+    """
+    Runs the program with --run on the engine - returns the CompletedProcess, with text output.
+    """
+    return subprocess.run([sys.executable, 'interpreter.py', '--cfile', str(path), '--run', '--engine', engine] + list(options),
+                          cwd=ROOT, capture_output=True, text=True, timeout=120)
+
+
+def write_program(tmp_path, source, name='program.c'):
+    path = tmp_path / name
+    path.write_text(source)
+    return path
+
+
+def load(source, fold=True):
+    """
+    Parses and checks the source as interpreter.py does - constants are folded unless fold is False.
+    Returns the parser holding the functions, and the lines of the code.
+    """
+    import yacc
+    from interpreter import parse_code
+    code_lines = source.splitlines(keepends=True) + ['EOF']
+    parser, _ = parse_code(yacc.parser, source, code_lines, fold=fold)
+    return parser, code_lines
+
+
+def run_commands(path, engine, commands):
+    """
+    Runs the program interactively on the engine, typing in the commands - returns the CompletedProcess.
+    """
+    return subprocess.run([sys.executable, 'interpreter.py', '--cfile', str(path), '--engine', engine],
+                          input=''.join(command + '\n' for command in commands),
+                          cwd=ROOT, capture_output=True, text=True, timeout=120)
@@ -0,0 +1,330 @@
+import pytest
+
+import breakpoints as breakpoints_module
+import output
+import vm
+from breakpoints import Breakpoints, ConditionError
+from helpers import load, run_commands, write_program
+from interpreter import StepSession, create_environment, breakpoint_stops, step_over
+
+
+"""
+Breakpoints, watchpoints and stepping commands on the interactive engines.
+"""
+
+
+SESSION_ENGINES = ('step', 'vm')
+
+SQUARES = '''
+int square(int a) {
+  a = a * a;
+  return a;
+}
+
+int main(void) {
+  int i, s;
+  s = 0;
+  for (i = 1; i < 4; i++) {
+    s = s + square(i);
+  }
+  printf("%d\\n", s);
+  return s;
+}
+'''
+
+
+def start(engine, source=SQUARES):
+    """
+    Starts an interactive session on the engine - returns the session and its breakpoints.
+    """
+    parser, code_lines = load(source)
+    out = output.OutputSink()
+    if engine == 'vm':
+        session = vm.VMSession(parser.functions, out)
+    else:
+        session = StepSession(create_environment(parser, code_lines, out), code_lines, 'off')
+    return session, Breakpoints(parser.functions)
+
+
+def stops(session, breakpoints, name=None):
+    """
+    Continues until the program ends - returns the lines stopped at,
+    with the values of the variable named name at the stops if a name is given.
+    """
+    found = []
+    while True:
+        session.run_until(breakpoints.lines, breakpoint_stops(session, breakpoints))
+        if session.is_done():
+            return found
+        found.append(session.currline() if name is None else (session.currline(), session.valueof(name)))
+
+
+@pytest.mark.parametrize('engine', SESSION_ENGINES)
+def test_line_breakpoint(engine):
+    session, breakpoints = start(engine)
+    assert breakpoints.add_line(11) == 1
+    assert stops(session, breakpoints, 'i') == [(11, 1), (11, 2), (11, 3)]
+    assert session.exit_status() == 14
+
+
+@pytest.mark.parametrize('engine', SESSION_ENGINES)
+def test_function_breakpoint(engine):
+    session, breakpoints = start(engine)
+    breakpoints.add_function('square')
+    assert stops(session, breakpoints, 'a') == [(3, 1), (3, 2), (3, 3)]
+    # returning into the middle of the line of the call does not stop at it again
+    session, breakpoints = start(engine)
+    breakpoints.add_function('square')
+    breakpoints.add_line(11)
+    assert stops(session, breakpoints) == [11, 3, 11, 3, 11, 3]
+
+
+def test_breakpoint_lines():
+    _, breakpoints = start('step')
+    assert breakpoints.add_line(6) == 1  # the blank line - the breakpoint goes to the next statement
+    assert breakpoints.points[1] == (8, 'line 8')
+    assert breakpoints.add_line(15) is None
+    assert breakpoints.add_function('cube') is None
+    assert breakpoints.add_function('main') == 2
+    assert breakpoints.points[2] == (8, 'function main, line 8')
+    assert breakpoints.lines == {8}
+    assert breakpoints.delete(1) and not breakpoints.delete(1)
+    assert breakpoints.lines == {8}
+    assert breakpoints.delete()
+    assert breakpoints.lines == set() and breakpoints.points == {}
+
+
+@pytest.mark.parametrize('engine', SESSION_ENGINES)
+def test_delete(engine):
+    session, breakpoints = start(engine)
+    breakpoints.add_line(11)
+    session.run_until(breakpoints.lines, breakpoint_stops(session, breakpoints))
+    breakpoints.delete(1)
+    assert stops(session, breakpoints, 'i') == []
+    assert session.out.getvalue() == '14\n'
+
+
+def test_break_commands(tmp_path):
+    path = write_program(tmp_path, SQUARES)
+    for engine in SESSION_ENGINES:
+        result = run_commands(path, engine, ['break 11', 'break square', 'break 40', 'break', 'continue', 'continue',
+                                             'delete 2', 'continue', 'delete', 'continue'])
+        assert 'Command:Breakpoint 1 : line 11\nNEXT line (7)' in result.stdout
+        assert 'Command:Breakpoint 2 : function square, line 3\nNEXT line (7)' in result.stdout
+        assert 'Command:No statement at or after line 40\n' in result.stdout
+        assert 'Command:Breakpoint 1 : line 11\nBreakpoint 2 : function square, line 3\nNEXT line (7)' in result.stdout
+        assert ('Command:Breakpoint 1 : line 11\nNEXT line (11):     s = s + square(i);\n\n'
+                'Command:Breakpoint 2 : function square, line 3\nNEXT line (3):   a = a * a;\n\n'
+                'Command:NEXT line (3):   a = a * a;\n\n'
+                'Command:Breakpoint 1 : line 11\nNEXT line (11):     s = s + square(i);\n\n'
+                'Command:NEXT line (11):     s = s + square(i);\n\n'
+                'Command:14\nEnd of Program\n') in result.stdout
+
+
+@pytest.mark.parametrize('engine', SESSION_ENGINES)
+def test_condition(engine, monkeypatch):
+    parsed = []
+    parse = breakpoints_module.parse_expression
+    monkeypatch.setattr(breakpoints_module, 'parse_expression', lambda text: parsed.append(text) or parse(text))
+    session, breakpoints = start(engine)
+    breakpoints.add_line(11, 'i > 1 && s < 100')
+    assert breakpoints.points[1] == (11, 'line 11 if i > 1 && s < 100')
+    assert stops(session, breakpoints, 'i') == [(11, 2), (11, 3)]
+    assert parsed == ['i > 1 && s < 100']  # parsed once, when the breakpoint is set
+
+
+@pytest.mark.parametrize('engine', SESSION_ENGINES)
+def test_condition_errors(engine, capsys):
+    # a condition that cannot be evaluated does not stop the execution
+    session, breakpoints = start(engine)
+    breakpoints.add_line(3, 'a / (a - 2) > 100')
+    breakpoints.add_line(9, 's == 0')
+    breakpoints.add_line(11, 'z == 1')
+    assert stops(session, breakpoints) == []
+    assert session.exit_status() == 14
+    assert capsys.readouterr().out.splitlines() == [
+        'Error in the condition of breakpoint 2 : Variable not initialized!',
+        'Error in the condition of breakpoint 3 : Name z does not exist!',
+        'Error in the condition of breakpoint 3 : Name z does not exist!',
+        'Error in the condition of breakpoint 1 : division by zero',
+        'Error in the condition of breakpoint 3 : Name z does not exist!',
+    ]
+
+
+@pytest.mark.parametrize('engine', SESSION_ENGINES)
+def test_condition_operands(engine, capsys):
+    session, breakpoints = start(engine, '''
+int main(void) {
+  int mark[2];
+  mark[0] = 1;
+  return mark[0];
+}
+''')
+    breakpoints.add_line(4, 'mark > 1')
+    breakpoints.add_line(5, 'mark[0] == 1')
+    assert stops(session, breakpoints) == [5]
+    assert capsys.readouterr().out == 'Error in the condition of breakpoint 1 : Invalid operand types\n'
+
+
+def test_invalid_condition():
+    _, breakpoints = start('step')
+    with pytest.raises(ConditionError):
+        breakpoints.add_line(11, 'i >')
+    assert breakpoints.points == {}
+
+
+def watch_hits(session, breakpoints):
+    """
+    Continues until the program ends - returns the (name, new value, line) of the watch hits.
+    """
+    hits = []
+    while not session.is_done():
+        session.run_until(breakpoints.lines, breakpoint_stops(session, breakpoints))
+        hits.extend((watch.name, new, line) for watch, _, new, line in session.pop_watch_hits())
+    return hits
+
+
+@pytest.mark.parametrize('engine', SESSION_ENGINES)
+def test_watch(engine):
+    session, breakpoints = start(engine)
+    assert session.watch('s') is None  # not declared yet
+    session.run_until({9})
+    assert breakpoints.add_watch(session.watch('s')) == 1
+    assert breakpoints.points[1] == (None, 's')
+    assert watch_hits(session, breakpoints) == [('s', 0, 9), ('s', 1, 11), ('s', 5, 11), ('s', 14, 11)]
+
+
+@pytest.mark.parametrize('engine', SESSION_ENGINES)
+def test_watch_declaration(engine):
+    # the watch follows the parameter into the later calls of the function
+    session, breakpoints = start(engine)
+    breakpoints.add_function('square')
+    session.run_until(breakpoints.lines, breakpoint_stops(session, breakpoints))
+    breakpoints.add_watch(session.watch('a'))
+    breakpoints.delete(1)
+    assert [(new, line) for _, new, line in watch_hits(session, breakpoints) if line == 3] == [(4, 3), (9, 3)]
+
+
+SHADOWED = '''
+int main(void) {
+  int x, i;
+  x = 1;
+  for (i = 0; i < 3; i++) {
+    int x;
+    x = i + 10;
+  }
+  x = 2;
+  return x;
+}
+'''
+
+
+@pytest.mark.parametrize('engine', SESSION_ENGINES)
+def test_watch_shadowed(engine):
+    session, breakpoints = start(engine, SHADOWED)
+    breakpoints.add_line(7)
+    session.run_until(breakpoints.lines, breakpoint_stops(session, breakpoints))
+    watch = session.watch('x')
+    number = breakpoints.add_watch(watch)
+    breakpoints.delete(1)
+    session.run_until(breakpoints.lines, breakpoint_stops(session, breakpoints))
+    assert [(new, line) for _, _, new, line in session.pop_watch_hits()] == [(10, 7)]
+    breakpoints.delete(number)
+    session.unwatch(watch)
+    assert watch_hits(session, breakpoints) == []  # nor the outer x, after the watchpoint is deleted
+    assert session.exit_status() == 2
+
+
+def test_watch_commands(tmp_path):
+    path = write_program(tmp_path, SQUARES)
+    for engine in SESSION_ENGINES:
+        result = run_commands(path, engine, ['watch s', 'next 2', 'watch s', 'watch 1s', 'continue', 'continue',
+                                             'break 13 if s > 10', 'delete 1', 'continue', 'continue'])
+        assert 'Command:Invisible variable s\n' in result.stdout
+        assert 'Command:Watchpoint 1 : s\n' in result.stdout
+        assert 'Command:Incorrect command usage : try "watch [symbol]"\n' in result.stdout
+        assert 'Command:Watchpoint 1 : s changed from N/A to 0 at line 9\n' in result.stdout
+        assert 'Command:Watchpoint 1 : s changed from 0 to 1 at line 11\n' in result.stdout
+        assert 'Command:Breakpoint 2 : line 13 if s > 10\nNEXT line (' in result.stdout
+        assert 'Command:Breakpoint 2 : line 13 if s > 10\nNEXT line (13)' in result.stdout
+        assert result.stdout.endswith('Command:14\nEnd of Program\n')
+
+
+def step_line(session):
+    """
+    Executes a line as the step command does - the step engine passes the header of a function called in a step.
+    """
+    while not session.step() and not session.is_done():
+        pass
+
+
+@pytest.mark.parametrize('engine', SESSION_ENGINES)
+def test_step_into(engine):
+    session, _ = start(engine)
+    session.run_until({11})
+    step_line(session)
+    assert (session.currline(), session.depth(), session.valueof('a')) == (3, 2, 1)
+    step_line(session)
+    assert (session.currline(), session.valueof('a')) == (4, 1)
+
+
+@pytest.mark.parametrize('engine', SESSION_ENGINES)
+def test_finish(engine):
+    session, breakpoints = start(engine)
+    session.run_until({3})
+    session.run_out(session.depth() - 1, breakpoints.lines, breakpoint_stops(session, breakpoints))
+    # back in the middle of the line of the call - the result is not assigned yet
+    assert (session.currline(), session.depth(), session.returned_value()) == (11, 1, 1)
+    assert session.valueof('s') == 0
+    session.run_out(0, breakpoints.lines, breakpoint_stops(session, breakpoints))
+    assert session.is_done() and session.exit_status() == 14
+
+
+@pytest.mark.parametrize('engine', SESSION_ENGINES)
+def test_over(engine):
+    session, breakpoints = start(engine)
+    session.run_until({11})
+    step_over(session, breakpoints)
+    assert session.depth() == 1 and session.currline() != 3
+    assert session.valueof('s') == 1
+    # a breakpoint in the function called stops the execution in it
+    breakpoints.add_function('square')
+    session.run_until({11})
+    step_over(session, breakpoints)
+    assert (session.currline(), session.depth(), session.valueof('a')) == (3, 2, 2)
+    assert breakpoints.hits == [1]
+
+
+@pytest.mark.parametrize('engine', SESSION_ENGINES)
+def test_finish_stops(engine):
+    # finish stops at a breakpoint reached before the function returns
+    session, breakpoints = start(engine)
+    session.run_until({3})
+    breakpoints.add_line(4, 'a == 1')
+    session.run_out(session.depth() - 1, breakpoints.lines, breakpoint_stops(session, breakpoints))
+    assert (session.currline(), session.depth()) == (4, 2)
+    breakpoints.delete()
+    breakpoints.add_line(3, 'a == 3')
+    session.run_out(0, breakpoints.lines, breakpoint_stops(session, breakpoints))
+    assert (session.currline(), session.valueof('a')) == (3, 3)
+
+
+def test_step_commands(tmp_path):
+    path = write_program(tmp_path, SQUARES)
+    outputs = {}
+    for engine in SESSION_ENGINES:
+        result = run_commands(path, engine, ['next 4', 'step', 'over', 'finish', 'break square', 'continue',
+                                             'print a', 'over', 'print a', 'delete', 'finish', 'over 1', 'finish'])
+        outputs[engine] = result.stdout[result.stdout.index('Command:'):]
+        assert ('Command:NEXT line (11):     s = s + square(i);\n\n'
+                'Command:NEXT line (3):   a = a * a;\n\n'
+                'Command:NEXT line (4):   return a;\n\n'
+                'Command:Value returned : 1\nNEXT line (11):     s = s + square(i);\n\n') in outputs[engine]
+        assert ('Command:2\nNEXT line (3):   a = a * a;\n\n'
+                'Command:NEXT line (4):   return a;\n\n'
+                'Command:4\nNEXT line (4):   return a;\n\n'
+                'Command:NEXT line (4):   return a;\n\n'
+                'Command:Value returned : 4\nNEXT line (11):     s = s + square(i);\n\n'
+                'Command:Incorrect command usage : try "over"\n') in outputs[engine]
+        assert outputs[engine].endswith('Command:14\nEnd of Program\n')
+    assert outputs['step'] == outputs['vm']
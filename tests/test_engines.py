@@ -0,0 +1,396 @@
+import glob
+import os
+import pytest
+from helpers import ROOT, ENGINES, run_file, write_program
+
+
+"""
+Runs programs with --run on every engine, and checks that the engines agree
+on the output and the exit status of each of them.
+"""
+
+
+# programs run to completion - name -> (source, output, exit status)
+PROGRAMS = {
+    'while': ('''
+int main(void) {
+  int i, s, n;
+  i = 0;
+  s = 0;
+  while (i < 10) {
+    i++;
+    if (i == 3) {
+      continue;
+    }
+    if (i == 8) {
+      break;
+    }
+    s = s + i;
+  }
+  n = 0;
+  while (n < 3) {
+    int k;
+    for (k = 0; k < 5; k++) {
+      if (k == 2) {
+        break;
+      }
+      s = s + 100;
+    }
+    n = n + 1;
+  }
+  printf("%d %d %d\\n", i, s, n);
+  return s;
+}
+''', '8 625 3\n', 113),
+    'shadowing': ('''
+int main(void) {
+  int x, i;
+  x = 5;
+  i = 0;
+  printf("out %d\\n", x);
+  if (x > 0) {
+    int x;
+    x = 7;
+    printf("if %d\\n", x);
+  }
+  while (i < 3) {
+    int x;
+    x = i * 10 + 1;
+    printf("loop %d\\n", x);
+    i = i + 1;
+  }
+  printf("out %d\\n", x);
+  return x;
+}
+''', 'out 5\nif 7\nloop 1\nloop 11\nloop 21\nout 5\n', 5),
+    'sequence_points': ('''
+int main(void) {
+  int i, j;
+  i = 0;
+  if (i++ == 0 && i == 1) {
+    printf("and\\n");
+  }
+  i = 0;
+  if (i++ || i == 1) {
+    printf("or\\n");
+  }
+  i = 5;
+  j = i++ + i++;
+  printf("%d %d\\n", i, j);
+  for (i = 0, j = i++ + 10; i < 3; i++) {
+  }
+  printf("%d %d\\n", i, j);
+  j = 0;
+  --j;
+  printf("%d %d\\n", ++i, j);
+  return 0;
+}
+''', 'and\nor\n7 11\n3 10\n4 -1\n', 0),
+    'loop_counter': ('''
+int main(void) {
+  int i, k;
+  k = 100;
+  for (i = 0; i < 4; i++) {
+    printf("%d %d\\n", i, k);
+    k = i;
+  }
+  printf("%d %d\\n", i, k);
+  return 0;
+}
+''', '0 100\n1 0\n2 1\n3 2\n4 3\n', 0),
+    'printf': ('''
+int main(void) {
+  int n;
+  n = 7;
+  printf("100%%\\n");
+  printf("%s = %d%%\\n", "n", n);
+  printf("%s|%5s|%-4d|%.2f\\n", "abc", "x y", n, 2.0 / 3);
+  return 0;
+}
+''', '100%\nn = 7%\nabc|  x y|7   |0.67\n', 0),
+    'memory': ('''
+int twice(int a) {
+  return a * 2;
+}
+
+int main(void) {
+  int mark[5];
+  int copy[5];
+  float weight[4];
+  int i;
+  memset(mark, 3, 5);
+  memset(weight, 2, 3);
+  mark[4] = twice(mark[0]);
+  memcpy(copy, mark, 4);
+  memcpy(mark, weight, 2);
+  printf("%d %d %d\\n", sum(mark, 5), sum(copy, 5), sum(copy, 0));
+  printf("%f %f\\n", sum(weight, 4), weight[3]);
+  for (i = 0; i < 5; i++) {
+    printf("%d ", mark[i]);
+  }
+  printf("\\n");
+  return sum(mark, 3);
+}
+''', '16 12 0\n6.000000 0.000000\n2 2 3 3 6 \n', 7),
+}
+
+
+@pytest.mark.parametrize('name', PROGRAMS)
+@pytest.mark.parametrize('engine', ENGINES)
+def test_program(tmp_path, name, engine):
+    source, expected, status = PROGRAMS[name]
+    result = run_file(write_program(tmp_path, source), engine)
+    assert (result.stdout, result.stderr, result.returncode) == (expected, '', status)
+
+
+# programs stopped by a runtime error - name -> (source, output before the error)
+FAULTS = {
+    'division': ('''
+int main(void) {
+  int a, b;
+  a = 1;
+  b = 0;
+  printf("%d\\n", a / b);
+  return 0;
+}
+''', ''),
+    'float_division': ('''
+int main(void) {
+  float a;
+  a = 0.0;
+  printf("%f\\n", 1.0 / a);
+  return 0;
+}
+''', ''),
+    'no_return': ('''
+int f(void) {
+  int a;
+  a = 1;
+}
+
+int main(void) {
+  int x;
+  printf("start\\n");
+  x = f();
+  printf("%d\\n", x);
+  return 0;
+}
+''', 'start\n'),
+    'no_return_operand': ('''
+int f(void) {
+  int a;
+  a = 1;
+}
+
+int main(void) {
+  printf("%d\\n", f() + 1);
+  return 0;
+}
+''', ''),
+    'uninitialized': ('''
+int main(void) {
+  int x, y;
+  printf("start\\n");
+  y = x;
+  x++;
+  return 0;
+}
+''', 'start\n'),
+    'uninitialized_index': ('''
+int main(void) {
+  int x;
+  int a[3];
+  a[x] = 1;
+  return 0;
+}
+''', ''),
+    'index': ('''
+int main(void) {
+  int a[3];
+  printf("start\\n");
+  a[5] = 1;
+  return 0;
+}
+''', 'start\n'),
+    'memcpy_count': ('''
+int sum(int *value, int n) {
+  return n;
+}
+
+int main(void) {
+  int mark[3];
+  int copy[3];
+  memset(mark, 1, 3);
+  printf("%d\\n", sum(mark, 3));
+  memcpy(copy, mark, 4);
+  return 0;
+}
+''', '3\n'),
+}
+
+
+@pytest.mark.parametrize('name', sorted(FAULTS))
+@pytest.mark.parametrize('engine', ENGINES)
+def test_runtime_error(tmp_path, name, engine):
+    source, expected = FAULTS[name]
+    result = run_file(write_program(tmp_path, source), engine)
+    assert result.stdout == expected
+    assert result.returncode == 1
+    assert result.stderr.startswith('Runtime Error : ')
+    assert 'Traceback' not in result.stderr
+
+
+def test_uninitialized_condition(tmp_path):
+    # an uninitialized condition does not hold, as a missing value is false in every engine
+    path = write_program(tmp_path, '''
+int main(void) {
+  int x;
+  if (x) {
+    printf("yes\\n");
+  }
+  x = 0 - 1;
+  if (x) {
+    printf("negative\\n");
+  }
+  return 0;
+}
+''')
+    for engine in ENGINES:
+        result = run_file(path, engine)
+        assert (result.stdout, result.returncode) == ('negative\n', 0)
+
+
+RECURSION = '''
+int depth(int n) {
+  if (n == 0) {
+    return 0;
+  }
+  return depth(n - 1) + 1;
+}
+
+int main(void) {
+  printf("%d\\n", depth(N));
+  return 0;
+}
+'''
+
+
+# programs rejected by the type checking before main() starts - name -> (source, errors reported)
+TYPE_ERRORS = {
+    'assignment': ('''
+int main(void) {
+  int a;
+  float *p;
+  printf("%d\\n", 1);
+  a = p;
+  return 0;
+}
+''', 'Type Error : Type not castable TypeVal(float, ptr 1, arr 0) and TypeVal(int, ptr 0, arr 0) (line 6)\n'),
+    'arguments': ('''
+int twice(int a) {
+  return a * 2;
+}
+
+int main(void) {
+  int mark[3];
+  twice(1, 2);
+  twice(mark);
+  return mark[0.5];
+}
+''', 'Type Error : Argument number mismatch (line 8)\n'
+        'Type Error : Argument type mismatch TypeVal(int, ptr 0, arr 1), TypeVal(int, ptr 0, arr 0) (line 9)\n'
+        'Type Error : Index of mark is not an integer (line 10)\n'),
+    'statements': ('''
+int main(void) {
+  int b;
+  break;
+  b[0] = 1;
+  return 0;
+}
+''', 'Type Error : break statement not within a loop (line 4)\n'
+        'Type Error : Name b not array! (line 5)\n'),
+    'builtins': ('''
+int main(void) {
+  int mark[3];
+  float f;
+  memset(mark, 1);
+  f = sum(f, 1);
+  return 0;
+}
+''', 'Type Error : Argument number mismatch for memset (line 5)\n'
+        'Type Error : Argument type mismatch for sum: TypeVal(float, ptr 0, arr 0) (line 6)\n'),
+}
+
+
+@pytest.mark.parametrize('name', TYPE_ERRORS)
+@pytest.mark.parametrize('engine', ENGINES)
+def test_type_error(tmp_path, name, engine):
+    source, errors = TYPE_ERRORS[name]
+    result = run_file(write_program(tmp_path, source), engine)
+    assert (result.stdout, result.stderr, result.returncode) == ('', errors, 1)
+
+
+@pytest.mark.parametrize('path', sorted(glob.glob(os.path.join(ROOT, 'cfiles', '*.c'))), ids=os.path.basename)
+def test_engines_agree(path):
+    results = [run_file(path, engine) for engine in ENGINES]
+    for result in results[1:]:
+        assert (result.stdout, result.returncode) == (results[0].stdout, results[0].returncode)
+
+
+@pytest.mark.parametrize('path', sorted(glob.glob(os.path.join(ROOT, 'cfiles', '*.c'))), ids=os.path.basename)
+@pytest.mark.parametrize('engine', ENGINES)
+def test_no_fold(path, engine):
+    folded = run_file(path, engine)
+    unfolded = run_file(path, engine, '--no-fold')
+    assert (unfolded.stdout, unfolded.stderr, unfolded.returncode) == (folded.stdout, folded.stderr, folded.returncode)
+
+
+FOLDING = '''
+int main(void) {
+  int i, n, s;
+  n = 10;
+  s = 0;
+  for (i = 0; i < n; i++) {
+    s = s + i * 30 + 2 * 4;
+  }
+  printf("%d %f\\n", s, (float) 3 * 2);
+  return 0;
+}
+'''
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_folding_profile(tmp_path, engine):
+    result = run_file(write_program(tmp_path, FOLDING), engine, '--profile')
+    assert result.stdout == '1430 6.000000\n'
+    assert 'folded_nodes : 8\n' in result.stderr
+    assert 'propagated_constants : 1\n' in result.stderr
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_deep_recursion(tmp_path, engine):
+    result = run_file(write_program(tmp_path, RECURSION.replace('N', '3000')), engine)
+    assert (result.stdout, result.returncode) == ('3000\n', 0)
+
+
+def test_stack_overflow(tmp_path):
+    result = run_file(write_program(tmp_path, RECURSION.replace('N', '200000')), 'closure')
+    assert result.returncode == 1
+    assert result.stderr == 'Runtime Error : Stack overflow - function calls nested too deeply\n'
+
+
+def test_uninitialized_exit_status(tmp_path):
+    # main returning an uninitialized value exits with 0
+    path = write_program(tmp_path, '''
+int g(void) {
+  int n;
+  return n;
+}
+
+int main(void) {
+  return g();
+}
+''')
+    for engine in ENGINES:
+        result = run_file(path, engine)
+        assert (result.stdout, result.stderr, result.returncode) == ('', '', 0)
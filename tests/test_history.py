@@ -0,0 +1,102 @@
+import tracemalloc
+
+import output
+from helpers import load, run_commands, write_program
+from interpreter import StepSession, create_environment, run_batch
+from symbol_table import ValueHistory
+
+
+"""
+Value histories of the variables - bounded ring buffers indexed by line.
+"""
+
+
+def history(monkeypatch, limit):
+    monkeypatch.setattr(ValueHistory, 'limit', limit)
+    return ValueHistory()
+
+
+def test_ring(monkeypatch):
+    hist = history(monkeypatch, 3)
+    for i in range(5):
+        hist.add(i, 10 + i % 2)
+    assert (len(hist), hist.dropped()) == (3, 2)
+    assert hist.entries() == [(2, 10), (3, 11), (4, 10)]
+    assert hist.at_line(10) == [(2, 10), (4, 10)]
+    assert hist.at_line(11) == [(3, 11)]
+    assert hist.at_line(12) == []
+    assert hist.values.typecode == 'q'
+
+
+def test_kinds_of_values(monkeypatch):
+    hist = history(monkeypatch, 3)
+    hist.add(None, 1)  # as declared
+    hist.add(1.5, 2)
+    assert hist.values.typecode == 'd'
+    assert hist.entries() == [('N/A', 1), (1.5, 2)]
+    hist.add('0xdeadac81', 3)  # arrays are kept as printed
+    hist.add(None, 4)
+    assert type(hist.values) is list
+    assert hist.entries() == [(1.5, 2), ('0xdeadac81', 3), ('N/A', 4)]
+
+
+def test_no_history(monkeypatch):
+    hist = history(monkeypatch, 0)
+    hist.add(1, 1)
+    assert (len(hist), hist.entries(), hist.at_line(1)) == (0, [], [])
+
+
+LOOP = '''
+int main(void) {
+  int i, sum;
+  float average;
+  sum = 0;
+  for (i = 0; i < N; i++) {
+    sum = sum + i * 2 - 1;
+    average = sum / 2.0;
+  }
+  return 0;
+}
+'''
+
+
+def environment(source):
+    parser, code_lines = load(source)
+    return create_environment(parser, code_lines, output.OutputSink()), code_lines
+
+
+def test_loop_history():
+    env, code_lines = environment(LOOP.replace('N', '3000'))
+    session = StepSession(env, code_lines, 'off')
+    while session.currline() != 10:
+        session.step()
+    hist = session.gethistory('sum')
+    assert (len(hist), hist.dropped()) == (ValueHistory.limit, 3002 - ValueHistory.limit)
+    assert hist.entries()[-1] == (sum(i * 2 - 1 for i in range(3000)), 7)
+    assert len(hist.at_line(7)) == ValueHistory.limit and hist.at_line(5) == []
+    assert session.gethistory('average').values.typecode == 'd'  # unset when declared, then floats
+
+
+def peak_memory(source):
+    env, code_lines = environment(source)
+    tracemalloc.start()
+    try:
+        run_batch(env, code_lines)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_loop_memory_does_not_grow():
+    # the values of an iteration are dropped, and the histories of the variables are bounded
+    short = peak_memory(LOOP.replace('N', '2000'))
+    long = peak_memory(LOOP.replace('N', '20000'))
+    assert long < short + 64 * 1024
+
+
+def test_trace_command(tmp_path):
+    path = write_program(tmp_path, LOOP.replace('N', '3'))
+    result = run_commands(path, 'step', ['next 14', 'trace sum', 'trace sum 7', 'trace sum x', 'continue'])
+    assert 'sum = 0 at line 5\nsum = -1 at line 7\nsum = 0 at line 7\nsum = 3 at line 7\n' in result.stdout
+    assert 'Command:sum = -1 at line 7\nsum = 0 at line 7\nsum = 3 at line 7\nNEXT' in result.stdout
+    assert 'Incorrect command usage : try "trace [symbol] [lineno]"' in result.stdout
@@ -0,0 +1,90 @@
+import astree
+import output
+import symbol_table
+from helpers import load, run_commands, write_program
+from interpreter import Logger, StepSession, create_environment
+
+
+"""
+Execution log of the step engine - raw records kept while stepping, formatted when shown.
+"""
+
+
+LOOP = '''
+int main(void) {
+  int i, s;
+  s = 0;
+  for (i = 0; i < 3; i++) {
+    s = s + i;
+  }
+  return s;
+}
+'''
+
+
+def start(log_level):
+    parser, code_lines = load(LOOP)
+    return StepSession(create_environment(parser, code_lines, output.OutputSink()), code_lines, log_level)
+
+
+def step_all(session):
+    while not session.is_done():
+        session.step()
+
+
+def no_formatting(monkeypatch):
+    def fail(self):
+        raise AssertionError('formatted while stepping')
+    for cls in (astree.AstNode, symbol_table.Value):
+        monkeypatch.setattr(cls, '__str__', fail)
+        monkeypatch.setattr(cls, '__repr__', fail)
+
+
+def test_levels(monkeypatch):
+    no_formatting(monkeypatch)
+    for level in Logger.levels:
+        session = start(level)
+        step_all(session)
+        records = session.logger.records
+        if level == 'off':
+            assert len(records) == 0
+        else:
+            assert len(records) > 0
+            _, exec_stack, value_stack = records[-1]
+            if level == 'node':
+                assert type(exec_stack) is int and type(value_stack) is int
+            else:
+                assert type(exec_stack) is tuple and type(value_stack) is tuple
+
+
+def test_node_types():
+    session = start('node')
+    session.set_log(node_types=['Assignment'])
+    step_all(session)
+    names = [node.__class__.__name__ for node, _, _ in session.logger.records]
+    assert names == ['Assignment'] * 10  # entered and done, for each of the 5 assignments
+    session.set_log(node_types=[])
+    session.reset_log()
+    assert len(session.logger.records) == 0
+
+
+def test_bounded(capsys):
+    logger = Logger('node', maxlen=4)
+    session = start('node')
+    session.logger = logger
+    step_all(session)
+    assert len(logger.records) == 4 and logger.count > 4
+    session.show_log()
+    shown = capsys.readouterr().out
+    assert '({} earlier steps are not kept)'.format(logger.count - 4) in shown
+    assert shown.count('***Executing') == 4
+
+
+def test_log_commands(tmp_path):
+    path = write_program(tmp_path, LOOP)
+    result = run_commands(path, 'step', ['log level stack', 'log only Assignment', 'next 3', 'log',
+                                         'log level loud', 'continue'])
+    assert ("***Executing Assignment - (4, 4)\nvalue stack : 'DeclarationRet' :: 'AssignmentRet'\n"
+            'exec stack : [FunctionCall, CompoundStatement, JumpStatement') in result.stdout
+    assert result.stdout.count('***Executing') == 2
+    assert 'Incorrect command usage : try "log", "log level [off|node|stack]" or "log only [node types]"' in result.stdout
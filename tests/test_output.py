@@ -0,0 +1,99 @@
+import io
+import pytest
+
+import output
+import vm
+from environment import CRuntimeErr
+from helpers import ENGINES, load, run_file, write_program
+from interpreter import StepSession, create_environment
+
+
+"""
+Output sinks of the programs - buffering, capture in memory, the byte limit, and one sink per run.
+"""
+
+
+def test_capture():
+    sink = output.OutputSink(buffer_size=4)
+    for i in range(100):
+        sink.write('{}\n'.format(i))
+    assert sink.pending < 4
+    assert len(sink.parts) < 4
+    sink.flush()
+    assert sink.pending == 0
+    assert sink.getvalue() == ''.join('{}\n'.format(i) for i in range(100))
+
+
+def test_block_buffered():
+    stream = io.StringIO()
+    sink = output.OutputSink(stream, buffer_size=8)
+    sink.write('abc\n')
+    assert stream.getvalue() == ''
+    sink.write('defgh')
+    assert stream.getvalue() == 'abc\ndefgh'
+    sink.write('i')
+    sink.flush()
+    assert stream.getvalue() == 'abc\ndefghi'
+
+
+def test_line_buffered():
+    stream = io.StringIO()
+    sink = output.OutputSink(stream, line_buffered=True)
+    sink.write('abc')
+    assert stream.getvalue() == ''
+    sink.write('d\ne')
+    assert stream.getvalue() == 'abcd\ne'
+
+
+def test_limit():
+    sink = output.OutputSink(limit=10)
+    sink.write('12345')
+    with pytest.raises(CRuntimeErr):
+        sink.write('6789é0')  # cut within the character - the partial character is dropped
+    assert sink.getvalue() == '123456789'
+
+
+RUNAWAY = '''
+int main(void) {
+  while (1) {
+    printf("spam\\n");
+  }
+  return 0;
+}
+'''
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_max_output(tmp_path, engine):
+    result = run_file(write_program(tmp_path, RUNAWAY), engine, '--max-output', '1000')
+    assert result.stdout == 'spam\n' * 200
+    assert result.stderr == 'Runtime Error : Output limit of 1000 bytes exceeded\n'
+    assert result.returncode == 1
+
+
+COUNT = '''
+int main(void) {
+  int i;
+  for (i = 0; i < 3; i++) {
+    printf("%d\\n", i);
+  }
+  return i;
+}
+'''
+
+
+def test_sessions_print_apart():
+    # sessions running the same program side by side each print into their own sink
+    parser, code_lines = load(COUNT)
+    sessions = [StepSession(create_environment(parser, code_lines, output.OutputSink()), code_lines, 'off'),
+                StepSession(create_environment(parser, code_lines, output.OutputSink()), code_lines, 'off'),
+                vm.VMSession(parser.functions, output.OutputSink())]
+    for _ in range(6):
+        sessions[1].step()
+    while not all(session.is_done() for session in sessions):
+        for session in sessions:
+            if not session.is_done():
+                session.step()
+    for session in sessions:
+        assert session.out.getvalue() == '0\n1\n2\n'
+        assert session.exit_status() == 3
@@ -0,0 +1,108 @@
+import subprocess
+import sys
+
+import output
+from helpers import ROOT, load, run_file, write_program
+from interpreter import StepSession, create_environment
+from recorder import TraceReader, NO_NODE, NO_VAR, NO_ELEMENT
+
+
+"""
+Execution traces recorded by --record, and read back by TraceReader.
+"""
+
+
+SQUARES = '''
+int square(int a) {
+  return a * a;
+}
+
+int main(void) {
+  int i, s;
+  int mark[3];
+  s = 0;
+  for (i = 0; i < 3; i++) {
+    mark[i] = square(i);
+
+    s = s + mark[i];
+  }
+  return s;
+}
+'''
+
+
+def record(tmp_path, source):
+    path = tmp_path / 'trace.bin'
+    result = run_file(write_program(tmp_path, source), 'step', '--record', str(path))
+    assert result.returncode == 5
+    return TraceReader(str(path))
+
+
+def test_nodes_of_steps(tmp_path):
+    # the node of a step is the node executed last in the line, not the one waiting for the next line
+    reader = record(tmp_path, SQUARES)
+    for step, line, node, _, _, _ in reader.records():
+        if node != NO_NODE:
+            _, first, last = reader.nodes[node]
+            assert first <= line <= last, reader.describe(reader.record(step))
+    assert reader.describe(reader.record(3)) == 'step 3 line 9 : Assignment - s = 0'
+    assert reader.describe(reader.record(9)) == 'step 9 line 12'  # the blank line
+
+
+def test_queries(tmp_path):
+    reader = record(tmp_path, SQUARES)
+    assert (reader.nsteps, len(reader)) == (31, 31)
+    assert reader.history('s') == [(3, 9, NO_ELEMENT, 0), (10, 13, NO_ELEMENT, 0),
+                                   (18, 13, NO_ELEMENT, 1), (26, 13, NO_ELEMENT, 5)]
+    assert [(idx, val) for _, _, idx, val in reader.history('mark')] == [(0, 0), (1, 1), (2, 4)]
+    assert reader.steps_at_line(13) == [10, 18, 26]
+    assert reader.replay(9) == {'a': 0, 'i': 0, 'mark': {0: 0}, 's': 0}
+    assert reader.replay(reader.nsteps) == {'a': 2, 'i': 3, 'mark': {0: 0, 1: 1, 2: 4}, 's': 5}
+
+
+def test_interactive_trace(tmp_path):
+    # stepping line by line records the same trace as running in batch
+    batch = record(tmp_path, SQUARES)
+    parser, code_lines = load(SQUARES)
+    path = tmp_path / 'stepped.bin'
+    session = StepSession(create_environment(parser, code_lines, output.OutputSink(), str(path)), code_lines, 'off')
+    while not session.is_done():
+        session.step()
+    session.env.recorder.close()
+    stepped = TraceReader(str(path))
+    assert list(stepped.records()) == list(batch.records())
+    assert stepped.nodes == batch.nodes
+
+
+LOOP = '''
+int main(void) {
+  int i, s;
+  s = 0;
+  for (i = 0; i < 5000; i++) {
+    s = s + i;
+  }
+  return 0;
+}
+'''
+
+
+def test_seek_across_chunks(tmp_path):
+    path = tmp_path / 'trace.bin'
+    run_file(write_program(tmp_path, LOOP), 'step', '--record', str(path))
+    reader = TraceReader(str(path))
+    assert reader.nsteps > 3 * 4096
+    records = list(reader.records())
+    for step in (0, 4095, 4096, 5000, reader.nsteps - 1):
+        num = reader.seek_step(step)
+        assert records[num][0] == step and (num == 0 or records[num - 1][0] < step)
+    assert reader.seek_step(reader.nsteps) == len(reader)
+    assert reader.replay(reader.nsteps)['s'] == sum(range(5000))
+    assert all(var == NO_VAR or reader.variables[var][0] in ('i', 's') for _, _, _, var, _, _ in records)
+
+
+def test_command_line(tmp_path):
+    reader = record(tmp_path, SQUARES)
+    result = subprocess.run([sys.executable, 'recorder.py', str(tmp_path / 'trace.bin'), '--history', 'mark', '--line', '13'],
+                            cwd=ROOT, capture_output=True, text=True, timeout=120)
+    assert result.stdout == ('mark[0] = 0 at line 11 (step 8)\nmark[1] = 1 at line 11 (step 16)\n'
+                             'mark[2] = 4 at line 11 (step 24)\n[10, 18, 26]\n')
@@ -0,0 +1,72 @@
+import pytest
+
+import output
+import vm
+from helpers import load, run_commands, write_program
+
+
+"""
+Interactive sessions on the virtual machine - stepping, values and histories of the variables.
+"""
+
+
+SQUARES = '''
+int square(int a) {
+  a = a * a;
+  return a;
+}
+
+int main(void) {
+  int i, s;
+  s = 0;
+  for (i = 1; i < 4; i++) {
+    s = s + square(i);
+  }
+  printf("%d\\n", s);
+  return s;
+}
+'''
+
+
+@pytest.fixture
+def session():
+    parser, _ = load(SQUARES)
+    return vm.VMSession(parser.functions, output.OutputSink())
+
+
+def test_step_lines(session):
+    lines = [session.currline()]
+    while not session.is_done():
+        session.step()
+        lines.append(session.currline())
+    assert lines == [7, 8, 9, 10, 11, 3, 4, 10, 11, 3, 4, 10, 11, 3, 4, 10, 13, 14, 14]
+    assert session.exit_status() == 14
+    assert session.out.getvalue() == '14\n'
+
+
+def test_values(session):
+    session.run_until({13})
+    assert session.currline() == 13
+    assert session.valueof('s') == 14
+    assert session.getvalue('i') == 4
+    assert session.getvalue('a') is None
+    assert [value for value, _ in session.gethistory('s').entries()] == [0, 1, 5, 14]
+    assert session.gethistory('s').at_line(11) == [(1, 11), (5, 11), (14, 11)]
+
+
+def test_call_depth(session):
+    session.run_until({3})
+    assert session.depth() == 2
+    assert session.getvalue('a') == 1
+    session.run_out(1, set())
+    assert session.depth() == 1
+    assert session.returned_value() == 1
+
+
+def test_commands(tmp_path):
+    path = write_program(tmp_path, SQUARES)
+    result = run_commands(path, 'vm', ['next 3', 'print s', 'continue'])
+    assert result.returncode == 0
+    assert 'NEXT line (10)' in result.stdout
+    assert 'Command:0\n' in result.stdout
+    assert result.stdout.endswith('14\nEnd of Program\n')
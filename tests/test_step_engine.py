@@ -0,0 +1,276 @@
+import sys
+import tracemalloc
+
+import output
+from environment import profile_counts
+from helpers import load, run_file, write_program
+from interpreter import StepSession, create_environment
+from symbol_table import TypeVal, Value, Symbol, INT_TYPE
+
+
+"""
+Internals of the step engine - the execution order of the nodes, the storage of the values.
+"""
+
+
+LOOP = '''
+int main(void) {
+  int i, s;
+  s = 0;
+  for (i = 0; i < 10; i++) {
+    if (i < 5) {
+      s = s + i;
+    }
+  }
+  return s;
+}
+'''
+
+
+def start(source, fold=True):
+    """
+    Starts a step session on the source, with its output captured.
+    """
+    parser, code_lines = load(source, fold)
+    return StepSession(create_environment(parser, code_lines, output.OutputSink()), code_lines, 'off')
+
+
+def run_to(session, lineno):
+    while session.currline() != lineno and not session.is_done():
+        session.step()
+
+
+def run(session):
+    while not session.is_done():
+        session.step()
+    return session.exit_status()
+
+
+def test_child_order_precomputed():
+    session = start(LOOP)
+    profile_counts['child_sorts'] = 0
+    assert run(session) == 10
+    assert profile_counts['child_sorts'] == 0
+
+
+def test_child_sorts_profile(tmp_path):
+    result = run_file(write_program(tmp_path, LOOP), 'step', '--profile')
+    assert result.returncode == 10
+    assert 'child_sorts : 0\n' in result.stderr
+
+
+ARRAYS = '''
+int main(void) {
+  int mark[100000];
+  float weight[4];
+  int i;
+  for (i = 0; i < 4; i++) {
+    mark[i * 1000] = i + 1;
+    weight[i] = i / 2.0;
+  }
+  mark[99999] = mark[3000] + 1;
+  return mark[99999];
+}
+'''
+
+
+def test_array_storage():
+    session = start(ARRAYS)
+    run_to(session, 11)
+    mark = session.valueof('mark')
+    weight = session.valueof('weight')
+    assert (mark.typecode, weight.typecode) == ('q', 'd')
+    assert sys.getsizeof(mark) < 8 * len(mark) + 100  # about 8 bytes per element
+    assert (len(mark), mark[0], mark[1000], mark[99999], sum(mark)) == (100000, 1, 2, 5, 15)
+    assert list(weight) == [0.0, 0.5, 1.0, 1.5]
+    assert run(session) == 5
+
+
+PASS_ARRAY = '''
+int first(int *value) {
+  value[1] = value[0] + 1;
+  return value[1];
+}
+
+int main(void) {
+  int mark[{size}];
+  mark[0] = 7;
+  return first(mark) + first(mark);
+}
+'''
+
+
+def count_calls(session):
+    """
+    Runs the session to the end, counting the calls of Python and of built-in functions.
+    """
+    calls = [0]
+
+    def profile(frame, event, arg):
+        if event in ('call', 'c_call'):
+            calls[0] += 1
+
+    sys.setprofile(profile)
+    try:
+        status = run(session)
+    finally:
+        sys.setprofile(None)
+    return status, calls[0]
+
+
+def test_array_call_cost():
+    small = count_calls(start(PASS_ARRAY.replace('{size}', '10')))
+    large = count_calls(start(PASS_ARRAY.replace('{size}', '100000')))
+    assert small == large
+    assert small[0] == 16
+
+
+def test_array_by_reference():
+    session = start(PASS_ARRAY.replace('{size}', '10'))
+    run_to(session, 3)
+    storage = session.valueof('value')
+    session.run_out(session.depth() - 1, set())
+    assert session.valueof('mark') is storage
+    assert storage[1] == 8
+
+
+EXPRESSIONS = '''
+int main(void) {
+  int i, sum;
+  float average;
+  sum = 0;
+  for (i = 0; i < {count}; i++) {
+    sum = sum + i * 2 - 1;
+    average = sum / 2.0;
+  }
+  return 0;
+}
+'''
+
+CONSTANTS = '''
+int main(void) {
+  int i, x;
+  for (i = 0; i < {count}; i++) {
+    x = 5;
+  }
+  return 0;
+}
+'''
+
+
+def values_created(source, count):
+    """
+    Runs the source with the loop count, returning the number of Values created and of types interned.
+    """
+    session = start(source.replace('{count}', str(count)))
+    addr = Value._addr
+    types = len(TypeVal._interned)
+    run(session)
+    return (Value._addr - addr) // 0x82, len(TypeVal._interned) - types  # every Value takes the next address
+
+
+def test_interned_types():
+    assert TypeVal('int') is INT_TYPE
+    assert TypeVal('float', 1) is TypeVal('float', 1)
+    for obj in (Value(INT_TYPE, 1), Symbol('x', None)):
+        assert not hasattr(obj, '__dict__')
+
+
+def test_values_per_expression():
+    # one Value for the result of each arithmetic and comparison - types and constants are shared
+    short = values_created(EXPRESSIONS, 1000)
+    long = values_created(EXPRESSIONS, 2000)
+    assert long[0] - short[0] == 5 * 1000
+    assert short[1] == long[1] == 0
+    short = values_created(CONSTANTS, 1000)
+    long = values_created(CONSTANTS, 2000)
+    assert long[0] - short[0] == 1000
+
+
+def test_value_size():
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        values = [Value(INT_TYPE, 1) for _ in range(10000)]
+        size = (tracemalloc.get_traced_memory()[0] - before) / len(values)
+    finally:
+        tracemalloc.stop()
+    assert size < 120  # the slots, the address and the reference in the list - no __dict__, no TypeVal
+
+
+FOLDING = '''
+int main(void) {
+  int i, n, s;
+  float f;
+  n = 10;
+  s = 0;
+  f = (float) 3 *
+      2;
+  for (i = 0; i < n; i++) {
+    s = s + i * 30 +
+        2 * 4;
+  }
+  printf("%d %f\\n", s, f);
+  return s;
+}
+'''
+
+
+def stepped_lines(session):
+    lines = [session.currline()]
+    while not session.is_done():
+        session.step()
+        lines.append(session.currline())
+    return lines
+
+
+def test_folding_keeps_lines():
+    folded = start(FOLDING)
+    folded_lines = stepped_lines(folded)
+    unfolded = start(FOLDING, fold=False)
+    assert folded_lines == stepped_lines(unfolded)
+    assert folded.exit_status() == unfolded.exit_status() == 1430
+
+
+WHILE = '''
+int main(void) {
+  int i;
+  i = 0;
+  while (i < 3) {
+    i++;
+    if (i == 2) {
+      continue;
+    }
+  }
+  return i;
+}
+'''
+
+
+def test_while_lines():
+    # the condition is visited once per iteration, and once more when it fails
+    session = start(WHILE)
+    lines = stepped_lines(session)
+    assert session.exit_status() == 3
+    assert lines.count(5) == 4
+    assert lines.count(6) == 3
+    assert lines.count(8) == 1
+
+
+POSTFIX = '''
+int main(void) {
+  int i, j;
+  i = 5;
+  j = i++ + i++;
+  j = j + i;
+  return j;
+}
+'''
+
+
+def test_postfix_updates():
+    # the updates are applied at the end of the statement, before the next line runs
+    session = start(POSTFIX)
+    run_to(session, 6)
+    assert (session.valueof('i'), session.valueof('j')) == (7, 11)
+    assert run(session) == 18
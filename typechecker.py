@@ -0,0 +1,256 @@
+from astree import *
+from symbol_table import TypeVal, INT_TYPE, FLOAT_TYPE, binary_result_type
+from cbuiltins import lookup_builtin, compile_format, string_arg, STRING_TYPE, VOID_TYPE
+
+
+"""
+Static type checking pass.
+
+Every expression node is annotated with its result type (AstNode.static_type),
+and type errors are collected before the program starts running.
+Once a program passes the check, the ast nodes skip the runtime type checks
+that have been proven unnecessary - binary operations are bound to the handler
+of their operand types, and casts, calls and returns no longer check castability.
+"""
+
+
+class TypeScope:
+    """
+    Block scope while type checking - maps variable names to TypeVals.
+    """
+    def __init__(self, parent=None):
+        self.names = {}
+        self.parent = parent
+
+    def lookup(self, name):
+        scope = self
+        while scope is not None:
+            if name in scope.names:
+                return scope.names[name]
+            scope = scope.parent
+        return None
+
+
+def assignable(from_type, to_type):
+    """
+    Whether a value of from_type can be stored into to_type.
+    Arrays and pointers only refer to elements of the same type.
+    """
+    if not from_type.castable(to_type):
+        return False
+    return to_type.sum_arr_ptr() == 0 or from_type.typename == to_type.typename
+
+
+def lineno(node):
+    try:
+        return node.startline()
+    except AttributeError:
+        return '?'
+
+
+class TypeChecker:
+    """
+    Checks the types of function definitions.
+    """
+    def __init__(self, fundefs):
+        self.signatures = {}  # function name -> (return TypeVal, list of parameter (name, TypeVal))
+        for fundef in fundefs:
+            self.signatures[fundef.name()] = self.signature(fundef)
+        self.fundefs = fundefs
+        self.errors = []
+        self.rtype = None  # return type of the function being checked
+        self.loop_depth = 0  # number of loops enclosing the statement being checked
+
+    def signature(self, fundef):
+        funcval = fundef.function_val()
+        return funcval.rtype, [(name, param_type) for param_type, name in funcval.params]
+
+    def error(self, node, msg):
+        self.errors.append('{} (line {})'.format(msg, lineno(node)))
+
+    def check_program(self):
+        for fundef in self.fundefs:
+            self.rtype, params = self.signatures[fundef.name()]
+            scope = TypeScope()
+            for name, param_type in params:
+                scope.names[name] = param_type
+            self.check(fundef.body, scope)
+        return self.errors
+
+    # statements
+
+    def check(self, node, scope):
+        if node is None:
+            return
+        checker = getattr(self, 'check_' + node.__class__.__name__, None)
+        if checker is None:
+            self.typeof(node, scope)  # expressions used as statements
+        else:
+            checker(node, scope)
+
+    def check_CompoundStatement(self, node, scope):
+        for stmt in node:
+            self.check(stmt, scope)
+
+    def check_ExpressionStatement(self, node, scope):
+        if node.expr is not None:
+            self.typeof(node.expr, scope)
+
+    def check_Declaration(self, node, scope):
+        typename = spec_typename(node.declaration_spec)
+        for dec in (node.init_dec_list if node.init_dec_list is not None else []):
+            initializer = None
+            if isinstance(dec, InitDeclarator):
+                initializer = dec.initializer
+                dec = dec.declarator
+            name, ptr, arr_size = unpack_declarator(dec)
+            vtype = TypeVal(typename, ptr=ptr, array=0 if arr_size is None else 1)
+            if arr_size is not None and self.typeof(arr_size, scope) is not INT_TYPE:
+                self.error(node, 'Array size of {} is not an integer'.format(name))
+            if initializer is not None:
+                init_type = self.typeof(initializer, scope)
+                if init_type is not None and not assignable(init_type, vtype):
+                    self.error(node, 'Cannot initialize {} {} with {}'.format(vtype, name, init_type))
+            scope.names[name] = vtype
+
+    def check_SelectionStatement(self, node, scope):
+        block_scope = TypeScope(scope)
+        self.typeof(node.if_cond, block_scope)
+        self.check(node.if_expr, block_scope)
+        self.check(node.else_expr, block_scope)
+
+    def check_IterationStatement(self, node, scope):
+        iter_scope = TypeScope(scope)
+        for exp in (node.exp1, node.exp2, node.exp3):
+            self.check(exp, iter_scope)
+        self.loop_depth += 1
+        self.check(node.body, iter_scope)
+        self.loop_depth -= 1
+
+    def check_JumpStatement(self, node, scope):
+        if node.jump_type != 'return':
+            if self.loop_depth == 0:
+                self.error(node, '{} statement not within a loop'.format(node.jump_type))
+            return
+        if node.what is None:
+            return
+        vtype = self.typeof(node.what, scope)
+        if vtype is not None and self.rtype is not VOID_TYPE and not assignable(vtype, self.rtype):
+            self.error(node, 'Wrong return type! {} {}'.format(vtype, self.rtype))
+
+    # expressions
+
+    def typeof(self, node, scope):
+        """
+        Annotates the expression node with its type and returns it - None if it has a type error.
+        """
+        vtype = getattr(self, 'type_' + node.__class__.__name__)(node, scope)
+        node.static_type = vtype
+        return vtype
+
+    def type_Constant(self, node, scope):
+        return INT_TYPE if node.const_type == 'int' else FLOAT_TYPE
+
+    def type_String(self, node, scope):
+        return STRING_TYPE
+
+    def type_Id(self, node, scope):
+        vtype = scope.lookup(node.name())
+        if vtype is None:
+            self.error(node, 'Name {} does not exist!'.format(node.name()))
+        return vtype
+
+    def type_Expression(self, node, scope):
+        vtype = None
+        for expr in node:
+            vtype = self.typeof(expr, scope)
+        return vtype
+
+    def type_Assignment(self, node, scope):
+        ltype = self.typeof(node.lvalue, scope)
+        rtype = self.typeof(node.rvalue, scope)
+        if not isinstance(node.lvalue, (Id, ArrayReference)):
+            self.error(node, 'Cannot assign to {}'.format(node.lvalue))
+            return None
+        if ltype is not None and rtype is not None and not assignable(rtype, ltype):
+            self.error(node, 'Type not castable {} and {}'.format(rtype, ltype))
+        return ltype
+
+    def type_ArrayReference(self, node, scope):
+        arr_type = self.typeof(node.name, scope)
+        idx_type = self.typeof(node.idx, scope)
+        if idx_type is not None and idx_type is not INT_TYPE:
+            self.error(node, 'Index of {} is not an integer'.format(node.name.name()))
+        if arr_type is None:
+            return None
+        if arr_type.sum_arr_ptr() == 0:
+            self.error(node, 'Name {} not array!'.format(node.name.name()))
+            return None
+        return TypeVal(arr_type.typename)
+
+    def type_TypeCast(self, node, scope):
+        vtype = self.typeof(node.cast_expr, scope)
+        cast_type = TypeVal(spec_typename(node.type_name))
+        if vtype is not None and not vtype.castable(cast_type):
+            self.error(node, 'Type cannot be casted {}, {}'.format(vtype, cast_type))
+        return cast_type
+
+    def type_UnaryExpr(self, node, scope):
+        vtype = self.typeof(node.operand, scope)
+        if vtype is not None and vtype not in (INT_TYPE, FLOAT_TYPE):
+            self.error(node, 'Cannot apply {} to {}'.format(node.op_name, vtype))
+        return vtype
+
+    def type_BinaryOp(self, node, scope):
+        ltype = self.typeof(node.arg1, scope)
+        rtype = self.typeof(node.arg2, scope)
+        if ltype is None or rtype is None:
+            return None
+        if node.handlers is None:
+            self.error(node, 'Invalid binary operator {}'.format(node.op_name))
+            return None
+        handler = node.handlers.get((ltype, rtype))
+        if handler is None:
+            self.error(node, 'Type not castable {} and {}'.format(ltype, rtype))
+            return None
+        node.handler = handler
+        return binary_result_type(node.op_name, ltype, rtype)
+
+    def type_FunctionCall(self, node, scope):
+        funcname = node.func_name.name()
+        arg_types = [self.typeof(arg, scope) for arg in node.argument_list]
+        builtin = lookup_builtin(funcname, self.signatures)
+        if builtin is not None:
+            if None in arg_types:
+                return None
+            msg = builtin.check(arg_types)
+            if msg is not None:
+                self.error(node, msg)
+                return None
+            if funcname == 'printf' and isinstance(node.argument_list[0], String):
+                _, converters = compile_format(node.argument_list[0].string)
+                if len(converters) != len(arg_types) - 1:
+                    self.error(node, 'printf format expects {} arguments'.format(len(converters)))
+                elif any(arg_type is STRING_TYPE and convert is not string_arg
+                         for convert, arg_type in zip(converters, arg_types[1:])):
+                    self.error(node, 'printf format expects a number for a string argument')
+            return builtin.result_type(arg_types)
+
+        if funcname not in self.signatures:
+            self.error(node, 'No function named {} defined.'.format(funcname))
+            return None
+        rtype, params = self.signatures[funcname]
+        if len(arg_types) != len(params):
+            self.error(node, 'Argument number mismatch')
+            return rtype
+        for arg_type, (name, param_type) in zip(arg_types, params):
+            if arg_type is not None and not assignable(arg_type, param_type):
+                self.error(node, 'Argument type mismatch {}, {}'.format(arg_type, param_type))
+        return rtype
+
+
+def check_types(fundefs):
+    """
+    Type checks all function definitions. Returns the list of type errors.
+    """
+    return TypeChecker(fundefs).check_program()
@@ -0,0 +1,403 @@
+from bytecode import *
+from environment import CRuntimeErr, UninitializedError, UNINIT
+from symbol_table import ValueHistory, Watch
+
+
+"""
+Virtual machine running the bytecode compiled by bytecode.py.
+
+Each function activation owns a Frame with a fixed number of variable slots
+and its own operand stack. The frames are kept in an explicit stack,
+so the machine can stop at any line and resume later on.
+"""
+
+
+class Frame:
+    """
+    Activation record of a function call.
+    """
+    def __init__(self, code, slots):
+        self.code = code  # CodeObject
+        self.slots = slots
+        self.stack = []
+        self.pc = 0
+        self.history = {}  # slot -> ValueHistory - only kept for debug code
+        self.watch_values = {}  # slot -> value of a watched variable last seen
+
+    def currline(self):
+        return self.code.line_at(self.pc)
+
+
+class VirtualMachine:
+    """
+    Dispatch loop over the instructions of a compiled Program.
+    """
+    def __init__(self, program, out):
+        self.program = program
+        self.out = out  # OutputSink the builtins print to
+        self.frames = []
+        self.currline = 0
+        self.retval = None
+        self.finished = False
+        self.watch_hits = []  # (Watch, old value, new value, line) of the changes of the watched variables
+
+    def start(self, funcname='main', args=()):
+        code = self.program.function(funcname)
+        slots = [UNINIT] * code.nslots
+        for (_, slot), arg in zip(code.params, args):
+            slots[slot] = arg
+        self.frames = [Frame(code, slots)]
+        self.currline = code.startline
+        self.finished = False
+
+    def run(self):
+        """
+        Runs until the program ends. Returns the value returned by the entry function.
+        """
+        while not self.finished:
+            self.execute(stepping=False)
+        return self.retval
+
+    def step(self, return_depth=0):
+        """
+        Runs until the execution reaches a new line - only available on debug code.
+        Also stops right after a return leaves return_depth frames or fewer, in the middle of the line of the call.
+        """
+        if not self.finished:
+            self.execute(stepping=True, return_depth=return_depth)
+
+    def execute(self, stepping, return_depth=0):
+        frames = self.frames
+        functions = self.program.codes
+        frame = frames[-1]
+        code = frame.code.code
+        consts = frame.code.consts
+        slots = frame.slots
+        stack = frame.stack
+        push = stack.append
+        pop = stack.pop
+        pc = frame.pc
+        depth = len(frames)
+
+        try:
+            while True:
+                op = code[pc]
+                arg = code[pc + 1]
+                pc += 2
+
+                if op == LOAD_LOCAL:
+                    push(slots[arg])
+                elif op == LOAD_CONST:
+                    push(consts[arg])
+                elif op == STORE_LOCAL:
+                    slots[arg] = pop()
+                elif op == LOAD_ELEM:
+                    idx = pop()
+                    stack[-1] = stack[-1][idx]
+                elif op == STORE_ELEM:
+                    val = pop()
+                    idx = pop()
+                    pop()[idx] = val
+                elif op == JUMP_IF_FALSE:
+                    if not pop():
+                        pc = arg
+                elif op == JUMP:
+                    pc = arg
+                elif op == INC_LOCAL:
+                    slots[arg] += 1
+                elif op == DEC_LOCAL:
+                    slots[arg] -= 1
+                elif op == ADD:
+                    val = pop()
+                    stack[-1] = stack[-1] + val
+                elif op == SUB:
+                    val = pop()
+                    stack[-1] = stack[-1] - val
+                elif op == MUL:
+                    val = pop()
+                    stack[-1] = stack[-1] * val
+                elif op == DIV:
+                    val = pop()
+                    stack[-1] = stack[-1] / val
+                elif op == MOD:
+                    val = pop()
+                    stack[-1] = stack[-1] % val
+                elif op == LT:
+                    val = pop()
+                    stack[-1] = 1 if stack[-1] < val else 0
+                elif op == GT:
+                    val = pop()
+                    stack[-1] = 1 if stack[-1] > val else 0
+                elif op == LE:
+                    val = pop()
+                    stack[-1] = 1 if stack[-1] <= val else 0
+                elif op == GE:
+                    val = pop()
+                    stack[-1] = 1 if stack[-1] >= val else 0
+                elif op == EQ:
+                    val = pop()
+                    stack[-1] = 1 if stack[-1] == val else 0
+                elif op == NE:
+                    val = pop()
+                    stack[-1] = 1 if stack[-1] != val else 0
+                elif op == TO_INT:
+                    stack[-1] = int(stack[-1])
+                elif op == TO_FLOAT:
+                    stack[-1] = float(stack[-1])
+                elif op == POP:
+                    pop()
+                elif op == DUP:
+                    push(stack[-1])
+                elif op == INC_ELEM_POST or op == INC_ELEM_PRE:
+                    idx = pop()
+                    arr = pop()
+                    val = arr[idx]
+                    arr[idx] = val + arg
+                    push(val if op == INC_ELEM_POST else val + arg)
+                elif op == CALL:
+                    callee = functions[arg]
+                    callee_slots = [UNINIT] * callee.nslots
+                    nparams = callee.nparams
+                    if nparams > 0:
+                        callee_slots[1:nparams + 1] = stack[-nparams:]
+                        del stack[-nparams:]
+                    frame.pc = pc
+                    frame = Frame(callee, callee_slots)
+                    frames.append(frame)
+                    code = callee.code
+                    consts = callee.consts
+                    slots = callee_slots
+                    stack = frame.stack
+                    push = stack.append
+                    pop = stack.pop
+                    pc = 0
+                elif op == RETURN or op == RETURN_NONE:
+                    val = pop() if op == RETURN else UNINIT
+                    frames.pop()
+                    if len(frames) == 0:
+                        self.retval = val
+                        self.finished = True
+                        return
+                    frame = frames[-1]
+                    code = frame.code.code
+                    consts = frame.code.consts
+                    slots = frame.slots
+                    stack = frame.stack
+                    push = stack.append
+                    pop = stack.pop
+                    pc = frame.pc
+                    push(val)
+                    if len(frames) <= return_depth:
+                        self.currline = frame.code.line_at(pc - 2)
+                        frame.pc = pc
+                        return
+                elif op == LINE:
+                    # the line of the function header (pc 2) is passed by, as the step engine does
+                    if stepping and pc != 2 and (arg != self.currline or len(frames) != depth):
+                        self.currline = arg
+                        frame.pc = pc
+                        return
+                    self.currline = arg
+                elif op == TRACE_LOCAL:
+                    history = frame.history.get(arg)
+                    if history is None:
+                        history = frame.history[arg] = ValueHistory()
+                    val = slots[arg]
+                    lineno = frame.code.line_at(pc - 2)  # the machine line is stale after a call returns
+                    history.add(printval(val) if isinstance(val, list) else None if val is UNINIT else val, lineno)
+                    if arg in frame.code.watched:
+                        self.note_watch(frame, arg, val, lineno)
+                elif op == NEW_INT_ARRAY:
+                    stack[-1] = [0] * stack[-1]
+                elif op == NEW_FLOAT_ARRAY:
+                    stack[-1] = [0.0] * stack[-1]
+                elif op == CALL_NATIVE:
+                    native, nargs = consts[arg]
+                    vals = stack[len(stack) - nargs:]
+                    del stack[len(stack) - nargs:]
+                    push(native(self.out, *vals))
+                elif op == RAISE:
+                    raise CRuntimeErr(consts[arg])
+                elif op == NOP:
+                    pass
+                else:
+                    raise CRuntimeErr('Invalid opcode {}'.format(op))
+        except UninitializedError:
+            frame.pc = pc - 2
+            raise CRuntimeErr('Variable not initialized! (line {})'.format(frame.currline()))
+        except IndexError:
+            frame.pc = pc - 2
+            raise CRuntimeErr('Index error - array index out of range (line {})'.format(frame.currline()))
+        except ZeroDivisionError:
+            frame.pc = pc - 2
+            raise CRuntimeErr('Division by zero (line {})'.format(frame.currline()))
+
+    def note_watch(self, frame, slot, val, line):
+        old = printval(frame.watch_values.get(slot))
+        frame.watch_values[slot] = val
+        frame.code.watched[slot].changed(old, printval(val), line)
+
+    def watch(self, name):
+        """
+        Watches the slot of the variable visible for changes, in every call of its function - only checked
+        by debug code. Returns the Watch, None if no such variable is visible.
+        """
+        var = self.lookup(name)
+        if var is None:
+            return None
+        frame, slot, _ = var
+        watch = Watch(name, self.watch_hits)
+        frame.code.watched[slot] = watch
+        for other in self.frames:
+            if other.code is frame.code:
+                other.watch_values[slot] = other.slots[slot]
+        return watch
+
+    def unwatch(self, watch):
+        watch.active = False
+        for code in self.program.codes:
+            code.watched = {slot: other for slot, other in code.watched.items() if other is not watch}
+
+    def lookup(self, name):
+        """
+        Finds the variable visible in the current frame - (frame, slot, TypeVal) or None.
+        """
+        if len(self.frames) == 0:
+            return None
+        frame = self.frames[-1]
+        var = frame.code.visible_var(name, frame.pc)
+        if var is None:
+            return None
+        slot, vtype = var
+        return frame, slot, vtype
+
+
+def printval(val):
+    """
+    Formats values as Value.printval does.
+    """
+    if val is None or val is UNINIT:
+        return 'N/A'
+    elif isinstance(val, list):
+        return format(id(val), '#08x')  # in hexadecimal address format
+    return val
+
+
+class VMSession:
+    """
+    Interactive session running debug bytecode on the virtual machine.
+    """
+    def __init__(self, fundefs, out):
+        self.vm = VirtualMachine(compile_program(fundefs, debug=True), out)
+        self.out = out
+        self.vm.start('main')
+
+    def currline(self):
+        return self.vm.currline
+
+    def is_done(self):
+        return self.vm.finished
+
+    def step(self):
+        self.vm.step()
+        return True
+
+    def run_until(self, lines, stops=None):
+        vm = self.vm
+        watch_hits = vm.watch_hits
+        while not vm.finished:
+            vm.step()
+            if len(watch_hits) > 0 or vm.finished:
+                break  # the conditions are not evaluated once main() has returned
+            if vm.currline in lines and (stops is None or stops(vm.currline)):
+                break
+
+    def depth(self):
+        return len(self.vm.frames)
+
+    def run_out(self, depth, lines, stops=None):
+        vm = self.vm
+        frames = vm.frames
+        watch_hits = vm.watch_hits
+        while not vm.finished:
+            vm.step(return_depth=depth)
+            if len(frames) <= depth or len(watch_hits) > 0 or vm.finished:
+                break
+            if vm.currline in lines and (stops is None or stops(vm.currline)):
+                break
+
+    def returned_value(self):
+        return printval(self.vm.frames[-1].stack[-1]) if len(self.vm.frames) > 0 else printval(self.vm.retval)
+
+    def watch(self, name):
+        return self.vm.watch(name)
+
+    def unwatch(self, watch):
+        self.vm.unwatch(watch)
+
+    def pop_watch_hits(self):
+        hits = list(self.vm.watch_hits)
+        self.vm.watch_hits.clear()
+        return hits
+
+    def valueof(self, name):
+        var = self.vm.lookup(name)
+        if var is None:
+            raise CRuntimeErr('Name {} does not exist!'.format(name))
+        frame, slot, _ = var
+        return frame.slots[slot]
+
+    def reset_log(self):
+        pass
+
+    def getvalue(self, name):
+        var = self.vm.lookup(name)
+        if var is None:
+            return None
+        frame, slot, _ = var
+        return printval(frame.slots[slot])
+
+    def gethistory(self, name):
+        var = self.vm.lookup(name)
+        if var is None:
+            return None
+        frame, slot, _ = var
+        return frame.history.get(slot) or ValueHistory()
+
+    def show_scope(self):
+        for frame in reversed(self.vm.frames):
+            pc = frame.pc
+            names = {}
+            for name, slot, vtype, start_pc, end_pc in frame.code.varinfo:
+                if start_pc <= pc < end_pc:
+                    names[name] = printval(frame.slots[slot])
+            print(names, end=' ')
+            print('function : {}, line : {}'.format(frame.code.name, frame.currline()))
+            print('-----------------\n')
+        print()
+
+    def show_log(self):
+        # the machine does not keep an execution log - show the call stack instead
+        for frame in self.vm.frames:
+            print('{} at line {}'.format(frame.code.name, frame.currline()))
+
+    def set_log(self, level=None, node_types=None):
+        pass
+
+    def exit_status(self):
+        if self.vm.retval is None or self.vm.retval is UNINIT:
+            return 0
+        return int(self.vm.retval)
+
+
+def run_program(fundefs, out):
+    """
+    Compiles and runs the program by calling main(), printing into the OutputSink out.
+    Returns the exit status of the program.
+    """
+    machine = VirtualMachine(compile_program(fundefs), out)
+    machine.start('main')
+    retval = machine.run()
+    if retval is UNINIT:
+        return 0
+    return int(retval)
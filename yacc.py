@@ -1,5 +1,6 @@
+import types
 import ply.yacc as yacc
-from lex import tokens
+from lex import tokens, lexer
 from astree import *
 
 
@@ -235,6 +236,8 @@ iteration_statement
 jump_statement
     : RETURN ';'
     | RETURN expression ';'
+    | BREAK ';'
+    | CONTINUE ';'
 
 translation_unit  /* starting point */
     : external_declaration
@@ -364,8 +367,7 @@ def p_unary_expression(p):
         register_lineinfo(p, 1)
         p[0] = p[1]
     elif len(p) == 3:
-        register_lineinfo(p, 1)
-        register_lineinfo(p, 2)
+        register_lineinfo(p, 2)  # the operator is a token without line information
         p[0] = UnaryExpr(op_name=p[1], operand=p[2], is_postfix=False)
     else:
         raise Exception
@@ -1052,17 +1054,11 @@ def p_iteration_statement(p):
         register_lineinfo(p, 3)
         register_lineinfo(p, 5)
         p[0] = IterationStatement(iter_type='while', exp1=p[3], body=p[5])
-    elif len(p) == 7:  # where one of for-conditions are omitted
-        if isinstance(p[4], Statement):
-            register_lineinfo(p, 3)
-            register_lineinfo(p, 4)
-            register_lineinfo(p, 6)
-            p[0] = IterationStatement(iter_type='for', exp2=p[3], exp3=p[4], body=p[6])
-        else:
-            register_lineinfo(p, 3)
-            register_lineinfo(p, 4)
-            register_lineinfo(p, 6)
-            p[0] = IterationStatement(iter_type='for', exp1=p[3], exp2=p[4], body=p[6])
+    elif len(p) == 7:  # where the update expression is omitted
+        register_lineinfo(p, 3)
+        register_lineinfo(p, 4)
+        register_lineinfo(p, 6)
+        p[0] = IterationStatement(iter_type='for', exp1=p[3], exp2=p[4], body=p[6])
     elif len(p) == 8:
         register_lineinfo(p, 3)
         register_lineinfo(p, 4)
@@ -1077,9 +1073,11 @@ def p_jump_statement(p):
     """
     jump_statement : RETURN ';'
         | RETURN expression ';'
+        | BREAK ';'
+        | CONTINUE ';'
     """
     if len(p) == 3:
-        p[0] = JumpStatement()
+        p[0] = JumpStatement(jump_type=p[1])
     elif len(p) == 4:
         register_lineinfo(p, 2)
         p[0] = JumpStatement(what=p[2])
@@ -1131,14 +1129,62 @@ def p_function_definition(p):
         parser.main_func = p[0]
 
 
+def compute_exec_order(ast_root):
+    """
+    Post-parse pass that sorts the children of every node once,
+    so that the nodes do not need to sort them each time they are executed.
+    """
+    nodes = [ast_root]
+    while len(nodes) > 0:
+        node = nodes.pop()
+        children = node.children()
+        try:
+            node.exec_order = node.sorted_children()
+        except AttributeError:
+            pass  # nodes without line information are left to be sorted on execution
+        nodes.extend(children)
+
+
 # error rule
 def p_error(t):
     print('Syntax Error at token {}!'.format(t))
     parser.errorlines.append(t.lineno)
 
 
+def reset_parser():
+    """
+    Clears the states left by the previous parse, so that the parser can be reused.
+    """
+    lexer.lineno = 1
+    parser.errorlines = []
+    parser.main_func = None  # starting main function
+    parser.functions = []
+
+
+def expression_error(t):
+    # error rule of the expression parser - t is None at the end of the input
+    expression_parser.errorlines.append(t.lineno if t is not None else None)
+
+
+def parse_expression(text):
+    """
+    Parses text as a single expression of mini-C, such as the condition of a breakpoint.
+    Returns the Expression node, or None on a syntax error.
+    """
+    global expression_parser
+    if expression_parser is None:
+        # same grammar, starting from expression, with its own error rule - built on first use, without writing the tables
+        rules = types.SimpleNamespace(**dict(globals(), p_error=expression_error))
+        expression_parser = yacc.yacc(module=rules, start='expression', debug=False, write_tables=False,
+                                      errorlog=yacc.NullLogger())
+    expression_parser.errorlines = []
+    expr = expression_parser.parse(text, lexer=lexer.clone(), tracking=True)
+    if len(expression_parser.errorlines) > 0:
+        return None
+    return expr
+
+
 # create a parser
 parser = yacc.yacc(debug=True)
-parser.errorlines = []
-parser.main_func = None  # starting main function
-parser.functions = []
+expression_parser = None
+reset_parser()